@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+客户端共享的HTTP会话。
+所有页面通过同一个 requests.Session 访问服务器，复用连接，并统一携带会话令牌。
+requests 导入较慢，推迟到第一次发送请求时再导入，不影响启动时间。
+
+请求和响应默认使用JSON；设置环境变量 BEESYNC_WIRE_FORMAT=msgpack（或cbor）且安装了对应的库时，
+请求体和响应都改用二进制编码，响应统一通过 parse() 解码。
+
+启用链路追踪（BEESYNC_TRACE_FILE）时，每个请求记录一个阶段并通过 traceparent 请求头把追踪上下文传给服务器。
+"""
+
+import os
+from urllib.parse import urlsplit
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+import tracing
+import wire_format
+
+NDJSON_CONTENT_TYPE = wire_format.NDJSON
+
+# 首选的编码（JSON/MessagePack/CBOR），对应的库未安装时退回JSON
+WIRE_FORMAT = {
+    'msgpack': wire_format.MSGPACK,
+    'cbor': wire_format.CBOR,
+}.get(os.environ.get('BEESYNC_WIRE_FORMAT', 'json').lower(), wire_format.JSON)
+if not wire_format.is_supported(WIRE_FORMAT):
+    WIRE_FORMAT = wire_format.JSON
+# 流式列表接口对应的序列类型
+_SEQUENCE_FORMAT = {wire_format.MSGPACK: wire_format.MSGPACK_SEQ,
+                    wire_format.CBOR: wire_format.CBOR_SEQ}.get(WIRE_FORMAT, NDJSON_CONTENT_TYPE)
+
+_session = None
+
+
+def get_session():
+    """获取共享会话（首次调用时创建）"""
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
+
+def __getattr__(name):
+    """
+    按需导出 requests 的异常类型（如 api_client.ConnectionError），
+    页面在 except 子句中引用时才会触发导入。
+    """
+    if name in ('RequestException', 'ConnectionError', 'Timeout'):
+        import requests
+        return getattr(requests.exceptions, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def set_token(token):
+    """设置登录后获得的会话令牌，之后的请求都会在 Authorization 头中携带"""
+    session = get_session()
+    if token:
+        session.headers['Authorization'] = f"Bearer {token}"
+    else:
+        session.headers.pop('Authorization', None)
+
+
+def request(method, url, **kwargs):
+    """
+    通过共享会话发送请求。
+    使用二进制编码时，json 参数按该编码序列化为请求体，并在 Accept 中优先声明该编码。
+    """
+    if WIRE_FORMAT != wire_format.JSON:
+        headers = {'Accept': f"{WIRE_FORMAT}, {wire_format.JSON};q=0.5", **kwargs.pop('headers', {})}
+        if kwargs.get('json') is not None:
+            kwargs['data'] = wire_format.encode(kwargs.pop('json'), WIRE_FORMAT)
+            headers['Content-Type'] = WIRE_FORMAT
+        kwargs['headers'] = headers
+    return _send(method, url, **kwargs)
+
+
+def _send(method, url, **kwargs):
+    """
+    发送请求并记录追踪阶段（到收到响应头为止，包含连接、服务器处理和首字节等待），
+    追踪上下文通过 traceparent 请求头传给服务器
+    """
+    with tracing.span('http_request', method=method, path=urlsplit(url).path) as span:
+        if span.context is not None:
+            kwargs['headers'] = {**(kwargs.get('headers') or {}), tracing.HEADER: span.traceparent()}
+        response = get_session().request(method, url, **kwargs)
+        span.set(status=response.status_code, elapsed_ms=round(response.elapsed.total_seconds() * 1000, 3))
+        return response
+
+
+def get(url, **kwargs):
+    """通过共享会话发送GET请求"""
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    """通过共享会话发送POST请求"""
+    return request('POST', url, **kwargs)
+
+
+def parse(response):
+    """按响应的 Content-Type 解码响应体（JSON/MessagePack/CBOR），格式错误时抛出 ValueError"""
+    with tracing.span('client_parse', bytes=len(response.content)):
+        return wire_format.decode(response.content, response.headers.get('Content-Type'))
+
+
+def get_stream(url, **kwargs):
+    """
+    以流式方式请求列表接口（序列形式：NDJSON，或二进制编码对应的序列类型），调用方负责关闭响应。
+    """
+    accept = _SEQUENCE_FORMAT
+    if _SEQUENCE_FORMAT != NDJSON_CONTENT_TYPE:
+        accept += f", {WIRE_FORMAT};q=0.9, {NDJSON_CONTENT_TYPE};q=0.5"
+    headers = {'Accept': accept, **kwargs.pop('headers', {})}
+    return _send('GET', url, headers=headers, stream=True, **kwargs)
+
+
+def iter_records(response):
+    """
+    逐个解析流式响应，数据到达即产出。
+    第一个对象为头部信息（success、count等），之后每个对象为一条记录；
+    出错时服务器返回的错误信息同样作为第一个对象产出。
+    """
+    yield from wire_format.iter_sequence(response.iter_content(chunk_size=None),
+                                         response.headers.get('Content-Type', NDJSON_CONTENT_TYPE))
+
+
+class RequestThread(QThread):
+    """
+    在后台线程中发送一次请求，完成后通过信号把结果送回主线程。
+    超时或连接失败时最多重试 retries 次（仅用于幂等请求）。
+    """
+    response_ready = pyqtSignal(int, dict)  # 状态码, 响应JSON（429时附带retry_after）
+    error = pyqtSignal(str)
+
+    # 保持运行中线程的引用，避免线程对象在结束前被回收
+    _active = set()
+
+    def __init__(self, method, url, json=None, timeout=None, retries=0):
+        super().__init__()
+        self.method = method
+        self.url = url
+        self.json = json
+        self.timeout = timeout
+        self.retries = retries
+        # 创建线程时所在的追踪阶段，后台请求记录为它的子阶段
+        self.trace_context = tracing.current_context()
+
+    def start(self):
+        RequestThread._active.add(self)
+        self.finished.connect(lambda: RequestThread._active.discard(self))
+        super().start()
+
+    def run(self):
+        with tracing.span('request_thread', parent=self.trace_context, method=self.method):
+            self._request()
+
+    def _request(self):
+        from requests.exceptions import ConnectionError, Timeout
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    response = request(self.method, self.url, json=self.json, timeout=self.timeout)
+                    break
+                except (Timeout, ConnectionError):
+                    if attempt == self.retries:
+                        raise
+            try:
+                result = parse(response)
+            except ValueError:
+                result = {}
+            if not isinstance(result, dict):
+                result = {}
+            if 'Retry-After' in response.headers:
+                result['retry_after'] = response.headers['Retry-After']
+            self.response_ready.emit(response.status_code, result)
+        except Exception as e:
+            self.error.emit(str(e))
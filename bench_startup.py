@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+启动时间基准测试：测量从进程启动到 MainWindow 第一次绘制的时间。
+每轮启动一个新的子进程（冷启动），子进程在主窗口第一次绘制后输出各阶段耗时并退出。
+
+用法: python bench_startup.py [--runs 5] [--budget-ms 500] [--offscreen]
+超过预算（中位数，默认500ms，--budget-ms 0 不检查）时以非零状态退出，可用于检查启动时间是否回退。
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# 子进程通过该环境变量得到父进程启动它之前的时间戳
+T0_ENV = "BEESYNC_BENCH_T0"
+# 默认的首次绘制时间预算（中位数，毫秒）
+DEFAULT_BUDGET_MS = 500
+
+
+def _child() -> None:
+    """子进程：启动应用并在第一次绘制时报告耗时"""
+    t0 = float(os.environ[T0_ENV])
+    t_main = time.time()
+
+    from PyQt5 import QtCore, QtWidgets
+    t_qt = time.time()
+
+    app = QtWidgets.QApplication(sys.argv[:1])
+    import form_ui
+    t_import = time.time()
+
+    window = form_ui.MainWindow()
+    t_window = time.time()
+
+    class FirstPaintFilter(QtCore.QObject):
+        """捕获主窗口的第一次绘制事件"""
+
+        def eventFilter(self, obj, event):
+            if event.type() == QtCore.QEvent.Paint and not hasattr(self, 'painted_at'):
+                self.painted_at = time.time()
+                # 等本次绘制完成后再退出
+                QtCore.QTimer.singleShot(0, app.quit)
+            return False
+
+    paint_filter = FirstPaintFilter()
+    window.installEventFilter(paint_filter)
+    window.show()
+    app.exec_()
+
+    t_paint = getattr(paint_filter, 'painted_at', time.time())
+    print(json.dumps({
+        "interpreter_ms": round((t_main - t0) * 1000, 1),
+        "import_qt_ms": round((t_qt - t_main) * 1000, 1),
+        "import_app_ms": round((t_import - t_qt) * 1000, 1),
+        "construct_ms": round((t_window - t_import) * 1000, 1),
+        "first_paint_ms": round((t_paint - t0) * 1000, 1),
+        "modules": sorted(m for m in ('requests', 'page1_clipboard', 'page2_device', 'page3_login')
+                          if m in sys.modules)
+    }))
+
+
+def run(runs: int, budget_ms: float = DEFAULT_BUDGET_MS, offscreen: bool = False) -> int:
+    """运行多轮冷启动并打印统计结果，返回进程退出码"""
+    env = dict(os.environ)
+    if offscreen:
+        env["QT_QPA_PLATFORM"] = "offscreen"
+
+    results = []
+    for i in range(runs):
+        env[T0_ENV] = repr(time.time())
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"],
+                                env=env, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        lines = [line for line in output.stdout.splitlines() if line.startswith('{')]
+        if output.returncode != 0 or not lines:
+            print(f"第 {i + 1} 轮启动失败:\n{output.stderr}")
+            return 1
+        result = json.loads(lines[-1])
+        results.append(result)
+        print(f"第 {i + 1} 轮: 首次绘制 {result['first_paint_ms']}ms "
+              f"(解释器 {result['interpreter_ms']}ms, Qt导入 {result['import_qt_ms']}ms, "
+              f"应用导入 {result['import_app_ms']}ms, 窗口创建 {result['construct_ms']}ms)")
+
+    paint_times = [r['first_paint_ms'] for r in results]
+    median = round(statistics.median(paint_times), 1)
+    print(f"\n首次绘制: 最小 {min(paint_times)}ms | 中位数 {median}ms | 最大 {max(paint_times)}ms")
+    print(f"启动时已导入的模块: {', '.join(results[-1]['modules']) or '无'}")
+
+    if budget_ms and median > budget_ms:
+        print(f"超出启动时间预算: {median}ms > {budget_ms:g}ms")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    if "--child" in sys.argv:
+        _child()
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="BeeSyncClip 启动时间基准测试")
+    parser.add_argument('--runs', type=int, default=5, help="冷启动轮数")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help="首次绘制时间预算（中位数，毫秒），0 表示不检查")
+    parser.add_argument('--offscreen', action='store_true', help="使用 offscreen 平台（无显示环境）")
+    args = parser.parse_args()
+    sys.exit(run(args.runs, args.budget_ms, args.offscreen))
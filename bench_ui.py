@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+界面渲染基准测试：测量剪贴板页面和设备页面随记录数量增长的性能。
+每个（页面, 记录数）组合在一个新的子进程中以 offscreen 平台运行，互不影响，峰值内存也按进程单独统计。
+子进程用合成数据调用 add_clipboard_item / add_device_item 填充列表，测量:
+- construct_ms: 创建页面的时间
+- populate_ms: 逐条添加全部记录的时间
+- first_paint_ms: 显示页面到列表第一次绘制完成的时间
+- scroll: 从顶部按页滚动到底部、每一帧同步重绘的耗时分位数
+- peak_rss_mb: 子进程的峰值内存
+
+用法: python bench_ui.py [--sizes 100,1000,10000,100000] [--pages clipboard,device]
+                         [--scroll-frames 200] [--output bench_ui.json]
+                         [--baseline 上次的结果.json] [--max-regression 20]
+结果以JSON写入 --output；指定 --baseline 时输出与上次结果的对比，
+--max-regression 指定允许的增幅（百分比），任一指标超出时以非零状态退出。
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 对比基线时检查的指标
+COMPARED_METRICS = ('construct_ms', 'populate_ms', 'first_paint_ms', 'scroll_p95_ms', 'peak_rss_mb')
+
+
+def _peak_rss_mb() -> float:
+    """进程的峰值内存（MB），不支持的平台返回0"""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def clipboard_records(count: int):
+    """合成的剪贴板记录：内容长度和来源设备有变化，时间倒序"""
+    labels = ["我的手机", "我的平板", "我的电脑", "办公室电脑"]
+    now = time.time()
+    for i in range(count):
+        yield {
+            "clip_id": f"bench-{i:08d}",
+            "content": f"记录 {i} " + "剪贴板内容示例 " * (1 + i % 40),
+            "content_type": "text/plain",
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now - i * 60)),
+            "device_id": f"device-{i % len(labels):03d}",
+            "device_label": labels[i % len(labels)]
+        }
+
+
+def device_records(count: int):
+    """合成的设备记录"""
+    systems = ["Windows", "macOS", "Linux", "Android", "iOS"]
+    for i in range(count):
+        yield {
+            "device_id": f"bench-device-{i:08d}",
+            "label": f"设备 {i}",
+            "os": systems[i % len(systems)],
+            "ip_address": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+            "first_login": "2024-01-01 10:00:00",
+            "last_login": "2024-06-01 10:00:00"
+        }
+
+
+def _child(page: str, count: int, scroll_frames: int) -> None:
+    """子进程：创建页面、填充记录并测量绘制和滚动，输出一行JSON"""
+    from PyQt5 import QtCore, QtWidgets
+
+    app = QtWidgets.QApplication(sys.argv[:1])
+    t0 = time.perf_counter()
+    if page == 'clipboard':
+        from page1_clipboard import ClipboardDialog
+        dialog = ClipboardDialog()
+        ui = dialog.ui
+        records = list(clipboard_records(count))
+        t1 = time.perf_counter()
+        for record in records:
+            ui.add_clipboard_item(record)
+    else:
+        from page2_device import DeviceDialog
+        dialog = DeviceDialog()
+        ui = dialog.ui
+        records = list(device_records(count))
+        t1 = time.perf_counter()
+        for i, device in enumerate(records):
+            ui.add_device_item(device, is_current_device=i == 0)
+    t2 = time.perf_counter()
+    list_widget = ui.listWidget
+
+    class FirstPaintFilter(QtCore.QObject):
+        """捕获列表的第一次绘制事件"""
+
+        def eventFilter(self, obj, event):
+            if event.type() == QtCore.QEvent.Paint and not hasattr(self, 'painted_at'):
+                self.painted_at = None
+                # 等本次绘制完成后再记录时间
+                QtCore.QTimer.singleShot(0, self.finish)
+            return False
+
+        def finish(self):
+            self.painted_at = time.perf_counter()
+            app.quit()
+
+    paint_filter = FirstPaintFilter()
+    list_widget.viewport().installEventFilter(paint_filter)
+    dialog.resize(800, 600)
+    t3 = time.perf_counter()
+    dialog.show()
+    # 防止没有绘制事件时一直等待
+    QtCore.QTimer.singleShot(60000, app.quit)
+    app.exec_()
+    t4 = getattr(paint_filter, 'painted_at', None) or time.perf_counter()
+    list_widget.viewport().removeEventFilter(paint_filter)
+
+    # 按页向下滚动，每一帧同步重绘（含滚动后新出现的行的绘制）
+    scrollbar = list_widget.verticalScrollBar()
+    step = max(1, scrollbar.pageStep())
+    frames = []
+    position = scrollbar.minimum()
+    for _ in range(scroll_frames):
+        if position >= scrollbar.maximum():
+            break
+        position = min(position + step, scrollbar.maximum())
+        start = time.perf_counter()
+        scrollbar.setValue(position)
+        list_widget.viewport().repaint()
+        QtWidgets.QApplication.processEvents()
+        frames.append((time.perf_counter() - start) * 1000)
+
+    print(json.dumps({
+        "page": page,
+        "records": count,
+        "construct_ms": round((t1 - t0) * 1000, 1),
+        "populate_ms": round((t2 - t1) * 1000, 1),
+        "populate_per_record_us": round((t2 - t1) * 1e6 / count, 1) if count else 0.0,
+        "first_paint_ms": round((t4 - t3) * 1000, 1),
+        "scroll_frames": len(frames),
+        "scroll_p50_ms": round(_percentile(frames, 0.50), 2),
+        "scroll_p95_ms": round(_percentile(frames, 0.95), 2),
+        "scroll_max_ms": round(max(frames), 2) if frames else 0.0,
+        "peak_rss_mb": round(_peak_rss_mb(), 1)
+    }))
+
+
+def compare(results, baseline_path: str, max_regression: float = None) -> int:
+    """与上次的结果对比，输出各指标的变化，超出允许增幅时返回1"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r['page'], r['records']): r for r in json.load(f)['results']}
+    regressed = []
+    print(f"\n与 {baseline_path} 对比:")
+    for result in results:
+        previous = baseline.get((result['page'], result['records']))
+        if previous is None:
+            continue
+        changes = []
+        for metric in COMPARED_METRICS:
+            if not previous.get(metric):
+                continue
+            change = (result[metric] - previous[metric]) / previous[metric] * 100
+            changes.append(f"{metric} {change:+.0f}%")
+            if max_regression is not None and change > max_regression:
+                regressed.append(f"{result['page']}/{result['records']} {metric}")
+        print(f"  {result['page']} {result['records']}条: {', '.join(changes)}")
+    if regressed:
+        print(f"增幅超过 {max_regression}%: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+def run(sizes, pages, scroll_frames: int, output: str = None, baseline: str = None,
+        max_regression: float = None, timeout: float = None) -> int:
+    """对每个（页面, 记录数）组合运行一个子进程并汇总结果，返回进程退出码"""
+    env = dict(os.environ)
+    env["QT_QPA_PLATFORM"] = "offscreen"
+
+    results = []
+    failed = False
+    for page in pages:
+        for count in sizes:
+            try:
+                output_run = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", page, str(count), str(scroll_frames)],
+                    env=env, capture_output=True, text=True, timeout=timeout,
+                    cwd=os.path.dirname(os.path.abspath(__file__)))
+            except subprocess.TimeoutExpired:
+                print(f"{page} {count}条: 超过 {timeout}s 未完成，跳过")
+                failed = True
+                continue
+            lines = [line for line in output_run.stdout.splitlines() if line.startswith('{')]
+            if output_run.returncode != 0 or not lines:
+                # 记录数很多时可能内存不足，继续测试其余组合
+                print(f"{page} {count}条: 运行失败（退出码 {output_run.returncode}）\n{output_run.stderr[-2000:]}")
+                failed = True
+                continue
+            result = json.loads(lines[-1])
+            results.append(result)
+            print(f"{page} {count}条: 创建 {result['construct_ms']}ms | 填充 {result['populate_ms']}ms "
+                  f"({result['populate_per_record_us']}us/条) | 首次绘制 {result['first_paint_ms']}ms | "
+                  f"滚动 P50 {result['scroll_p50_ms']}ms P95 {result['scroll_p95_ms']}ms "
+                  f"最大 {result['scroll_max_ms']}ms ({result['scroll_frames']}帧) | 峰值内存 {result['peak_rss_mb']}MB")
+
+    if output:
+        from PyQt5 import QtCore
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({
+                "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "python": platform.python_version(),
+                "qt": QtCore.QT_VERSION_STR,
+                "platform": platform.platform(),
+                "results": results
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {output}")
+
+    if baseline and compare(results, baseline, max_regression):
+        return 1
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    if "--child" in sys.argv:
+        index = sys.argv.index("--child")
+        page, count, frames = sys.argv[index + 1:index + 4]
+        _child(page, int(count), int(frames))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="BeeSyncClip 界面渲染基准测试")
+    parser.add_argument('--sizes', default="100,1000,10000,100000", help="记录数量，逗号分隔")
+    parser.add_argument('--pages', default="clipboard,device", help="测试的页面（clipboard/device），逗号分隔")
+    parser.add_argument('--scroll-frames', type=int, default=200, help="最多测量的滚动帧数")
+    parser.add_argument('--timeout', type=float, default=None, help="单个组合的超时时间（秒）")
+    parser.add_argument('--output', default=None, help="结果JSON文件")
+    parser.add_argument('--baseline', default=None, help="作为对比基线的上次结果JSON文件")
+    parser.add_argument('--max-regression', type=float, default=None, help="允许的指标增幅（百分比）")
+    args = parser.parse_args()
+    sys.exit(run([int(size) for size in args.sizes.split(',')],
+                 [page.strip() for page in args.pages.split(',')],
+                 args.scroll_frames, args.output, args.baseline, args.max_regression, args.timeout))
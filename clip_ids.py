@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+剪贴板记录ID。
+使用 UUIDv7（RFC 9562）：高48位为毫秒时间戳，其余为随机数，
+客户端即可生成全局唯一、按时间可排序的ID，上传时作为幂等键使用。
+"""
+
+import os
+import threading
+import time
+import uuid
+
+_lock = threading.Lock()
+_last_ms = 0
+_last_rand_a = 0
+
+
+def uuid7() -> str:
+    """生成UUIDv7字符串；同一毫秒内生成的ID按顺序递增"""
+    global _last_ms, _last_rand_a
+    with _lock:
+        timestamp_ms = int(time.time() * 1000)
+        if timestamp_ms <= _last_ms:
+            # 同一毫秒（或时钟回拨）时沿用上次的时间戳，12位计数递增保证单调
+            timestamp_ms = _last_ms
+            rand_a = (_last_rand_a + 1) & 0xFFF
+            if rand_a == 0:
+                timestamp_ms += 1
+        else:
+            rand_a = int.from_bytes(os.urandom(2), 'big') & 0x7FF  # 最高位留空，给计数留出余量
+        _last_ms = timestamp_ms
+        _last_rand_a = rand_a
+
+    rand_b = int.from_bytes(os.urandom(8), 'big') & ((1 << 62) - 1)
+    value = (timestamp_ms & ((1 << 48) - 1)) << 80
+    value |= 0x7 << 76  # 版本号
+    value |= rand_a << 64
+    value |= 0b10 << 62  # RFC 4122 变体
+    value |= rand_b
+    return str(uuid.UUID(int=value))
+
+
+def is_valid_clip_id(value) -> bool:
+    """检查是否为合法的UUID字符串（接受任意版本，兼容旧数据中的UUIDv4）"""
+    if not isinstance(value, str):
+        return False
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
+
+
+def canonical_clip_id(value):
+    """
+    把UUID的各种写法（大写、花括号、urn:uuid: 前缀、无连字符）统一为小写带连字符的标准形式，
+    与服务器保存的ID一致；不是UUID时原样返回
+    """
+    if not is_valid_clip_id(value):
+        return value
+    return str(uuid.UUID(value))
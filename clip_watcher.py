@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+剪贴板变化监听。
+Windows 和 X11 上 QClipboard.dataChanged 信号可靠，只监听信号，不启动定时器；
+macOS 和 Wayland 上其他程序修改剪贴板时信号不一定触发，才辅以自适应轮询：
+检测到变化后以较短间隔轮询，空闲时逐步拉长间隔，减少空闲时的唤醒次数。
+
+轮询时先比较廉价的变化标记（macOS 的 changeCount、Windows 的剪贴板序列号），
+标记不变就不读取剪贴板内容；没有序列号可用时退回到比较内容哈希。
+"""
+
+import hashlib
+import os
+import sys
+
+from PyQt5 import QtCore, QtGui
+
+# 强制轮询策略: "auto"（按平台判断）、"always"、"never"
+POLL_MODE = os.environ.get("BEESYNC_CLIPBOARD_POLL", "auto")
+
+
+def signal_is_reliable():
+    """当前平台上 dataChanged 信号是否能反映其他程序对剪贴板的修改"""
+    if POLL_MODE == "always":
+        return False
+    if POLL_MODE == "never":
+        return True
+    platform_name = QtGui.QGuiApplication.platformName()
+    if sys.platform == "darwin" or platform_name == "cocoa":
+        return False
+    if platform_name.startswith("wayland"):
+        # 窗口没有焦点时收不到其他程序的剪贴板变化
+        return False
+    return True
+
+
+def _sequence_reader():
+    """返回读取系统剪贴板序列号的函数，当前平台不支持时返回None"""
+    if sys.platform == "darwin":
+        try:
+            from AppKit import NSPasteboard
+        except ImportError:
+            return None
+        pasteboard = NSPasteboard.generalPasteboard()
+        return pasteboard.changeCount
+    if sys.platform == "win32":
+        import ctypes
+        return ctypes.windll.user32.GetClipboardSequenceNumber
+    return None
+
+
+class ClipWatcher(QtCore.QObject):
+    """
+    剪贴板变化监听器，剪贴板可能发生变化时发出 changed 信号。
+
+    min_interval_ms / max_interval_ms: 轮询间隔的下限和上限
+    backoff: 每次轮询没有发现变化时间隔乘以该系数
+    """
+    changed = QtCore.pyqtSignal()
+
+    def __init__(self, clipboard, min_interval_ms=500, max_interval_ms=30000, backoff=1.5, parent=None):
+        super().__init__(parent)
+        self.clipboard = clipboard
+        self.min_interval_ms = min_interval_ms
+        self.max_interval_ms = max_interval_ms
+        self.backoff = backoff
+        self.polling = not signal_is_reliable()
+        self.interval_ms = min_interval_ms
+        self.polls = 0  # 轮询次数（用于观察空闲时的唤醒次数）
+
+        self.clipboard.dataChanged.connect(self._on_data_changed)
+
+        self._timer = None
+        self._read_sequence = None
+        self._last_marker = None
+        if self.polling:
+            self._read_sequence = _sequence_reader()
+            self._timer = QtCore.QTimer(self)
+            self._timer.setSingleShot(True)
+            self._timer.timeout.connect(self._poll)
+
+    def start(self):
+        """开始监听（需要轮询时启动定时器）"""
+        if self._timer is not None and not self._timer.isActive():
+            self._last_marker = self._marker()
+            self._schedule(self.min_interval_ms)
+
+    def stop(self):
+        """停止轮询"""
+        if self._timer is not None:
+            self._timer.stop()
+
+    def _marker(self):
+        """当前剪贴板的变化标记：优先使用系统序列号，否则使用内容哈希"""
+        if self._read_sequence is not None:
+            return self._read_sequence()
+        return hashlib.blake2b(self.clipboard.text().encode('utf-8'), digest_size=16).digest()
+
+    def _schedule(self, interval_ms):
+        self.interval_ms = interval_ms
+        # 间隔较长时允许系统合并定时器唤醒
+        self._timer.setTimerType(QtCore.Qt.VeryCoarseTimer if interval_ms >= 5000 else QtCore.Qt.CoarseTimer)
+        self._timer.start(interval_ms)
+
+    def _on_data_changed(self):
+        """收到 dataChanged 信号：视为一次活动，轮询间隔恢复到下限"""
+        if self._timer is not None and self._timer.isActive():
+            self._last_marker = self._marker()
+            self._schedule(self.min_interval_ms)
+        self.changed.emit()
+
+    def _poll(self):
+        self.polls += 1
+        marker = self._marker()
+        if marker != self._last_marker:
+            self._last_marker = marker
+            self._schedule(self.min_interval_ms)
+            self.changed.emit()
+        else:
+            self._schedule(min(self.max_interval_ms, int(self.interval_ms * self.backoff)))
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+设备标识缓存。
+设备信息（设备ID、主机名、系统、MAC、IP）在后台线程中计算一次并保存到磁盘，
+之后启动时只需核对主机名和系统版本即可直接使用缓存，不再探测MAC等信息；
+只有缓存缺失、校验不通过或超过 REFRESH_INTERVAL 时才在后台重新计算并更新缓存。
+使用缓存时只重新获取IP地址（廉价，且可能随网络变化）。登录和各页面都读取这里的结果，不再重复计算。
+
+IP 地址通过 UDP 套接字的本地地址获取（不发送数据、不做DNS解析），
+不再调用 socket.gethostbyname(socket.gethostname())，避免在DNS配置异常的机器上阻塞数秒。
+"""
+
+import hashlib
+import json
+import os
+import platform
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+CACHE_VERSION = 1
+# 缓存文件路径，可通过环境变量覆盖
+CACHE_PATH = os.environ.get(
+    "BEESYNC_IDENTITY_CACHE",
+    os.path.join(os.path.expanduser("~"), ".beesyncclip", "device_identity.json")
+)
+# 没有可用缓存时，登录等待后台计算完成的最长时间（秒）
+COMPUTE_TIMEOUT = 5.0
+# 缓存有效时，超过这个时间（秒）才在后台重新计算一次
+REFRESH_INTERVAL = 7 * 24 * 3600
+
+
+def _check_key() -> Dict[str, str]:
+    """缓存校验信息：只包含可以廉价获取的字段"""
+    return {
+        "hostname": socket.gethostname(),
+        "os": platform.system(),
+        "os_version": platform.release()
+    }
+
+
+def _local_ip() -> str:
+    """获取本机对外通信使用的IP（UDP connect 只选择路由，不发送数据）"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect(("10.255.255.255", 1))
+        return sock.getsockname()[0]
+    except OSError:
+        return "127.0.0.1"
+    finally:
+        sock.close()
+
+
+def compute_device_info() -> Dict[str, Any]:
+    """计算设备信息并生成唯一标识（设备ID的计算方式与之前保持一致）"""
+    check = _check_key()
+    hostname = check["hostname"]
+    os_info = check["os"]
+    os_version = check["os_version"]
+    mac = ":".join(["{:02x}".format((uuid.getnode() >> elements) & 0xff)
+                    for elements in range(0, 2 * 6, 2)][::-1])
+
+    # 生成设备唯一ID
+    unique_str = f"{hostname}-{mac}-{os_info}-{os_version}"
+    device_id = hashlib.md5(unique_str.encode()).hexdigest()
+
+    return {
+        "device_id": device_id,
+        "device_name": hostname,
+        "os": os_info,
+        "os_version": os_version,
+        "ip_address": _local_ip(),
+        "mac_address": mac,
+        "label": f"{hostname} ({os_info})"  # 确保包含label字段
+    }
+
+
+def load_cache(path: str = CACHE_PATH) -> Optional[Tuple[Dict[str, Any], float]]:
+    """读取缓存，返回 (设备信息, 保存时间)；校验不通过（版本不同、主机名或系统变化）时返回None"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+        return None
+    if data.get("check") != _check_key() or not isinstance(data.get("device_info"), dict):
+        return None
+    saved_at = data.get("saved_at")
+    if not isinstance(saved_at, (int, float)):
+        saved_at = 0.0  # 没有保存时间的旧缓存视为已过期
+    return data["device_info"], float(saved_at)
+
+
+def save_cache(device_info: Dict[str, Any], path: str = CACHE_PATH) -> None:
+    """保存缓存（先写临时文件再替换，避免写到一半的文件被读取）"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "check": _check_key(), "device_info": device_info,
+                       "saved_at": time.time()}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"保存设备信息缓存失败: {e}")
+
+
+class DeviceIdentity:
+    """
+    设备信息的后台计算与缓存。
+    prefetch() 读取缓存，缓存缺失或过期时启动后台计算；
+    get() 返回已完成的计算结果或有效的磁盘缓存，两者都没有时等待后台计算。
+    """
+
+    refresh_interval = REFRESH_INTERVAL
+
+    def __init__(self, cache_path: str = CACHE_PATH):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._prefetched = False
+        self._cached: Optional[Dict[str, Any]] = None
+        self._computed: Optional[Dict[str, Any]] = None
+
+    def prefetch(self) -> None:
+        """读取缓存，缓存缺失或过期时在后台重新计算（重复调用只会处理一次）"""
+        with self._lock:
+            if self._prefetched:
+                return
+            self._prefetched = True
+            entry = load_cache(self.cache_path)
+            if entry is not None:
+                cached, saved_at = entry
+                self._cached = dict(cached, ip_address=_local_ip())
+                if 0 <= time.time() - saved_at < self.refresh_interval:
+                    self._ready.set()
+                    return
+            threading.Thread(target=self._compute, name="device-identity", daemon=True).start()
+
+    def _compute(self) -> None:
+        try:
+            device_info = compute_device_info()
+            self._computed = device_info
+            # 只在缓存缺失或过期时才会计算，结果不变也要保存以更新保存时间
+            save_cache(device_info, self.cache_path)
+        finally:
+            self._ready.set()
+
+    def get(self, timeout: float = COMPUTE_TIMEOUT) -> Dict[str, Any]:
+        """获取设备信息；已计算或缓存有效时立即返回，否则等待后台计算"""
+        self.prefetch()
+        if self._computed is not None:
+            return dict(self._computed)
+        if self._cached is not None:
+            return dict(self._cached)
+        if not self._ready.wait(timeout) or self._computed is None:
+            # 后台计算超时或失败时在当前线程计算（不会保存缓存）
+            return compute_device_info()
+        return dict(self._computed)
+
+
+_identity = DeviceIdentity()
+
+
+def prefetch() -> None:
+    """在后台准备设备信息（应用启动或打开登录页时调用）"""
+    _identity.prefetch()
+
+
+def get_device_info() -> Dict[str, Any]:
+    """获取当前设备信息"""
+    return _identity.get()
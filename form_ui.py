@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 
 from PyQt5 import QtCore, QtGui, QtWidgets
-from page1_clipboard import Ui_Dialog, ClipboardDialog
-from page2_device import DeviceDialog
-from page3_login import LoginDialog  # 修改为导入LoginDialog类
+import importlib
+import device_identity
+import ui_watchdog
 
 
 class Ui_app_ui(object):
@@ -99,32 +99,58 @@ class Ui_app_ui(object):
         self.btn_device.clicked.connect(self.show_page_2)
         self.btn_login.clicked.connect(self.show_page_3)
 
+    # 子页面: (属性名, 模块名, 类名)，下标+1 即堆叠窗口中的页面序号
+    PAGES = (
+        ('clipboard_dialog', 'page1_clipboard', 'ClipboardDialog'),  # 页面1 (剪切板页面)
+        ('device_dialog', 'page2_device', 'DeviceDialog'),  # 页面2 (设备页面)
+        ('login_dialog', 'page3_login', 'LoginDialog'),  # 页面3 (登录页面)
+    )
+
     def init_pages(self):
-        """初始化所有子页面"""
-        # 页面1 (剪切板页面)
-        self.page_1 = QtWidgets.QWidget()  # 改为普通QWidget容器
-        self.page_1.setObjectName("page_1")
-        self.clipboard_dialog = ClipboardDialog()  # 创建ClipboardDialog实例
-        # 将ClipboardDialog添加到页面1的布局中
-        layout = QtWidgets.QVBoxLayout(self.page_1)
-        layout.addWidget(self.clipboard_dialog)
-        self.stackedWidget.addWidget(self.page_1)
-
-        # 页面2 (设备页面)
-        self.page_2 = QtWidgets.QWidget()
-        self.page_2.setObjectName("page_2")
-        self.device_dialog = DeviceDialog()
-        layout = QtWidgets.QVBoxLayout(self.page_2)
-        layout.addWidget(self.device_dialog)
-        self.stackedWidget.addWidget(self.page_2)
-
-        # 页面3 (登录页面)
-        self.page_3 = QtWidgets.QWidget()
-        self.page_3.setObjectName("page_3")
-        self.login_dialog = LoginDialog()
-        layout = QtWidgets.QVBoxLayout(self.page_3)
-        layout.addWidget(self.login_dialog)
-        self.stackedWidget.addWidget(self.page_3)
+        """
+        初始化所有子页面的容器。
+        页面内容在第一次显示（或第一次被访问）时才创建，对应模块也在那时才导入，
+        启动时只需绘制导航栏和空白页。
+        """
+        # 页面创建后的回调，参数为 (属性名, 页面对象)
+        self.page_created = None
+        self._pages = {}
+        for index, (name, _, _) in enumerate(self.PAGES, start=1):
+            page = QtWidgets.QWidget()  # 改为普通QWidget容器
+            page.setObjectName(f"page_{index}")
+            QtWidgets.QVBoxLayout(page)
+            setattr(self, f"page_{index}", page)
+            self.stackedWidget.addWidget(page)
+
+    def get_page(self, name):
+        """获取子页面，未创建时先创建并放入对应的容器"""
+        dialog = self._pages.get(name)
+        if dialog is None:
+            index, module_name, class_name = next(
+                (i, m, c) for i, (n, m, c) in enumerate(self.PAGES, start=1) if n == name)
+            dialog_class = getattr(importlib.import_module(module_name), class_name)
+            dialog = dialog_class()
+            self._pages[name] = dialog
+            getattr(self, f"page_{index}").layout().addWidget(dialog)
+            if self.page_created is not None:
+                self.page_created(name, dialog)
+        return dialog
+
+    def is_page_created(self, name):
+        """子页面是否已创建"""
+        return name in self._pages
+
+    @property
+    def clipboard_dialog(self):
+        return self.get_page('clipboard_dialog')
+
+    @property
+    def device_dialog(self):
+        return self.get_page('device_dialog')
+
+    @property
+    def login_dialog(self):
+        return self.get_page('login_dialog')
 
     def retranslateUi(self, app_ui):
         _translate = QtCore.QCoreApplication.translate
@@ -136,16 +162,19 @@ class Ui_app_ui(object):
 
     def show_page_1(self):
         """显示剪切板页面"""
+        self.get_page('clipboard_dialog')
         self.stackedWidget.setCurrentIndex(1)
         self.update_nav_btn_style(self.btn_clipboard)
 
     def show_page_2(self):
         """显示设备页面"""
+        self.get_page('device_dialog')
         self.stackedWidget.setCurrentIndex(2)
         self.update_nav_btn_style(self.btn_device)
 
     def show_page_3(self):
         """显示登录页面"""
+        self.get_page('login_dialog')
         self.stackedWidget.setCurrentIndex(3)
         self.update_nav_btn_style(self.btn_login)
 
@@ -184,23 +213,49 @@ class MainWindow(QtWidgets.QWidget):
         self.ui = Ui_app_ui()
         self.ui.setupUi(self)
 
-        # 监听登录成功信号
-        self.ui.login_dialog.accepted.connect(self.on_login_success)
+        # 登录后的用户信息，登录前为None
+        self.user_info = None
+
+        # 子页面按需创建，创建时再绑定信号和设置用户信息
+        self.ui.page_created = self.on_page_created
+
+        # 在后台准备设备信息，登录时直接使用
+        device_identity.prefetch()
+
+        # 按环境变量启用界面卡顿检测和性能分析
+        ui_watchdog.install()
+
+    def on_page_created(self, name, dialog):
+        """子页面创建后的处理"""
+        if name == 'login_dialog':
+            # 监听登录成功信号
+            dialog.accepted.connect(self.on_login_success)
+        elif name == 'device_dialog' and self.user_info is not None:
+            # 登录后第一次打开设备页面时再加载设备列表
+            dialog.set_user_info(self.user_info['api_url'], self.user_info['username'],
+                                 self.user_info['device_id'])
 
     def on_login_success(self):
         """登录成功后设置用户信息"""
         login_dialog = self.ui.login_dialog
         api_url = login_dialog.api_url
         username = login_dialog.get_current_username()
-        device_info = login_dialog.get_device_info()  # 获取设备信息
+        device_info = login_dialog.get_device_info()  # 登录时上报的设备信息（不会重新计算）
 
         # 打印调试信息
         print(f"[DEBUG] Login success! api_url={api_url}, username={username}")
 
-        # 设置设备对话框的用户信息
-        self.ui.device_dialog.set_user_info(api_url, username, device_info.get('device_id'))
+        self.user_info = {
+            'api_url': api_url,
+            'username': username,
+            'device_id': device_info.get('device_id')
+        }
+
+        # 设置设备对话框的用户信息（设备页面尚未创建时，在创建时设置）
+        if self.ui.is_page_created('device_dialog'):
+            self.ui.device_dialog.set_user_info(api_url, username, device_info.get('device_id'))
 
-        # 设置剪贴板对话框的用户信息
+        # 设置剪贴板对话框的用户信息（登录后开始监听剪贴板，需要立即创建）
         self.ui.clipboard_dialog.set_user_info(
             api_url,
             username,
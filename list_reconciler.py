@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+列表增量更新。
+同步得到新的记录列表后，按记录的键（clip_id / device_id）与列表中现有的行比对，
+只插入新行、删除消失的行、重建显示内容变化的行，其余行保持不动，
+选中状态和滚动位置也随之保留。
+
+配合流式接收使用：begin() 之后每收到一条记录调用一次 feed()，全部收到后调用 finish()。
+现有行在新列表中位置靠后时，中间跳过的行先隐藏，finish() 时仍未出现才删除，
+因此删除一条记录只会触及这一行。
+"""
+
+from PyQt5 import QtCore, QtWidgets
+
+
+class ListReconciler:
+    """
+    QListWidget 的按键比对更新。
+
+    key: 从记录取键的函数
+    create_item: 在指定行创建列表项的函数 (record, row) -> QListWidgetItem
+    view: 从记录取显示内容的函数，结果变化时重建该行，否则只更新行数据
+    keep: 可选，判断不在新列表中的行是否保留（如尚未上传完成的本地记录）
+    """
+
+    def __init__(self, list_widget, key, create_item, view, keep=None):
+        self.list_widget = list_widget
+        self.key = key
+        self.create_item = create_item
+        self.view = view
+        self.keep = keep
+        self.stats = {}
+        self.active = False  # begin() 之后、finish()/abort() 之前为True
+
+    def _item_key(self, item):
+        record = item.data(QtCore.Qt.UserRole)
+        return self.key(record) if record else None
+
+    def begin(self):
+        """开始一次更新：记录现有行、选中项和滚动位置"""
+        lw = self.list_widget
+        self._index = {}
+        self._seen = set()
+        self._last = None  # 最近一个已确认位置的行，下一条记录放在它之后
+        self.stats = {'inserted': 0, 'removed': 0, 'updated': 0, 'moved': 0}
+        self.active = True
+
+        # 没有键的行（如"暂无记录"提示）直接移除
+        for row in reversed(range(lw.count())):
+            key = self._item_key(lw.item(row))
+            if key is None:
+                lw.takeItem(row)
+            else:
+                self._index[key] = lw.item(row)
+
+        self._selected = {self._item_key(item) for item in lw.selectedItems()}
+        current = lw.currentItem()
+        self._current = self._item_key(current) if current is not None else None
+        # 滚动位置：停在顶部时保持在顶部（能看到新记录），否则以顶部可见行为锚点
+        scrollbar = lw.verticalScrollBar()
+        self._at_top = scrollbar.value() == scrollbar.minimum()
+        anchor = lw.itemAt(0, 0)
+        self._anchor = self._item_key(anchor) if anchor is not None else None
+
+    def current_record(self, key):
+        """更新过程中取某个键在列表中现有的记录，没有时返回None"""
+        item = self._index.get(key)
+        if item is None or self.list_widget.row(item) < 0:
+            return None
+        return item.data(QtCore.Qt.UserRole)
+
+    def _next_row(self):
+        return self.list_widget.row(self._last) + 1 if self._last is not None else 0
+
+    def feed(self, record):
+        """处理新列表中的下一条记录"""
+        key = self.key(record)
+        if key in self._seen:
+            return
+        self._seen.add(key)
+
+        lw = self.list_widget
+        pos = self._next_row()
+        item = self._index.get(key)
+        row = lw.row(item) if item is not None else -1
+        if row >= 0:
+            if row >= pos:
+                # 中间跳过的行可能已被删除，先隐藏，结束时仍未出现再删除
+                for skipped in range(pos, row):
+                    lw.item(skipped).setHidden(True)
+                if self.view(item.data(QtCore.Qt.UserRole)) == self.view(record):
+                    item.setData(QtCore.Qt.UserRole, record)
+                    self._last = item
+                    return
+                # 显示内容有变化，在原位置重建
+                lw.takeItem(row)
+                self.stats['updated'] += 1
+                pos = row
+            else:
+                # 之前被跳过的行出现在了后面：移动到当前位置（移除后重建）
+                lw.takeItem(row)
+                self.stats['moved'] += 1
+                pos -= 1
+        else:
+            self.stats['inserted'] += 1
+
+        self._last = self.create_item(record, pos)
+        self._index[key] = self._last
+
+    def finish(self):
+        """结束更新：删除未出现的行，恢复选中项和滚动位置，返回统计"""
+        lw = self.list_widget
+        self.active = False
+        pos = self._next_row()
+        for row in reversed(range(lw.count())):
+            item = lw.item(row)
+            if row < pos and not item.isHidden():
+                continue
+            key = self._item_key(item)
+            if key not in self._seen and not (self.keep and self.keep(key)):
+                lw.takeItem(row)
+                self._index.pop(key, None)
+                self.stats['removed'] += 1
+            else:
+                item.setHidden(False)
+
+        for key in self._selected:
+            item = self._index.get(key)
+            if item is not None:
+                item.setSelected(True)
+        if self._current in self._index:
+            lw.setCurrentItem(self._index[self._current], QtCore.QItemSelectionModel.NoUpdate)
+
+        if self._at_top:
+            lw.scrollToTop()
+        elif self._anchor in self._index:
+            lw.scrollToItem(self._index[self._anchor], QtWidgets.QAbstractItemView.PositionAtTop)
+        return self.stats
+
+    def abort(self):
+        """中途失败（如连接断开）时结束更新：恢复被隐藏的行，不删除任何行"""
+        self.active = False
+        for row in range(self.list_widget.count()):
+            self.list_widget.item(row).setHidden(False)
+
+    def reconcile(self, records):
+        """一次性处理整个新列表"""
+        self.begin()
+        for record in records:
+            self.feed(record)
+        return self.finish()
@@ -1,10 +1,36 @@
-from http.server import BaseHTTPRequestHandler, HTTPServer
-import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import sys
 import time
-import hashlib
+import threading
 from urllib.parse import parse_qs, urlparse
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+import heapq
 import uuid
+import hmac
+import secrets
+import traceback
+
+from server_auth import PasswordHasher, HasherBusyError, SessionTable
+from rate_limiter import TokenBucketLimiter
+from server_metrics import ServerMetrics
+from server_diagnostics import PhaseTimer, SlowRequestLog, SamplingProfiler, TracemallocSnapshots, TrafficCapture
+from server_store import ClipRecord, ClipsSnapshot, DeviceRecord, UserClips, OrderKeyGenerator
+from clip_ids import uuid7, is_valid_clip_id, canonical_clip_id
+import tracing
+import wire_format
+
+
+def _env_ms(name: str, default: float) -> float:
+    """读取以毫秒为单位的环境变量，无法解析时输出警告并使用默认值，负数视为0"""
+    value = os.environ.get(name, '').strip()
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        print(f"环境变量 {name}={value!r} 不是有效的数字，使用默认值 {default:g}", file=sys.stderr)
+        return default
 
 
 class MockServer(BaseHTTPRequestHandler):
@@ -13,10 +39,74 @@ class MockServer(BaseHTTPRequestHandler):
     使用类变量存储用户数据、设备信息和剪贴板内容。
     """
 
+    # 使用HTTP/1.1：支持连接复用和列表接口的分块流式输出
+    protocol_version = 'HTTP/1.1'
+    # 流式输出时每个分块的目标大小
+    STREAM_CHUNK_BYTES = 16 * 1024
+
     # 使用字典存储用户数据和设备信息
     users: Dict[str, Dict[str, Any]] = {}  # 格式: {username: {'password_hash': str, ...}}
-    devices: Dict[str, List[Dict[str, Any]]] = {}  # 格式: {username: [device1_info, device2_info, ...]}
-    clipboards: Dict[str, List[Dict[str, Any]]] = {}  # 格式: {username: [clipboard1, clipboard2, ...]}
+    devices: Dict[str, Tuple[DeviceRecord, ...]] = {}  # 格式: {username: (device1, device2, ...)}，修改时整体替换
+    clipboards: Dict[str, UserClips] = {}  # 格式: {username: 按排序键有序的剪贴板记录}
+    # 每个用户的写锁：修改设备和剪贴板时持有，读取（列表接口）只取快照，不加锁
+    user_locks: Dict[str, threading.Lock] = {}
+    # 每个用户设备记录的估算字节数，在登录、改名和删除设备时增量维护（剪贴板的字节数由 UserClips 维护）
+    device_bytes: Dict[str, int] = {}
+    # 剪贴板记录的排序键（毫秒时间戳+序号，单调递增）
+    order_keys = OrderKeyGenerator()
+
+    # 密码哈希（scrypt，加盐），在线程池中执行并限制并发数
+    password_hasher = PasswordHasher(n=2 ** 14, r=8, p=1, max_workers=2, max_concurrent=4)
+    _init_lock = threading.Lock()
+
+    # 会话表：登录时签发令牌，其他接口通过 Authorization: Bearer <token> 认证
+    sessions = SessionTable(ttl=7 * 24 * 3600)
+    # 无需认证的接口
+    PUBLIC_ENDPOINTS = ('/login', '/register')
+
+    # 限流配置：每个设备、每个用户各一个令牌桶（突发上限, 每秒补充数）
+    RATE_LIMIT_DEVICE_BURST = 20
+    RATE_LIMIT_DEVICE_REFILL = 5.0
+    RATE_LIMIT_USER_BURST = 60
+    RATE_LIMIT_USER_REFILL = 15.0
+    RATE_LIMIT_MAX_BUCKETS = 10000
+    device_limiter = TokenBucketLimiter(RATE_LIMIT_DEVICE_BURST, RATE_LIMIT_DEVICE_REFILL,
+                                        max_buckets=RATE_LIMIT_MAX_BUCKETS)
+    user_limiter = TokenBucketLimiter(RATE_LIMIT_USER_BURST, RATE_LIMIT_USER_REFILL,
+                                      max_buckets=RATE_LIMIT_MAX_BUCKETS)
+
+    # 分片部署时由 server_shard 设置；单进程运行时为None
+    SHARD_ID: Optional[int] = None
+    # 测试账号不属于本分片时不创建
+    SEED_TEST_ACCOUNT = True
+
+    # 按接口统计的请求指标，通过 /admin/metrics 查看
+    metrics = ServerMetrics()
+    KNOWN_ENDPOINTS = ('/login', '/register', '/update_device_label', '/remove_device', '/add_clipboard',
+                       '/delete_clipboard', '/clear_clipboards', '/register_peer', '/sync', '/get_devices',
+                       '/get_clipboards', '/get_peers', '/admin/metrics', '/admin/slow_requests', '/admin/profile',
+                       '/admin/memory', '/admin/tracemalloc')
+    # 慢请求日志：处理耗时达到阈值（毫秒，0为不记录）的请求记录接口、用户、数据量和各阶段耗时，
+    # 写入 BEESYNC_SLOW_REQUEST_LOG 指定的文件（未设置时输出到标准错误），最近的记录通过 /admin/slow_requests 查看
+    SLOW_REQUEST_MS = _env_ms('BEESYNC_SLOW_REQUEST_MS', 500)
+    slow_requests = SlowRequestLog(SLOW_REQUEST_MS, os.environ.get('BEESYNC_SLOW_REQUEST_LOG', ''))
+    # 采样分析器，通过 /admin/profile?seconds=N 在运行中的服务器上采集调用栈
+    profiler = SamplingProfiler()
+    # tracemalloc 快照，通过 /admin/tracemalloc 按需开启和对比
+    tracemalloc_snapshots = TracemallocSnapshots()
+    # 流量记录：设置 BEESYNC_CAPTURE_FILE 后把请求记录到该文件（管理接口除外），供 traffic_replay.py 重放；
+    # 默认脱敏，BEESYNC_CAPTURE_REDACT=0 时保留原始用户名、密码和内容
+    CAPTURE_FILE = os.environ.get('BEESYNC_CAPTURE_FILE', '')
+    capture = TrafficCapture(CAPTURE_FILE, os.environ.get('BEESYNC_CAPTURE_REDACT', '1') != '0') \
+        if CAPTURE_FILE else None
+    # 局域网点对点传输：设备登记的监听地址和每个用户的对等密钥（设备间消息用它做HMAC认证）
+    peers: Dict[str, Dict[str, Dict[str, Any]]] = {}  # 格式: {username: {device_id: {'host', 'port', 'expires_at'}}}
+    peer_keys: Dict[str, str] = {}  # 格式: {username: 十六进制密钥}
+    # 登记的有效期（秒），客户端需定期重新登记
+    PEER_TTL = 120
+
+    # 管理接口令牌，未设置时管理接口不可用
+    ADMIN_TOKEN = os.environ.get('BEESYNC_ADMIN_TOKEN', '')
 
     # 硬编码测试账号和初始设备
     TEST_USERNAME = "testuser"
@@ -93,32 +183,138 @@ class MockServer(BaseHTTPRequestHandler):
     ]
 
     def __init__(self, *args, **kwargs):
+        # 当前请求的会话信息（认证通过后设置）
+        self.session: Optional[Dict[str, Any]] = None
+        # 当前请求的响应状态码（用于统计指标）
+        self._status_code: Optional[int] = None
+        # 当前请求的分阶段耗时和响应字节数（用于慢请求日志）
+        self._phases = PhaseTimer()
+        self._response_bytes = 0
+        # 读到请求行的时间（处理耗时从这里开始计算）
+        self._request_start: Optional[float] = None
+        # 登录/注册请求体中的用户名（这两个接口没有会话）
+        self._request_user: Optional[str] = None
+        # POST请求解码后的请求体（用于流量记录）
+        self._request_data: Optional[Dict[str, Any]] = None
         # 初始化测试账号
         self._init_test_account()
         super().__init__(*args, **kwargs)
 
     def _init_test_account(self):
         """初始化测试账号"""
-        if self.TEST_USERNAME not in self.users:
-            # 创建测试用户
-            self.users[self.TEST_USERNAME] = {
-                'password_hash': self._hash_password(self.TEST_PASSWORD),
-                'created_at': time.strftime("%Y-%m-%d %H:%M:%S")
-            }
-            # 初始化测试设备
-            self.devices[self.TEST_USERNAME] = self.TEST_DEVICES.copy()
-            # 初始化测试剪贴板内容
-            self.clipboards[self.TEST_USERNAME] = self.TEST_CLIPBOARDS.copy()
+        if not self.SEED_TEST_ACCOUNT or self.TEST_USERNAME in self.users:
+            return
+        # 多线程下只初始化一次
+        with self._init_lock:
+            if self.TEST_USERNAME not in self.users:
+                # 初始化测试设备
+                self.devices[self.TEST_USERNAME] = tuple(DeviceRecord.from_dict(d) for d in self.TEST_DEVICES)
+                self.device_bytes[self.TEST_USERNAME] = sum(d.nbytes() for d in self.devices[self.TEST_USERNAME])
+                # 初始化测试剪贴板内容
+                self.clipboards[self.TEST_USERNAME] = UserClips(
+                    [ClipRecord.from_dict(c, seq=i) for i, c in enumerate(self.TEST_CLIPBOARDS)])
+                # 最后写入用户，保证其他线程看到用户时设备和剪贴板已就绪
+                self.users[self.TEST_USERNAME] = {
+                    'password_hash': self._hash_password(self.TEST_PASSWORD),
+                    'created_at': time.strftime("%Y-%m-%d %H:%M:%S")
+                }
 
-    def _set_response(self, status_code: int = 200) -> None:
+    def handle_one_request(self) -> None:
+        """处理单个请求，并记录接口耗时指标，耗时超过阈值时写入慢请求日志"""
+        self._status_code = None
+        self.session = None
+        self._request_user = None
+        self._request_data = None
+        self._phases = PhaseTimer()
+        self._response_bytes = 0
+        self._request_start = None
+        super().handle_one_request()
+        if self._status_code is not None and self._request_start is not None:
+            duration_ms = (time.perf_counter() - self._request_start) * 1000
+            path = urlparse(self.path).path
+            endpoint = path if path in self.KNOWN_ENDPOINTS else 'other'
+            self.metrics.record(endpoint, self._status_code, duration_ms)
+            if endpoint != '/admin/profile' and self.slow_requests.should_log(duration_ms):
+                self._log_slow_request(endpoint, duration_ms)
+            if self.capture is not None and not path.startswith('/admin/'):
+                self._capture_request(duration_ms)
+
+    def parse_request(self) -> bool:
+        """
+        解析请求行和请求头。在读到请求行之后才开始计时：
+        保持连接（keep-alive）时等待下一个请求的空闲时间不计入处理耗时
+        """
+        self._request_start = time.perf_counter()
+        return super().parse_request()
+
+    def _capture_request(self, duration_ms: float) -> None:
+        """记录一个请求到流量记录文件"""
+        if self.session:
+            session = self.capture.session_key(self.session['username'], self.session['device_id'])
+        else:
+            data = self._request_data or {}
+            device_info = data.get('device_info')
+            device_id = device_info.get('device_id') if isinstance(device_info, dict) else None
+            session = self.capture.session_key(self._request_user, device_id)
+        self.capture.record(self.command, self.path, session, self._status_code, duration_ms,
+                            int(self.headers.get('Content-Length', 0) or 0), self._response_bytes,
+                            self._request_data)
+
+    def _log_slow_request(self, endpoint: str, duration_ms: float) -> None:
+        """记录一条慢请求"""
+        self.slow_requests.record({
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "method": self.command,
+            "endpoint": endpoint,
+            "path": self.path,
+            "user": self.session['username'] if self.session else self._request_user,
+            "device_id": self.session['device_id'] if self.session else None,
+            "status": self._status_code,
+            "duration_ms": round(duration_ms, 3),
+            "request_bytes": int(self.headers.get('Content-Length', 0) or 0),
+            "response_bytes": self._response_bytes,
+            "phases": self._phases.breakdown(duration_ms)
+        })
+
+    def log_request(self, code='-', size='-') -> None:
+        """记录响应状态码后再输出访问日志"""
+        if isinstance(code, int):
+            self._status_code = code
+        super().log_request(code, size)
+
+    def _set_response(self, status_code: int = 200, headers: Optional[Dict[str, str]] = None,
+                      content_type: str = 'application/json') -> None:
         """设置HTTP响应头"""
         self.send_response(status_code)
-        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-type', content_type)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
         self.end_headers()
 
+    def _send_json(self, response: Dict[str, Any], status_code: int = 200,
+                   headers: Optional[Dict[str, str]] = None) -> None:
+        """
+        发送完整的响应（带Content-Length，以便HTTP/1.1连接复用）。
+        默认为JSON，Accept 声明了 MessagePack/CBOR 时使用对应的二进制编码。
+        """
+        content_type = wire_format.negotiate(self.headers.get('Accept'))
+        with self._phases.phase('serialize', content_type=content_type):
+            body = wire_format.encode(response, content_type)
+        with self._phases.phase('write', bytes=len(body)):
+            self._set_response(status_code, {**(headers or {}), 'Content-Length': str(len(body)), 'Vary': 'Accept'},
+                               content_type)
+            self.wfile.write(body)
+        self._response_bytes += len(body)
+
     def _hash_password(self, password: str) -> str:
-        """使用SHA-256哈希密码"""
-        return hashlib.sha256(password.encode('utf-8')).hexdigest()
+        """使用加盐scrypt哈希密码（在哈希线程池中计算）"""
+        with self._phases.phase('password_hash'):
+            return self.password_hasher.hash(password)
+
+    def _verify_password(self, password: str, password_hash: Optional[str]) -> bool:
+        """校验密码是否与存储的哈希匹配（用户不存在时传入None，耗时与密码错误相同）"""
+        with self._phases.phase('password_hash'):
+            return self.password_hasher.verify(password, password_hash)
 
     def _validate_input(self, data: Dict[str, Any], required_fields: List[str]) -> Optional[Dict[str, Any]]:
         """验证输入数据是否包含必需字段"""
@@ -132,26 +328,144 @@ class MockServer(BaseHTTPRequestHandler):
         return None
 
     def _get_request_data(self) -> Dict[str, Any]:
-        """从请求中获取JSON数据"""
+        """从请求中获取数据（按 Content-Type 解码JSON、MessagePack或CBOR）"""
         content_length = int(self.headers.get('Content-Length', 0))
         if content_length == 0:
             return {}
 
         try:
-            post_data = self.rfile.read(content_length)
-            return json.loads(post_data)
-        except json.JSONDecodeError:
+            with self._phases.phase('read', bytes=content_length):
+                post_data = self.rfile.read(content_length)
+                data = wire_format.decode(post_data, self.headers.get('Content-Type'))
+        except ValueError:
             return {}
+        return data if isinstance(data, dict) else {}
 
-    def _error_response(self, message: str, status_code: int = 400) -> None:
+    def _authenticate(self) -> Optional[Dict[str, Any]]:
+        """
+        校验请求头中的会话令牌。
+        成功时返回会话信息（包含username和device_id），失败时已发送401响应并返回None。
+        """
+        auth_header = self.headers.get('Authorization', '')
+        token = auth_header[7:].strip() if auth_header.startswith('Bearer ') else ''
+        with self._phases.phase('auth'):
+            session = self.sessions.validate(token) if token else None
+        if session is None:
+            self._error_response("未登录或会话已过期", 401, {'WWW-Authenticate': 'Bearer'})
+        return session
+
+    def _client_ip(self) -> str:
+        """
+        客户端IP。请求经本机的分片路由器转发时取 X-Forwarded-For，
+        其他情况下以连接的对端地址为准。
+        """
+        ip = self.client_address[0]
+        forwarded = self.headers.get('X-Forwarded-For', '')
+        if forwarded and ip in ('127.0.0.1', '::1'):
+            return forwarded.split(',')[-1].strip()
+        return ip
+
+    def _is_admin(self) -> bool:
+        """校验管理接口令牌"""
+        return bool(self.ADMIN_TOKEN) and hmac.compare_digest(
+            self.headers.get('X-Admin-Token', ''), self.ADMIN_TOKEN)
+
+    def _check_rate_limit(self, session: Dict[str, Any]) -> bool:
+        """
+        按设备和用户两级令牌桶限流。
+        未超限时返回True；超限时已发送429响应（带Retry-After）并返回False。
+        用户级拒绝时退还已扣除的设备令牌，被拒绝的请求不消耗设备的额度。
+        """
+        username = session['username']
+        device_key = (username, session['device_id'])
+        with self._phases.phase('rate_limit'):
+            wait = self.device_limiter.acquire(device_key)
+            if not wait:
+                wait = self.user_limiter.acquire(username)
+                if wait:
+                    self.device_limiter.refund(device_key)
+        if wait:
+            self._error_response("请求过于频繁，请稍后重试", 429,
+                                 {'Retry-After': TokenBucketLimiter.retry_after_header(wait)})
+            return False
+        return True
+
+    def _write_chunk(self, data: bytes) -> None:
+        """写出一个HTTP分块"""
+        self.wfile.write(b'%X\r\n%s\r\n' % (len(data), data))
+        self._response_bytes += len(data)
+
+    def _stream_list(self, header: Dict[str, Any], list_key: str, records: Iterable[Dict[str, Any]]) -> None:
+        """
+        以分块传输编码流式输出列表响应，逐条序列化记录，内存占用与列表长度无关。
+        Accept 为序列类型（application/x-ndjson、application/x-msgpack-seq、application/cbor-seq）时
+        逐个输出对象（首个为头部信息），否则输出与非流式相同结构的单个对象（JSON/MessagePack/CBOR）。
+        header 中的 count 为记录数。
+        序列化与写出交替进行，追踪时记录为一个 stream 阶段，两部分的耗时分别记在阶段参数中。
+        """
+        with tracing.span('stream', 'server', list_key=list_key) as span:
+            self._stream_list_body(header, list_key, records, span)
+
+    def _stream_list_body(self, header: Dict[str, Any], list_key: str, records: Iterable[Dict[str, Any]],
+                          span: Any) -> None:
+        content_type = wire_format.negotiate(self.headers.get('Accept'), streaming=True)
+        sequence = content_type in wire_format.SEQUENCE_TYPES
+        self._set_response(200, {'Transfer-Encoding': 'chunked', 'Vary': 'Accept'}, content_type)
+        try:
+            if sequence:
+                self._write_chunk(wire_format.sequence_item(header, content_type))
+            else:
+                self._write_chunk(wire_format.list_prefix(header, list_key, header['count'], content_type))
+            separator = wire_format.list_separator(content_type)
+
+            buffer = bytearray()
+            written = 0
+            serialize_s = write_s = 0.0
+            t0 = time.perf_counter()
+            for record in records:
+                if sequence:
+                    buffer += wire_format.sequence_item(record, content_type)
+                else:
+                    if written:
+                        buffer += separator
+                    buffer += wire_format.encode(record, content_type)
+                written += 1
+                if len(buffer) >= self.STREAM_CHUNK_BYTES:
+                    t1 = time.perf_counter()
+                    self._write_chunk(bytes(buffer))
+                    buffer.clear()
+                    t2 = time.perf_counter()
+                    serialize_s += t1 - t0
+                    write_s += t2 - t1
+                    t0 = t2
+            serialize_s += time.perf_counter() - t0
+            span.set(records=written, content_type=content_type,
+                     serialize_ms=round(serialize_s * 1000, 3), write_ms=round(write_s * 1000, 3))
+            self._phases.add('serialize', serialize_s * 1000)
+            self._phases.add('write', write_s * 1000)
+
+            if not sequence:
+                if content_type == wire_format.MSGPACK and written != header['count']:
+                    # MessagePack 数组长度已经写出，记录数不符时只能中断
+                    raise RuntimeError(f"记录数与声明不符: {written} != {header['count']}")
+                buffer += wire_format.list_suffix(content_type)
+            if buffer:
+                self._write_chunk(bytes(buffer))
+            self.wfile.write(b'0\r\n\r\n')
+        except Exception as e:
+            # 响应头已发出，无法再返回错误响应，只能断开连接让客户端感知失败
+            self.close_connection = True
+            self.log_error("流式输出中断: %s", str(e))
+
+    def _error_response(self, message: str, status_code: int = 400,
+                        headers: Optional[Dict[str, str]] = None) -> None:
         """发送错误响应"""
-        self._set_response(status_code)
         response = {
             "success": False,
             "message": message,
             "status": status_code
         }
-        self.wfile.write(json.dumps(response).encode('utf-8'))
+        self._send_json(response, status_code, headers)
 
     def do_POST(self) -> None:
         """
@@ -163,89 +477,111 @@ class MockServer(BaseHTTPRequestHandler):
         - /add_clipboard: 添加剪贴板内容
         - /delete_clipboard: 删除剪贴板内容
         - /clear_clipboards: 清空所有剪贴板内容
+        - /register_peer: 登记本设备的点对点监听地址
+        除登录和注册外，所有接口都需要携带会话令牌，用户名取自会话而非请求体
         """
-        try:
-            data = self._get_request_data()
-
-            if self.path == '/login':
-                self._handle_login(data)
-            elif self.path == '/register':
-                self._handle_register(data)
-            elif self.path == '/update_device_label':
-                self._handle_update_device_label(data)
-            elif self.path == '/remove_device':
-                self._handle_remove_device(data)
-            elif self.path == '/add_clipboard':
-                self._handle_add_clipboard(data)
-            elif self.path == '/delete_clipboard':
-                self._handle_delete_clipboard(data)
-            elif self.path == '/clear_clipboards':
-                self._handle_clear_clipboards(data)
-            else:
-                self._error_response("未知的API端点", 404)
+        with tracing.server_span(self.headers.get(tracing.HEADER), 'handler', method='POST', path=self.path):
+            try:
+                if self.headers.get('Content-Length', '0') != '0' and \
+                        not wire_format.is_supported(self.headers.get('Content-Type')):
+                    # 请求体未读取，不能继续复用这个连接
+                    self.close_connection = True
+                    self._error_response("不支持的请求体编码", 415)
+                    return
+                data = self._get_request_data()
+                self._request_data = data
+
+                if self.path not in self.PUBLIC_ENDPOINTS:
+                    self.session = self._authenticate()
+                    if self.session is None or not self._check_rate_limit(self.session):
+                        return
+                elif isinstance(data.get('username'), str):
+                    self._request_user = data['username']
+
+                if self.path == '/login':
+                    self._handle_login(data)
+                elif self.path == '/register':
+                    self._handle_register(data)
+                elif self.path == '/update_device_label':
+                    self._handle_update_device_label(data)
+                elif self.path == '/remove_device':
+                    self._handle_remove_device(data)
+                elif self.path == '/add_clipboard':
+                    self._handle_add_clipboard(data)
+                elif self.path == '/delete_clipboard':
+                    self._handle_delete_clipboard(data)
+                elif self.path == '/clear_clipboards':
+                    self._handle_clear_clipboards(data)
+                elif self.path == '/register_peer':
+                    self._handle_register_peer(data)
+                else:
+                    self._error_response("未知的API端点", 404)
 
-        except Exception as e:
-            self._error_response(f"服务器错误: {str(e)}", 500)
+            except HasherBusyError:
+                self._error_response("服务器繁忙，请稍后重试", 503, {'Retry-After': '1'})
+            except Exception as e:
+                self.log_error("处理 %s 出错:\n%s", self.path, traceback.format_exc())
+                self._error_response(f"服务器错误: {str(e)}", 500)
 
     def _handle_login(self, data: Dict[str, Any]) -> None:
         """处理登录请求"""
         # 验证输入
         error = self._validate_input(data, ['username', 'password', 'device_info'])
         if error:
-            self._set_response(error['status'])
-            self.wfile.write(json.dumps(error).encode('utf-8'))
+            self._send_json(error, error['status'])
             return
 
         username = data['username']
-        password_hash = self._hash_password(data['password'])
         device_info = data['device_info']
 
-        # 检查用户是否存在且密码匹配
-        if username in self.users and self.users[username]['password_hash'] == password_hash:
+        # 检查用户是否存在且密码匹配（用户不存在时同样计算一次哈希）
+        user = self.users.get(username)
+        if self._verify_password(data['password'], user['password_hash'] if user else None) and user:
             # 确保设备信息包含device_id
             if 'device_id' not in device_info:
                 self._error_response("设备信息缺少device_id", 400)
                 return
 
-            # 初始化设备列表（如果不存在）
-            if username not in self.devices:
-                self.devices[username] = []
-
-            # 查找或创建设备
-            device = next((d for d in self.devices[username]
-                           if d.get('device_id') == device_info['device_id']), None)
-
-            current_time = time.strftime("%Y-%m-%d %H:%M:%S")
-
-            if device:
-                # 更新现有设备
-                device.update({
-                    'last_login': current_time,
-                    **{k: v for k, v in device_info.items() if k not in ['device_id']}
-                })
-            else:
-                # 添加新设备
-                new_device = {
-                    'device_id': device_info['device_id'],
-                    'label': device_info.get('label', f"设备{len(self.devices[username]) + 1}"),
-                    'last_login': current_time,
-                    'first_login': current_time,
-                    **{k: v for k, v in device_info.items() if k not in ['device_id', 'label']}
-                }
-                self.devices[username].append(new_device)
-                device = new_device
+            current_time = int(time.time())
+
+            with self._user_lock(username):
+                devices = self.devices.get(username, ())
+                # 查找或创建设备（设备列表可能正在被读取，修改的是副本，再整体替换列表）
+                index = next((i for i, d in enumerate(devices)
+                              if d.device_id == device_info['device_id']), None)
+                if index is not None:
+                    # 更新现有设备
+                    self._account_device(username, devices[index], -1)
+                    device = devices[index].copy()
+                    device.last_login = current_time
+                    device.update_info(device_info)
+                    devices = devices[:index] + (device,) + devices[index + 1:]
+                else:
+                    # 添加新设备
+                    device = DeviceRecord(
+                        device_id=device_info['device_id'],
+                        label=f"设备{len(devices) + 1}",
+                        first_login=current_time,
+                        last_login=current_time
+                    )
+                    device.update_info(device_info)
+                    devices = devices + (device,)
+                self.devices[username] = devices
+                self._account_device(username, device, 1)
+
+            token = self.sessions.issue(username, device_info['device_id'])
+            clips = self.clipboards.get(username)
 
             response = {
                 "success": True,
                 "message": "登录成功",
-                "token": "mock_token",
+                "token": token,
                 "device_id": device_info['device_id'],
-                "devices": self.devices[username],
-                "current_device": device,
-                "clipboards": self.clipboards.get(username, [])
+                "devices": [d.to_dict() for d in devices],
+                "current_device": device.to_dict(),
+                "clipboards": [c.to_dict() for c in clips.snapshot()] if clips is not None else []
             }
-            self._set_response()
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            self._send_json(response)
         else:
             self._error_response("用户名或密码错误", 401)
 
@@ -254,25 +590,32 @@ class MockServer(BaseHTTPRequestHandler):
         # 验证输入
         error = self._validate_input(data, ['username', 'password'])
         if error:
-            self._set_response(error['status'])
-            self.wfile.write(json.dumps(error).encode('utf-8'))
+            self._send_json(error, error['status'])
             return
 
         username = data['username']
-        password_hash = self._hash_password(data['password'])
 
         # 检查用户名是否已存在
         if username in self.users:
             self._error_response("用户名已存在", 409)
             return
 
-        # 存储用户信息
-        self.users[username] = {
-            'password_hash': password_hash,
-            'created_at': time.strftime("%Y-%m-%d %H:%M:%S")
-        }
-        self.devices[username] = []  # 初始化设备列表
-        self.clipboards[username] = []  # 初始化剪贴板列表
+        password_hash = self._hash_password(data['password'])
+
+        with self._user_lock(username):
+            # 哈希期间可能已有同名用户注册
+            exists = username in self.users
+            if not exists:
+                self.devices[username] = ()  # 初始化设备列表
+                self.clipboards[username] = UserClips()  # 初始化剪贴板列表
+                # 最后写入用户信息，保证其他线程看到用户时设备和剪贴板已就绪
+                self.users[username] = {
+                    'password_hash': password_hash,
+                    'created_at': time.strftime("%Y-%m-%d %H:%M:%S")
+                }
+        if exists:
+            self._error_response("用户名已存在", 409)
+            return
 
         response = {
             "success": True,
@@ -280,19 +623,17 @@ class MockServer(BaseHTTPRequestHandler):
             "user_count": len(self.users),
             "username": username
         }
-        self._set_response(201)  # 201 Created
-        self.wfile.write(json.dumps(response).encode('utf-8'))
+        self._send_json(response, 201)  # 201 Created
 
     def _handle_update_device_label(self, data: Dict[str, Any]) -> None:
         """处理更新设备标签请求"""
         # 验证输入
-        error = self._validate_input(data, ['username', 'device_id', 'new_label'])
+        error = self._validate_input(data, ['device_id', 'new_label'])
         if error:
-            self._set_response(error['status'])
-            self.wfile.write(json.dumps(error).encode('utf-8'))
+            self._send_json(error, error['status'])
             return
 
-        username = data['username']
+        username = self.session['username']
         device_id = data['device_id']
         new_label = data['new_label']
 
@@ -300,61 +641,64 @@ class MockServer(BaseHTTPRequestHandler):
             self._error_response("用户未找到", 404)
             return
 
-        # 查找设备
-        device = next((d for d in self.devices[username]
-                       if d.get('device_id') == device_id), None)
-
-        if device:
-            device['label'] = new_label
+        with self._user_lock(username):
+            # 查找设备，修改副本后整体替换设备列表
+            devices = self.devices[username]
+            index = next((i for i, d in enumerate(devices) if d.device_id == device_id), None)
+            if index is not None:
+                self._account_device(username, devices[index], -1)
+                device = devices[index].copy()
+                device.label = new_label
+                self.devices[username] = devices[:index] + (device,) + devices[index + 1:]
+                self._account_device(username, device, 1)
+
+        if index is not None:
             response = {
                 "success": True,
                 "message": "设备标签更新成功",
                 "device_id": device_id,
                 "new_label": new_label
             }
-            self._set_response()
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            self._send_json(response)
         else:
             self._error_response("设备未找到", 404)
 
     def _handle_remove_device(self, data: Dict[str, Any]) -> None:
         """处理删除设备请求 - 同时删除相关剪贴板记录"""
         # 验证输入
-        error = self._validate_input(data, ['username', 'device_id'])
+        error = self._validate_input(data, ['device_id'])
         if error:
-            self._set_response(error['status'])
-            self.wfile.write(json.dumps(error).encode('utf-8'))
+            self._send_json(error, error['status'])
             return
 
-        username = data['username']
+        username = self.session['username']
         device_id = data['device_id']
 
         if username not in self.devices:
             self._error_response("用户未找到", 404)
             return
 
-        # 查找并删除设备
-        device_found = False
-        for i, device in enumerate(self.devices[username]):
-            if device.get('device_id') == device_id:
-                self.devices[username].pop(i)
-                device_found = True
-                break
+        with self._user_lock(username):
+            # 查找并删除设备（替换为不含该设备的新列表）
+            devices = self.devices[username]
+            index = next((i for i, d in enumerate(devices) if d.device_id == device_id), None)
+            if index is not None:
+                self.devices[username] = devices[:index] + devices[index + 1:]
+                self._account_device(username, devices[index], -1)
 
-        if not device_found:
+                # 删除该设备的所有剪贴板记录
+                removed_clip_count = 0
+                if username in self.clipboards:
+                    removed_clip_count = self.clipboards[username].remove_device(device_id)
+                # 不再接收点对点传输
+                self.peers.get(username, {}).pop(device_id, None)
+
+        if index is None:
             self._error_response("设备未找到", 404)
             return
 
-        # 删除该设备的所有剪贴板记录
-        removed_clip_count = 0
-        if username in self.clipboards:
-            # 只保留不是该设备的记录
-            original_count = len(self.clipboards[username])
-            self.clipboards[username] = [
-                clip for clip in self.clipboards[username]
-                if clip.get('device_id') != device_id
-            ]
-            removed_clip_count = original_count - len(self.clipboards[username])
+        # 被删除的设备需要重新登录
+        self.sessions.revoke_device(username, device_id)
 
         response = {
             "success": True,
@@ -362,163 +706,468 @@ class MockServer(BaseHTTPRequestHandler):
             "device_id": device_id,
             "removed_clip_count": removed_clip_count
         }
-        self._set_response()
-        self.wfile.write(json.dumps(response).encode('utf-8'))
+        self._send_json(response)
 
     def _handle_add_clipboard(self, data: Dict[str, Any]) -> None:
-        """处理添加剪贴板内容请求"""
+        """
+        处理添加剪贴板内容请求。
+        客户端可以提供自己生成的clip_id（UUID）作为幂等键：同一ID重复提交时直接返回已有记录，
+        因此超时后重试不会产生重复记录。
+        局域网点对点推送只用于加快其他设备的显示，内容总是完整上传，服务器不保存只有元数据的记录。
+        """
         # 验证输入
-        error = self._validate_input(data, ['username', 'content', 'device_id'])
+        error = self._validate_input(data, ['content'])
         if error:
-            self._set_response(error['status'])
-            self.wfile.write(json.dumps(error).encode('utf-8'))
+            self._send_json(error, error['status'])
             return
 
-        username = data['username']
+        username = self.session['username']
         content = data['content']
-        device_id = data['device_id']
+        # 来源设备以会话绑定的设备为准
+        device_id = self.session['device_id']
         content_type = data.get('content_type', 'text/plain')
+        clip_id = data.get('clip_id')
+
+        if clip_id is not None and not is_valid_clip_id(clip_id):
+            self._error_response("clip_id必须是UUID格式", 400)
+            return
+        # 统一为标准写法，大小写或格式不同的重试也能命中已有记录
+        clip_id = canonical_clip_id(clip_id)
 
         if username not in self.clipboards:
             self._error_response("用户未找到", 404)
             return
 
-        current_time = time.strftime("%Y-%m-%d %H:%M:%S")
-        new_clip = {
-            "clip_id": str(uuid.uuid4()),
-            "content": content,
-            "content_type": content_type,
-            "created_at": current_time,
-            "last_modified": current_time,
-            "device_id": device_id
-        }
-
-        self.clipboards[username].append(new_clip)
+        clips = self.clipboards[username]
+        # 查重和添加在写锁内完成，同一clip_id并发提交时只添加一次
+        with self._user_lock(username):
+            if clip_id is not None:
+                with self._phases.phase('store', op='get'):
+                    existing = clips.get(clip_id)
+                if existing is not None:
+                    duplicate = existing.to_dict()
+            else:
+                existing = None
+
+            if existing is None:
+                new_clip = ClipRecord(
+                    clip_id=clip_id or uuid7(),
+                    content=content,
+                    content_type=content_type,
+                    order_key=self.order_keys.next(),
+                    device_id=device_id
+                )
+                with self._phases.phase('store', op='add'):
+                    clips.add(new_clip)
+
+        if existing is not None:
+            # 重复提交：内容一致时视为重试，返回已有记录
+            if duplicate['content'] != content or existing.device_id != device_id:
+                self._error_response("clip_id已被其他内容使用", 409)
+                return
+            response = {
+                "success": True,
+                "message": "剪贴板内容已存在",
+                "clip_id": existing.clip_id,
+                "duplicate": True,
+                "clip": duplicate
+            }
+            self._send_json(response)
+            return
 
         response = {
             "success": True,
             "message": "剪贴板内容添加成功",
-            "clip_id": new_clip["clip_id"],
-            "clipboards": self.clipboards[username]
+            "clip_id": new_clip.clip_id,
+            "duplicate": False,
+            "clip": new_clip.to_dict()
         }
-        self._set_response(201)  # 201 Created
-        self.wfile.write(json.dumps(response).encode('utf-8'))
+        self._send_json(response, 201)  # 201 Created
 
     def _handle_delete_clipboard(self, data: Dict[str, Any]) -> None:
         """处理删除剪贴板内容请求"""
         # 验证输入
-        error = self._validate_input(data, ['username', 'clip_id'])
+        error = self._validate_input(data, ['clip_id'])
         if error:
-            self._set_response(error['status'])
-            self.wfile.write(json.dumps(error).encode('utf-8'))
+            self._send_json(error, error['status'])
             return
 
-        username = data['username']
-        clip_id = data['clip_id']
+        username = self.session['username']
+        clip_id = canonical_clip_id(data['clip_id'])
 
         if username not in self.clipboards:
             self._error_response("用户未找到", 404)
             return
 
-        # 查找并删除剪贴板内容
-        for i, clip in enumerate(self.clipboards[username]):
-            if clip.get('clip_id') == clip_id:
-                # 记录被删除的内容用于日志
-                deleted_content = clip['content'][:50] + "..." if len(clip['content']) > 50 else clip['content']
-
-                self.clipboards[username].pop(i)
-                response = {
-                    "success": True,
-                    "message": f"剪贴板内容删除成功: '{deleted_content}'",
-                    "clip_id": clip_id,
-                    "remaining_clips": len(self.clipboards[username])
-                }
-                self._set_response()
-                self.wfile.write(json.dumps(response).encode('utf-8'))
-                return
+        # 按索引查找并删除剪贴板内容
+        with self._user_lock(username), self._phases.phase('store', op='remove'):
+            clip = self.clipboards[username].remove(clip_id)
+            remaining = len(self.clipboards[username])
+        if clip is None:
+            self._error_response("剪贴板内容未找到", 404)
+            return
 
-        self._error_response("剪贴板内容未找到", 404)
+        # 记录被删除的内容用于日志
+        deleted_content = clip.content[:50] + "..." if len(clip.content) > 50 else clip.content
+        response = {
+            "success": True,
+            "message": f"剪贴板内容删除成功: '{deleted_content}'",
+            "clip_id": clip_id,
+            "remaining_clips": remaining
+        }
+        self._send_json(response)
 
     def _handle_clear_clipboards(self, data: Dict[str, Any]) -> None:
         """处理清空所有剪贴板内容请求"""
-        # 验证输入
-        error = self._validate_input(data, ['username'])
-        if error:
-            self._set_response(error['status'])
-            self.wfile.write(json.dumps(error).encode('utf-8'))
-            return
-
-        username = data['username']
+        username = self.session['username']
 
         if username not in self.clipboards:
             self._error_response("用户未找到", 404)
             return
 
         # 清空剪贴板
-        deleted_count = len(self.clipboards[username])
-        self.clipboards[username] = []
+        with self._user_lock(username):
+            deleted_count = self.clipboards[username].clear()
 
         response = {
             "success": True,
             "message": "剪贴板已清空",
             "deleted_count": deleted_count
         }
-        self._set_response()
-        self.wfile.write(json.dumps(response).encode('utf-8'))
+        self._send_json(response)
+
+    def _handle_register_peer(self, data: Dict[str, Any]) -> None:
+        """
+        处理登记点对点监听地址请求。
+        地址总是取请求的来源地址（局域网内即为本设备的局域网IP），客户端提供的 host 必须与之一致，
+        防止把同一用户的其他设备引向第三方地址。
+        返回该用户的对等密钥，设备间传输的消息用它做HMAC认证。
+        """
+        port = data.get('port')
+        if not isinstance(port, int) or isinstance(port, bool) or not 0 < port < 65536:
+            self._error_response("port必须是1-65535之间的整数", 400)
+            return
+
+        username = self.session['username']
+        device_id = self.session['device_id']
+        host = self._client_ip()
+        if data.get('host') and data['host'] != host:
+            self._error_response("host必须与请求的来源地址一致", 400)
+            return
+        peer_key = self.peer_keys.setdefault(username, secrets.token_hex(32))
+        with self._user_lock(username):
+            peers = self._live_peers(username, time.time())
+            peers[device_id] = {
+                'host': host,
+                'port': port,
+                'expires_at': time.time() + self.PEER_TTL
+            }
+            self.peers[username] = peers
+
+        response = {
+            "success": True,
+            "message": "点对点地址已登记",
+            "host": host,
+            "port": port,
+            "ttl": self.PEER_TTL,
+            "peer_key": peer_key
+        }
+        self._send_json(response)
 
     def do_GET(self) -> None:
         """
-        处理GET请求:
+        处理GET请求（均需携带会话令牌）:
         - /get_devices: 获取用户设备列表
-        - /get_clipboards: 获取用户剪贴板内容
+        - /get_clipboards: 获取用户剪贴板内容（按时间升序）
+        - /sync: 一次往返获取剪贴板内容（已附带设备标签，按时间倒序）
+        - /get_peers: 获取同一用户其他设备的点对点监听地址
+        剪贴板接口支持 since/until 参数，筛选排序键在 (since, until] 范围内的记录。
+        两者都是不透明的游标值（记录的 order_key，不是时间戳），客户端不应自行构造：
+        响应头部的 next_since 为本次返回范围内最大的排序键（没有记录时原样返回 since），
+        下次请求时作为 since 传回即可只取新增的记录。
         """
-        try:
-            if self.path.startswith('/get_devices'):
-                # 解析查询参数
-                query = parse_qs(urlparse(self.path).query)
-                username = query.get('username', [''])[0]
-
-                if not username:
-                    self._error_response("缺少username参数", 400)
+        with tracing.server_span(self.headers.get(tracing.HEADER), 'handler', method='GET', path=self.path):
+            try:
+                path = urlparse(self.path).path
+                if path.startswith('/admin/'):
+                    self._handle_admin_get(path)
                     return
 
-                if username in self.devices:
-                    response = {
-                        "success": True,
-                        "devices": self.devices[username],
-                        "count": len(self.devices[username])
-                    }
-                    self._set_response()
-                    self.wfile.write(json.dumps(response).encode('utf-8'))
-                else:
-                    self._error_response("用户未找到", 404)
-            elif self.path.startswith('/get_clipboards'):
-                # 解析查询参数
-                query = parse_qs(urlparse(self.path).query)
-                username = query.get('username', [''])[0]
-
-                if not username:
-                    self._error_response("缺少username参数", 400)
+                if path not in ('/sync', '/get_devices', '/get_clipboards', '/get_peers'):
+                    self._error_response("未知的API端点", 404)
                     return
 
-                if username in self.clipboards:
-                    response = {
-                        "success": True,
-                        "clipboards": self.clipboards[username],
-                        "count": len(self.clipboards[username])
-                    }
-                    self._set_response()
-                    self.wfile.write(json.dumps(response).encode('utf-8'))
+                self.session = self._authenticate()
+                if self.session is None or not self._check_rate_limit(self.session):
+                    return
+                username = self.session['username']
+
+                if path == '/sync':
+                    self._handle_sync(username)
+                elif path == '/get_devices':
+                    self._handle_get_devices(username)
+                elif path == '/get_peers':
+                    self._handle_get_peers(username)
                 else:
-                    self._error_response("用户未找到", 404)
+                    self._handle_get_clipboards(username)
+
+            except Exception as e:
+                self.log_error("处理 %s 出错:\n%s", self.path, traceback.format_exc())
+                self._error_response(f"服务器错误: {str(e)}", 500)
+
+    def _handle_admin_get(self, path: str) -> None:
+        """处理管理接口请求（需 X-Admin-Token）"""
+        if not self._is_admin():
+            self._error_response("未知的API端点", 404)
+            return
+
+        if path == '/admin/metrics':
+            response = {
+                "success": True,
+                "shard_id": self.SHARD_ID,
+                "users": len(self.users),
+                "sessions": len(self.sessions),
+                "metrics": self.metrics.snapshot()
+            }
+            self._send_json(response)
+        elif path == '/admin/slow_requests':
+            response = {
+                "success": True,
+                "threshold_ms": self.slow_requests.threshold_ms,
+                "requests": self.slow_requests.recent()
+            }
+            self._send_json(response)
+        elif path == '/admin/profile':
+            self._handle_admin_profile()
+        elif path == '/admin/memory':
+            self._handle_admin_memory()
+        elif path == '/admin/tracemalloc':
+            self._handle_admin_tracemalloc()
+        else:
+            self._error_response("未知的API端点", 404)
+
+    def _user_lock(self, username: str) -> threading.Lock:
+        """用户的写锁（不存在时创建；setdefault 保证并发创建时得到同一个锁）"""
+        lock = self.user_locks.get(username)
+        if lock is None:
+            lock = self.user_locks.setdefault(username, threading.Lock())
+        return lock
+
+    def _account_device(self, username: str, device: DeviceRecord, sign: int) -> None:
+        """增减用户的设备字节数（修改设备前减去旧值，修改后加上新值）"""
+        self.device_bytes[username] = self.device_bytes.get(username, 0) + sign * device.nbytes()
+
+    def _user_memory(self, username: str) -> Dict[str, Any]:
+        """用户的存储占用（字节数为估算值）"""
+        clips = self.clipboards.get(username)
+        clip_bytes = clips.nbytes if clips is not None else 0
+        device_bytes = self.device_bytes.get(username, 0)
+        return {
+            "username": username,
+            "clip_count": len(clips) if clips is not None else 0,
+            "clip_bytes": clip_bytes,
+            "device_count": len(self.devices.get(username, ())),
+            "device_bytes": device_bytes,
+            "total_bytes": clip_bytes + device_bytes
+        }
+
+    def _handle_admin_memory(self) -> None:
+        """按用户统计存储占用，返回占用最多的 top 个用户（默认20）和全部用户的合计"""
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            top = int(query.get('top', ['20'])[0])
+        except ValueError:
+            self._error_response("参数top必须是整数", 400)
+            return
+
+        # 各用户的字节数已增量维护，这里只需遍历一次用户求和
+        clip_bytes = {}
+        for username in list(self.users):
+            clips = self.clipboards.get(username)
+            clip_bytes[username] = clips.nbytes if clips is not None else 0
+        device_bytes = {username: self.device_bytes.get(username, 0) for username in clip_bytes}
+        heaviest = heapq.nlargest(max(0, top), clip_bytes, key=lambda u: clip_bytes[u] + device_bytes[u])
+
+        response = {
+            "success": True,
+            "shard_id": self.SHARD_ID,
+            "users": len(clip_bytes),
+            "total_bytes": sum(clip_bytes.values()) + sum(device_bytes.values()),
+            "clip_bytes": sum(clip_bytes.values()),
+            "device_bytes": sum(device_bytes.values()),
+            "top": [self._user_memory(username) for username in heaviest]
+        }
+        self._send_json(response)
+
+    def _handle_admin_tracemalloc(self) -> None:
+        """
+        tracemalloc 快照。参数 action:
+        - start: 开启跟踪（frames 为每次分配保存的栈帧数，默认1）并保存基准快照
+        - snapshot（默认）: 当前分配最多的 top 个位置
+        - diff: 与上一次快照相比增长最多的 top 个位置
+        - stop: 停止跟踪
+        key 为统计粒度（lineno/filename/traceback，默认lineno）
+        """
+        query = parse_qs(urlparse(self.path).query)
+        action = query.get('action', ['snapshot'])[0]
+        key_type = query.get('key', ['lineno'])[0]
+        try:
+            top = int(query.get('top', ['20'])[0])
+            frames = int(query.get('frames', ['1'])[0])
+        except ValueError:
+            self._error_response("参数top和frames必须是整数", 400)
+            return
+        if key_type not in ('lineno', 'filename', 'traceback'):
+            self._error_response("参数key必须是lineno、filename或traceback", 400)
+            return
+
+        if action == 'start':
+            result = self.tracemalloc_snapshots.start(frames)
+        elif action == 'stop':
+            result = self.tracemalloc_snapshots.stop()
+        elif action == 'snapshot':
+            result = self.tracemalloc_snapshots.snapshot(top, key_type)
+        elif action == 'diff':
+            result = self.tracemalloc_snapshots.diff(top, key_type)
+        else:
+            self._error_response("参数action必须是start、snapshot、diff或stop", 400)
+            return
+        if result is None:
+            self._error_response("tracemalloc 未开启，请先调用 action=start", 409)
+            return
+        self._send_json({"success": True, "shard_id": self.SHARD_ID, **result})
+
+    def _handle_admin_profile(self) -> None:
+        """
+        在运行中的服务器上采样调用栈，返回折叠栈文件（可用 flamegraph.pl 或 speedscope 生成火焰图）。
+        参数: seconds（采样时长，默认5秒，最长60秒）、interval_ms（采样间隔，默认5毫秒）、
+        idle=1（包含等待连接等空闲线程）
+        """
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            seconds = float(query.get('seconds', ['5'])[0])
+            interval_ms = float(query.get('interval_ms', ['5'])[0])
+        except ValueError:
+            self._error_response("参数seconds和interval_ms必须是数字", 400)
+            return
+        include_idle = query.get('idle', ['0'])[0] == '1'
+
+        stacks = self.profiler.run(seconds, interval_ms, include_idle)
+        if stacks is None:
+            self._error_response("已有采样正在进行", 409)
+            return
+        body = stacks.encode('utf-8')
+        filename = f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+        self._set_response(200, {'Content-Length': str(len(body)),
+                                 'Content-Disposition': f'attachment; filename="{filename}"'},
+                           'text/plain; charset=utf-8')
+        self.wfile.write(body)
+        self._response_bytes += len(body)
+
+    def _handle_get_devices(self, username: str) -> None:
+        """处理获取设备列表请求（流式输出）"""
+        if username not in self.devices:
+            self._error_response("用户未找到", 404)
+            return
+
+        # 设备列表是不可变的元组，写入时整体替换，直接输出即可
+        devices = self.devices[username]
+        self._stream_list({"success": True, "count": len(devices)}, "devices",
+                          (d.to_dict() for d in devices))
+
+    def _live_peers(self, username: str, now: float) -> Dict[str, Dict[str, Any]]:
+        """该用户未过期的点对点登记（新字典，调用方持有该用户的写锁后整体替换）"""
+        return {device_id: peer for device_id, peer in self.peers.get(username, {}).items()
+                if peer['expires_at'] > now}
+
+    def _handle_get_peers(self, username: str) -> None:
+        """处理获取点对点地址请求：返回同一用户其他设备中登记未过期的地址（同时清理已过期的登记）"""
+        now = time.time()
+        with self._user_lock(username):
+            live = self._live_peers(username, now)
+            if live:
+                self.peers[username] = live
             else:
-                self._error_response("未知的API端点", 404)
+                self.peers.pop(username, None)
+        labels = {d.device_id: d.label for d in self.devices.get(username, ())}
+        peers = [
+            {"device_id": device_id, "label": labels.get(device_id, '未知设备'),
+             "host": peer['host'], "port": peer['port']}
+            for device_id, peer in live.items()
+            if device_id != self.session['device_id'] and device_id in labels
+        ]
 
-        except Exception as e:
-            self._error_response(f"服务器错误: {str(e)}", 500)
+        response = {
+            "success": True,
+            "peer_key": self.peer_keys.get(username),
+            "peers": peers
+        }
+        self._send_json(response)
+
+    def _parse_range(self) -> Optional[Dict[str, Optional[int]]]:
+        """解析 since/until 游标参数（不透明的 order_key，不是时间戳），格式错误时已发送400响应并返回None"""
+        query = parse_qs(urlparse(self.path).query)
+        bounds: Dict[str, Optional[int]] = {}
+        for name in ('since', 'until'):
+            value = query.get(name, [''])[0]
+            try:
+                bounds[name] = int(value) if value else None
+            except ValueError:
+                self._error_response(f"参数{name}必须是整数", 400)
+                return None
+        return bounds
+
+    @staticmethod
+    def _range_header(snapshot: ClipsSnapshot, bounds: Dict[str, Optional[int]]) -> Dict[str, Any]:
+        """剪贴板列表的头部：记录数和下次请求使用的游标 next_since"""
+        indexes = snapshot.range_bounds(**bounds)
+        next_since = snapshot.key_at(indexes[-1]) if indexes else bounds['since']
+        return {"success": True, "count": len(indexes), "next_since": next_since}
+
+    def _handle_get_clipboards(self, username: str) -> None:
+        """处理获取剪贴板内容请求（按时间升序流式输出）"""
+        if username not in self.clipboards:
+            self._error_response("用户未找到", 404)
+            return
+
+        bounds = self._parse_range()
+        if bounds is None:
+            return
+
+        # 在快照上计数和遍历，输出期间的并发写入不影响本次响应
+        snapshot = self.clipboards[username].snapshot()
+        with self._phases.phase('store', op='range_bounds'):
+            header = self._range_header(snapshot, bounds)
+        self._stream_list(header, "clipboards",
+                          (c.to_dict() for c in snapshot.iter_range(**bounds)))
+
+    def _handle_sync(self, username: str) -> None:
+        """
+        处理同步请求 - 在服务端关联设备标签，客户端一次请求即可完成同步。
+        记录按排序键倒序（最新在前）逐条流式输出，客户端无需等待全部数据，也无需再排序。
+        """
+        if username not in self.clipboards:
+            self._error_response("用户未找到", 404)
+            return
+
+        bounds = self._parse_range()
+        if bounds is None:
+            return
+
+        with self._phases.phase('store', op='range_bounds'):
+            device_map = {d.device_id: d.label for d in self.devices.get(username, ())}
+            # 在快照上计数和遍历，不需要加锁，也不会等待其他设备的上传
+            snapshot = self.clipboards[username].snapshot()
+            header = self._range_header(snapshot, bounds)
+        # 记录已按排序键有序，倒序遍历即为最新在前；序列化时再附加设备标签
+        records = (
+            {**clip.to_dict(), 'device_label': device_map.get(clip.device_id, '未知设备')}
+            for clip in snapshot.iter_range(newest_first=True, **bounds)
+        )
+        self._stream_list(header, "clipboards", records)
 
 
-def run(server_class=HTTPServer, handler_class=MockServer, port=8000) -> None:
+def run(server_class=ThreadingHTTPServer, handler_class=MockServer, port=8000) -> None:
     """启动HTTP服务器"""
     server_address = ('', port)
     httpd = server_class(server_address, handler_class)
@@ -1,9 +1,34 @@
 # -*- coding: utf-8 -*-
 
 from PyQt5 import QtCore, QtGui, QtWidgets
-import requests
+import functools
 import json
+import os
 import time  # 添加这行导入
+import hashlib
+from collections import OrderedDict
+import api_client
+from clip_ids import uuid7, is_valid_clip_id, canonical_clip_id
+from list_reconciler import ListReconciler
+from clip_watcher import ClipWatcher
+from peer_transport import PeerNode
+import tracing
+from ui_watchdog import profiled
+
+
+def deferred_while_syncing(method):
+    """
+    标记会增删或修改列表行的槽函数。
+    同步期间为了分批显示会处理排队的事件，此时 ListReconciler 正持有各行的位置，
+    这些调用先排队，等本次列表更新结束后再按顺序执行。
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        if self.reconciler.active:
+            self._deferred_list_updates.append((method, args))
+            return None
+        return method(self, *args)
+    return wrapper
 
 
 class Ui_Dialog(object):
@@ -142,8 +167,8 @@ class Ui_Dialog(object):
         # 更新状态标签
         self.update_status("就绪 | 设备: " + device_label)
 
-    def add_clipboard_item(self, record):
-        """添加剪贴板记录项（带滚动条和操作按钮）"""
+    def add_clipboard_item(self, record, row=None):
+        """添加剪贴板记录项（带滚动条和操作按钮），row为None时追加到末尾，否则插入到指定行"""
         item = QtWidgets.QListWidgetItem()
         # 增加高度以容纳设备信息
         item.setSizeHint(QtCore.QSize(600, 120))
@@ -259,8 +284,12 @@ class Ui_Dialog(object):
         content_layout.addLayout(btn_layout)
         layout.addLayout(content_layout)
 
-        self.listWidget.addItem(item)
+        if row is None:
+            self.listWidget.addItem(item)
+        else:
+            self.listWidget.insertItem(row, item)
         self.listWidget.setItemWidget(item, widget)
+        return item
 
     def copy_content(self, content):
         """复制纯文本内容到剪贴板"""
@@ -325,7 +354,97 @@ class Ui_Dialog(object):
         self.listWidget.setItemWidget(item, widget)
 
 
+class ClipboardCoalescer(QtCore.QObject):
+    """
+    剪贴板变化合并器。
+    在去抖窗口内连续到来的变化只保留最后一次：每次通知都会重启计时器，
+    窗口结束后才读取剪贴板内容；若变化持续不断，最多等待 max_wait_ms 也会输出一次。
+    输出前按内容哈希与最近记录比对，重复内容直接丢弃。
+    """
+    contentReady = QtCore.pyqtSignal(str)
+
+    def __init__(self, read_content, debounce_ms=300, max_wait_ms=2000, recent_size=32, parent=None):
+        super().__init__(parent)
+        self._read_content = read_content
+        self.max_wait_ms = max_wait_ms
+        self.recent_size = recent_size
+        self._recent = OrderedDict()  # 最近输出内容的哈希，按使用顺序
+        self._pending_since = None  # 当前等待批次的开始时间
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(debounce_ms)
+        self._timer.timeout.connect(self._flush)
+
+    def notify(self):
+        """通知剪贴板可能发生了变化"""
+        now = time.monotonic()
+        if self._pending_since is None:
+            self._pending_since = now
+        elif (now - self._pending_since) * 1000 >= self.max_wait_ms:
+            self._flush()
+            return
+        self._timer.start()
+
+    def forget(self, content):
+        """移除内容哈希，之后相同内容可以再次输出"""
+        digest = hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+        self._recent.pop(digest, None)
+
+    def remember(self, content):
+        """记录内容哈希，之后相同内容不会再输出；返回该内容此前是否已记录"""
+        digest = hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+        seen = digest in self._recent
+        self._recent[digest] = None
+        self._recent.move_to_end(digest)
+        while len(self._recent) > self.recent_size:
+            self._recent.popitem(last=False)
+        return seen
+
+    def _flush(self):
+        """去抖窗口结束，读取最终内容并输出"""
+        self._timer.stop()
+        self._pending_since = None
+        content = self._read_content()
+        if content and not self.remember(content):
+            self.contentReady.emit(content)
+
+
+class PeerSendThread(QtCore.QThread):
+    """在后台把剪贴板内容直接推送给局域网内的其他设备"""
+    done = QtCore.pyqtSignal(list, list)  # 送达的设备ID列表, 失败的设备ID列表
+
+    def __init__(self, node, peers, clip):
+        super().__init__()
+        self.node = node
+        self.peers = peers
+        self.clip = clip
+
+    def run(self):
+        delivered, failed = self.node.send_clip(self.peers, self.clip)
+        self.done.emit(delivered, failed)
+
+
 class ClipboardDialog(QtWidgets.QDialog):
+    # 收到局域网设备推送的内容（在接收线程中发出，排队到界面线程处理）
+    peerClipReceived = QtCore.pyqtSignal(dict, str)
+
+    # 剪贴板变化的去抖窗口（毫秒）与内容去重的最近记录数
+    CLIPBOARD_DEBOUNCE_MS = 300
+    CLIPBOARD_MAX_WAIT_MS = 2000
+    CLIPBOARD_RECENT_SIZE = 32
+    # 信号不可靠的平台上自适应轮询的间隔范围（毫秒，登录后启动）
+    CLIPBOARD_POLL_MIN_MS = 500
+    CLIPBOARD_POLL_MAX_MS = 30000
+    # 同步时每收到多少行刷新一次界面
+    SYNC_PAINT_BATCH = 50
+    # 上传超时（秒）与超时/连接失败后的重试次数（clip_id作为幂等键，重试不会产生重复记录）
+    SEND_TIMEOUT = 10
+    SEND_RETRIES = 2
+    # 局域网点对点传输（设置 BEESYNC_PEER_TRANSPORT=1 启用）与重新登记地址的间隔
+    PEER_TRANSPORT_ENABLED = os.environ.get("BEESYNC_PEER_TRANSPORT") == "1"
+    PEER_REFRESH_MS = 60000
+
     def __init__(self, parent=None):  # 移除必需的参数
         super().__init__(parent)
         self.ui = Ui_Dialog()
@@ -340,6 +459,15 @@ class ClipboardDialog(QtWidgets.QDialog):
         # 绑定同步按钮事件
         self.ui.syncButton.clicked.connect(self.load_clipboard_records)
 
+        # 同步时按clip_id增量更新列表，尚未上传完成的本地记录保留
+        self.reconciler = ListReconciler(
+            self.ui.listWidget,
+            key=lambda record: record.get("clip_id"),
+            create_item=lambda record, row: self.ui.add_clipboard_item(record, row),
+            view=lambda record: (record.get("content"), record.get("device_label"), record.get("timestamp")),
+            keep=lambda clip_id: clip_id in self._pending_uploads or clip_id in self._peer_received
+        )
+
         # 初始时不加载数据
         # 更新状态
         self.ui.update_status("请先登录")
@@ -347,36 +475,65 @@ class ClipboardDialog(QtWidgets.QDialog):
         # 初始化剪贴板监听
         self.init_clipboard_monitor()
 
-        # 设置定时器
-        self.timer = QtCore.QTimer(self)
-        self.timer.timeout.connect(self.check_clipboard)
-        self.timer.start(30000)
-
         # 记录上次剪贴板内容
         self.last_clipboard_content = ""
 
+        # 乐观更新状态：尚未被服务器确认的上传、上传期间被删除的记录、删除中可回滚的记录
+        self._pending_uploads = set()
+        self._deferred_deletes = set()
+        self._removed_records = {}  # 格式: {clip_id: (原行号, 记录)}
+        # 同步更新列表期间推迟执行的列表改动，格式: [(方法, 参数)]
+        self._deferred_list_updates = []
+
+        # 局域网点对点传输（登录后启动）
+        self.peer_node = None
+        self.peers = []
+        self._peer_threads = set()
+        self._peer_received = set()  # 从局域网收到、还没有在同步结果中出现过的记录
+        self.peer_timer = QtCore.QTimer(self)
+        self.peer_timer.timeout.connect(self.refresh_peers)
+        self.peerClipReceived.connect(self.on_peer_clip_received)
+
     def init_clipboard_monitor(self):
         """初始化剪贴板监听器"""
         self.clipboard = QtWidgets.QApplication.clipboard()
-        self.clipboard.dataChanged.connect(self.on_clipboard_changed)
+        # 变化事件先经过合并器去抖和去重，只处理最终内容
+        self.coalescer = ClipboardCoalescer(
+            lambda: self.clipboard.text().strip(),
+            debounce_ms=self.CLIPBOARD_DEBOUNCE_MS,
+            max_wait_ms=self.CLIPBOARD_MAX_WAIT_MS,
+            recent_size=self.CLIPBOARD_RECENT_SIZE,
+            parent=self
+        )
+        self.coalescer.contentReady.connect(self.on_clipboard_content_ready)
+        # 监听器在信号可靠的平台上只监听 dataChanged，其他平台辅以自适应轮询
+        self.watcher = ClipWatcher(
+            self.clipboard,
+            min_interval_ms=self.CLIPBOARD_POLL_MIN_MS,
+            max_interval_ms=self.CLIPBOARD_POLL_MAX_MS,
+            parent=self
+        )
+        self.watcher.changed.connect(self.on_clipboard_changed)
 
+    @profiled()
     def on_clipboard_changed(self):
-        """剪贴板内容变化时的处理"""
-        # 获取剪贴板内容
-        clipboard_text = self.clipboard.text().strip()
-
-        # 忽略空内容或与上次相同的内容
-        if not clipboard_text or clipboard_text == self.last_clipboard_content:
-            return
+        """剪贴板内容变化时的处理：交给合并器，去抖窗口结束后再处理最终内容"""
+        self.coalescer.notify()
 
+    @profiled()
+    @deferred_while_syncing
+    def on_clipboard_content_ready(self, clipboard_text):
+        """处理合并后的剪贴板新内容：先更新界面，再在后台上传"""
         # 更新上次内容
         self.last_clipboard_content = clipboard_text
 
         # 添加到本地剪贴板历史
-        self.add_local_clipboard_item(clipboard_text)
+        record = self.add_local_clipboard_item(clipboard_text)
 
-        # 发送到服务器
-        self.send_to_server(clipboard_text)
+        # 在后台上传（使用与本地记录相同的ID）；有局域网设备时同时直接推送，让它们更快显示
+        self.send_to_server(clipboard_text, record["clip_id"])
+        if self.peer_node is not None and self.peers:
+            self.send_to_peers(record)
 
         # 更新状态
         self.ui.update_status(f"已添加新内容 | 设备: {self.device_label} | 长度: {len(clipboard_text)}字符")
@@ -390,17 +547,11 @@ class ClipboardDialog(QtWidgets.QDialog):
             2000
         )
 
-    def check_clipboard(self):
-        """定时检查剪贴板内容（备用方法）"""
-        current_text = self.clipboard.text().strip()
-        if current_text and current_text != self.last_clipboard_content:
-            self.on_clipboard_changed()
-
     def add_local_clipboard_item(self, content):
-        """在本地添加剪贴板记录项"""
+        """在本地添加剪贴板记录项，返回创建的记录"""
         # 创建记录对象
         record = {
-            "clip_id": str(int(time.time())),  # 使用时间戳作为临时ID
+            "clip_id": uuid7(),  # 客户端生成的唯一ID，上传后即为服务器上的ID
             "content": content,
             "content_type": "text/plain",
             "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
@@ -409,30 +560,159 @@ class ClipboardDialog(QtWidgets.QDialog):
             "device_label": self.device_label
         }
 
-        # 添加到列表顶部
-        self.ui.add_clipboard_item(record)
+        # 添加到列表顶部（列表按时间倒序，与服务器返回的顺序一致）
+        self.ui.add_clipboard_item(record, row=0)
+        return record
+
+    def find_record_item(self, clip_id):
+        """按clip_id查找列表项，找不到时返回None"""
+        for row in range(self.ui.listWidget.count()):
+            item = self.ui.listWidget.item(row)
+            record = item.data(QtCore.Qt.UserRole)
+            if record and record.get("clip_id") == clip_id:
+                return item
+        return None
+
+    def send_to_server(self, content, clip_id):
+        """
+        在后台将剪贴板内容发送到服务器（本地记录已先行显示）。
+        超时或连接失败时用同一clip_id重试；最终失败则撤销本地记录。
+        """
+        self._pending_uploads.add(clip_id)
+        data = {
+            "clip_id": clip_id,
+            "content": content,
+            "device_id": self.device_id,
+            "content_type": "text/plain"
+        }
+        thread = api_client.RequestThread("POST", f"{self.api_url}/add_clipboard", json=data,
+                                          timeout=self.SEND_TIMEOUT, retries=self.SEND_RETRIES)
+        thread.response_ready.connect(
+            lambda status, result: self.on_upload_response(clip_id, content, status, result))
+        thread.error.connect(lambda message: self.on_upload_failed(clip_id, content, f"网络错误: {message}"))
+        thread.start()
+
+    @deferred_while_syncing
+    def on_upload_response(self, clip_id, content, status_code, result):
+        """上传完成：成功则用服务器记录确认本地记录，失败则撤销"""
+        # 201为新建，200为重试时服务器已有该记录
+        if status_code in (200, 201) and result.get("success"):
+            self._pending_uploads.discard(clip_id)
+            if clip_id in self._deferred_deletes:
+                # 上传期间已被用户删除，现在补发删除请求
+                self._deferred_deletes.discard(clip_id)
+                self.send_delete(clip_id)
+                return
 
-    def send_to_server(self, content):
-        """将剪贴板内容发送到服务器"""
+            item = self.find_record_item(clip_id)
+            if item is not None:
+                record = item.data(QtCore.Qt.UserRole)
+                # 以服务器记录为准（包括排序键和服务器时间；ID不同时替换为服务器ID）
+                # 只上传了元数据时服务器上没有内容，保留本地内容
+                record.update({k: v for k, v in result.get("clip", {}).items()
+                               if not (k == "content" and v is None)})
+                record["clip_id"] = result.get("clip_id", clip_id)
+                item.setData(QtCore.Qt.UserRole, record)
+            self.ui.update_status(f"已同步到服务器 | 设备: {self.device_label}")
+        elif status_code == 429:
+            self.on_upload_failed(clip_id, content,
+                                  f"发送过于频繁，请 {result.get('retry_after', '1')} 秒后重试")
+        else:
+            self.on_upload_failed(clip_id, content,
+                                  f"同步失败: {result.get('message', f'服务器错误: {status_code}')}")
+
+    @deferred_while_syncing
+    def on_upload_failed(self, clip_id, content, message):
+        """上传失败：撤销本地记录，并允许再次复制相同内容时重新上传"""
+        self._pending_uploads.discard(clip_id)
+        self._deferred_deletes.discard(clip_id)
+        # 上传期间已被用户删除的记录不会再发送删除请求，删除状态也一并清除
+        self._removed_records.pop(clip_id, None)
+        item = self.find_record_item(clip_id)
+        if item is not None:
+            self.ui.listWidget.takeItem(self.ui.listWidget.row(item))
+        self.coalescer.forget(content)
+        self.ui.update_status(message)
+
+    def start_peer_transport(self):
+        """启动局域网点对点传输：开始监听并向服务器登记地址"""
+        if self.peer_node is not None:
+            self.peer_node.stop()
+        self.peer_node = PeerNode(self.username, self.device_id,
+                                  lambda clip, sender: self.peerClipReceived.emit(clip, sender))
         try:
-            response = requests.post(f"{self.api_url}/add_clipboard", json={
-                "username": self.username,
-                "content": content,
-                "device_id": self.device_id,
-                "content_type": "text/plain"
-            })
-
-            if response.status_code == 201:
-                result = response.json()
-                if result.get("success"):
-                    # 更新状态
-                    self.ui.update_status(f"已同步到服务器 | 设备: {self.device_label}")
-                else:
-                    self.ui.update_status(f"同步失败: {result.get('message', '未知错误')}")
-            else:
-                self.ui.update_status(f"服务器错误: {response.status_code}")
-        except Exception as e:
-            self.ui.update_status(f"网络错误: {str(e)}")
+            # 先只绑定端口用于登记地址，取得密钥后才开始接受连接
+            self.peer_node.bind()
+        except OSError as e:
+            self.peer_node = None
+            print(f"点对点传输监听失败，全部经服务器中转: {e}")
+            return
+        self.refresh_peers()
+        self.peer_timer.start(self.PEER_REFRESH_MS)
+
+    def refresh_peers(self):
+        """重新登记本设备地址，再获取其他设备的地址"""
+        if self.peer_node is None:
+            return
+        thread = api_client.RequestThread("POST", f"{self.api_url}/register_peer",
+                                          json={"port": self.peer_node.port}, timeout=self.SEND_TIMEOUT)
+        thread.response_ready.connect(self.on_register_peer_response)
+        thread.start()
+
+    def on_register_peer_response(self, status_code, result):
+        if status_code != 200 or self.peer_node is None:
+            return
+        self.peer_node.peer_key = result.get("peer_key")
+        if self.peer_node.peer_key and not self.peer_node.serving:
+            try:
+                self.peer_node.start()
+            except OSError as e:
+                print(f"点对点传输监听失败，全部经服务器中转: {e}")
+        thread = api_client.RequestThread("GET", f"{self.api_url}/get_peers", timeout=self.SEND_TIMEOUT)
+        thread.response_ready.connect(self.on_get_peers_response)
+        thread.start()
+
+    def on_get_peers_response(self, status_code, result):
+        if status_code == 200 and result.get("success") and self.peer_node is not None:
+            self.peer_node.peer_key = result.get("peer_key")
+            self.peers = result.get("peers", [])
+
+    def send_to_peers(self, record):
+        """
+        直接推送给局域网内的其他设备，它们不必等到下次同步就能显示。
+        这只是加快显示的捷径，内容同时照常上传到服务器，离线的设备之后仍可从服务器同步到。
+        """
+        clip = {key: record[key] for key in ("clip_id", "content", "content_type", "created_at")}
+        thread = PeerSendThread(self.peer_node, list(self.peers), clip)
+        self._peer_threads.add(thread)
+        thread.finished.connect(lambda: self._peer_threads.discard(thread))
+        thread.start()
+
+    @deferred_while_syncing
+    def on_peer_clip_received(self, clip, sender):
+        """
+        收到局域网设备推送的内容：直接加入列表（之后同步到的同一记录不会重复显示）。
+        同步到服务器上的同一记录时以服务器的内容为准。
+        """
+        clip_id = clip.get("clip_id")
+        content = clip.get("content")
+        if not is_valid_clip_id(clip_id) or not isinstance(content, str):
+            return
+        clip_id = canonical_clip_id(clip_id)
+        if self.find_record_item(clip_id) is not None:
+            return
+        sender_label = next((p.get("label") for p in self.peers if p.get("device_id") == sender), "局域网设备")
+        record = {
+            "clip_id": clip_id,
+            "content": content,
+            "content_type": clip.get("content_type", "text/plain"),
+            "created_at": clip.get("created_at", time.strftime("%Y-%m-%d %H:%M:%S")),
+            "device_id": sender,
+            "device_label": sender_label
+        }
+        self.ui.add_clipboard_item(record, row=0)
+        self._peer_received.add(clip_id)
+        self.ui.update_status(f"已从局域网设备收到内容 | 来自: {sender_label}")
 
     def set_user_info(self, api_url, username, device_id, device_label):
         """设置用户信息（登录后调用）"""
@@ -441,81 +721,137 @@ class ClipboardDialog(QtWidgets.QDialog):
         self.device_id = device_id
         self.device_label = device_label
 
+        # 登录后开始轮询剪贴板（仅在需要轮询的平台上）
+        self.watcher.start()
+
+        if self.PEER_TRANSPORT_ENABLED:
+            self.start_peer_transport()
+
         # 设置后加载数据
         self.load_clipboard_records()
 
         # 更新状态
         self.ui.update_status(f"就绪 | 设备: {device_label} | 正在监听剪贴板...")
 
+    @profiled()
     def load_clipboard_records(self):
-        """从服务器加载剪贴板记录（点击同步按钮时触发）"""
+        """
+        从服务器加载剪贴板记录（点击同步按钮时触发）。
+        记录以流式方式接收，边接收边显示，首行出现的时间与历史记录数量无关。
+        启用链路追踪时记录为一个 sync 阶段：接收解析、列表更新和分批绘制交替进行，耗时分别记在阶段参数中。
+        """
+        with tracing.span('sync') as span:
+            self._load_clipboard_records(span)
+
+    def _load_clipboard_records(self, span):
         self.ui.update_status("正在同步剪贴板记录...")
+        self.ui.syncButton.setEnabled(False)
         try:
-            # 获取设备信息
-            devices_response = requests.get(f"{self.api_url}/get_devices?username={self.username}")
-            devices_result = devices_response.json()
-
-            if devices_response.status_code != 200 or not devices_result.get("success"):
-                QtWidgets.QMessageBox.warning(self, "警告", "获取设备信息失败")
-                self.ui.update_status("同步失败: 无法获取设备信息")
-                return
-
-            device_map = {d['device_id']: d['label'] for d in devices_result.get("devices", [])}
-
-            # 获取剪贴板记录
-            response = requests.get(f"{self.api_url}/get_clipboards?username={self.username}")
-            result = response.json()
-
-            if response.status_code == 200 and result.get("success"):
-                records = result.get("clipboards", [])
-                self.ui.listWidget.clear()
-
-                if not records:
-                    self.ui.show_no_records_message()
-                    self.ui.update_status("同步完成 | 无剪贴板记录")
+            # 一次请求获取剪贴板记录（服务端已附带设备标签，并按时间倒序输出）
+            with api_client.get_stream(f"{self.api_url}/sync") as response:
+                rows = api_client.iter_records(response)
+                result = next(rows, {})
+
+                if response.status_code == 200 and result.get("success"):
+                    # 与现有行按clip_id比对，只改动有变化的行
+                    self.reconciler.begin()
+                    count = 0
+                    receive_s = model_s = paint_s = 0.0
+                    t0 = time.perf_counter()
+                    for record in rows:
+                        t1 = time.perf_counter()
+                        receive_s += t1 - t0
+                        count += 1
+                        # 本地已删除、删除请求尚未完成的记录不再显示
+                        if record.get("clip_id") not in self._removed_records:
+                            self._peer_received.discard(record.get("clip_id"))
+                            self.reconciler.feed(record)
+                        t0 = time.perf_counter()
+                        model_s += t0 - t1
+                        if count % self.SYNC_PAINT_BATCH == 0:
+                            # 先显示已收到的行（不处理用户输入，避免重入；改动列表行的槽函数推迟到更新结束后执行）
+                            QtWidgets.QApplication.processEvents(QtCore.QEventLoop.ExcludeUserInputEvents)
+                            t1, t0 = t0, time.perf_counter()
+                            paint_s += t0 - t1
+                    receive_s += time.perf_counter() - t0
+                    span.set(records=count, receive_parse_ms=round(receive_s * 1000, 3),
+                             model_update_ms=round(model_s * 1000, 3), batch_paint_ms=round(paint_s * 1000, 3))
+                    with tracing.span('model_update', op='finish'):
+                        self.reconciler.finish()
+                    if tracing.ENABLED:
+                        # 追踪时同步绘制一次，记录更新后列表的绘制耗时
+                        with tracing.span('paint', rows=self.ui.listWidget.count()):
+                            self.ui.listWidget.viewport().repaint()
+
+                    if not self.ui.listWidget.count():
+                        self.ui.show_no_records_message()
+                        self.ui.update_status("同步完成 | 无剪贴板记录")
+                    else:
+                        self.ui.update_status(f"同步完成 | 共 {count} 条记录")
                 else:
-                    # 按时间倒序排序
-                    sorted_records = sorted(records, key=lambda x: x.get('created_at', ''), reverse=True)
-
-                    for record in sorted_records:
-                        # 添加设备标签信息
-                        record['device_label'] = device_map.get(record.get('device_id'), '未知设备')
-                        self.ui.add_clipboard_item(record)
-
-                    self.ui.update_status(f"同步完成 | 共 {len(records)} 条记录")
-            else:
-                QtWidgets.QMessageBox.warning(self, "错误", result.get("message", "获取剪贴板记录失败"))
-                self.ui.update_status(f"同步失败: {result.get('message', '未知错误')}")
+                    QtWidgets.QMessageBox.warning(self, "错误", result.get("message", "获取剪贴板记录失败"))
+                    self.ui.update_status(f"同步失败: {result.get('message', '未知错误')}")
 
-        except requests.exceptions.ConnectionError:
+        except api_client.ConnectionError:
             QtWidgets.QMessageBox.critical(self, "连接错误", "无法连接到服务器，请检查网络连接")
             self.ui.update_status("同步失败: 无法连接到服务器")
         except Exception as e:
             QtWidgets.QMessageBox.critical(self, "错误", f"加载剪贴板记录失败: {str(e)}")
             self.ui.update_status(f"同步失败: {str(e)}")
+        finally:
+            if self.reconciler.active:
+                self.reconciler.abort()
+            self.ui.syncButton.setEnabled(True)
+            self.run_deferred_list_updates()
+
+    def run_deferred_list_updates(self):
+        """执行同步期间推迟的列表改动"""
+        while self._deferred_list_updates and not self.reconciler.active:
+            method, args = self._deferred_list_updates.pop(0)
+            method(self, *args)
 
     def remove_record_item(self, item):
-        """删除记录项"""
+        """删除记录项：立即从列表移除，在后台通知服务器，失败时恢复"""
         record = item.data(QtCore.Qt.UserRole)
         if not record:
             QtWidgets.QMessageBox.warning(self, "错误", "无法获取记录数据")
             return
 
-        try:
-            response = requests.post(f"{self.api_url}/delete_clipboard", json={
-                "username": self.username,
-                "clip_id": record.get("clip_id")
-            })
-
-            if response.status_code == 200:
-                result = response.json()
-                if result.get("success"):
-                    row = self.ui.listWidget.row(item)
-                    self.ui.listWidget.takeItem(row)
-                    QtWidgets.QMessageBox.information(self, "成功", "记录删除成功")
-                else:
-                    QtWidgets.QMessageBox.warning(self, "错误", result.get("message", "删除记录失败"))
-            else:
-                QtWidgets.QMessageBox.warning(self, "错误", f"删除记录失败，状态码: {response.status_code}")
-        except Exception as e:
-            QtWidgets.QMessageBox.critical(self, "错误", f"删除记录时出错: {str(e)}")
\ No newline at end of file
+        row = self.ui.listWidget.row(item)
+        self.ui.listWidget.takeItem(row)
+        clip_id = record.get("clip_id")
+        self._removed_records[clip_id] = (row, record)
+
+        if clip_id in self._pending_uploads:
+            # 上传尚未完成，等上传确认后再删除，避免删除请求先于上传到达
+            self._deferred_deletes.add(clip_id)
+            self.ui.update_status("记录已删除")
+            return
+        self.send_delete(clip_id)
+
+    def send_delete(self, clip_id):
+        """在后台发送删除请求"""
+        thread = api_client.RequestThread("POST", f"{self.api_url}/delete_clipboard", json={
+            "clip_id": clip_id
+        }, timeout=self.SEND_TIMEOUT)
+        thread.response_ready.connect(lambda status, result: self.on_delete_response(clip_id, status, result))
+        thread.error.connect(lambda message: self.on_delete_failed(clip_id, f"删除记录时出错: {message}"))
+        thread.start()
+        self.ui.update_status("正在删除记录...")
+
+    def on_delete_response(self, clip_id, status_code, result):
+        """删除完成：404说明服务器上已不存在，同样视为成功"""
+        if status_code in (200, 404):
+            self._removed_records.pop(clip_id, None)
+            self.ui.update_status("记录已删除")
+        else:
+            self.on_delete_failed(clip_id, result.get("message", f"删除记录失败，状态码: {status_code}"))
+
+    @deferred_while_syncing
+    def on_delete_failed(self, clip_id, message):
+        """删除失败：把记录恢复到原来的位置"""
+        removed = self._removed_records.pop(clip_id, None)
+        if removed is not None and self.find_record_item(clip_id) is None:
+            row, record = removed
+            self.ui.add_clipboard_item(record, row=min(row, self.ui.listWidget.count()))
+        self.ui.update_status(f"删除失败，已恢复: {message}")
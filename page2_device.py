@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
 
 from PyQt5 import QtCore, QtGui, QtWidgets
-import requests
 import json
+import api_client
+from list_reconciler import ListReconciler
+from ui_watchdog import profiled
 
 
 class Ui_DeviceDialog(object):
+    REQUEST_TIMEOUT = 10  # 后台请求超时（秒）
+
     def setupUi(self, ClipboardDialog):
         ClipboardDialog.setObjectName("ClipboardDialog")
         ClipboardDialog.resize(800, 600)
@@ -124,8 +128,21 @@ class Ui_DeviceDialog(object):
 
         self.retranslateUi(ClipboardDialog)
         QtCore.QMetaObject.connectSlotsByName(ClipboardDialog)
-    def add_device_item(self, device_info, is_current_device=False):
-        """添加设备项 - 简化版本"""
+
+    def update_status(self, message):
+        """更新状态标签文本"""
+        self.statusLabel.setText(message)
+
+    def find_device_item(self, device_id):
+        """按device_id查找列表项，找不到时返回None"""
+        for row in range(self.listWidget.count()):
+            item = self.listWidget.item(row)
+            device = item.data(QtCore.Qt.UserRole)
+            if device and device.get("device_id") == device_id:
+                return item
+        return None
+    def add_device_item(self, device_info, is_current_device=False, row=None):
+        """添加设备项 - 简化版本（指定row时插入到该行，用于删除失败后恢复）"""
         item = QtWidgets.QListWidgetItem()
         item.setSizeHint(QtCore.QSize(200, 80))  # 稍微增加高度以适应更大的字体
         item.setData(QtCore.Qt.UserRole, device_info)
@@ -196,8 +213,12 @@ class Ui_DeviceDialog(object):
         delete_btn.clicked.connect(lambda: self.confirm_remove_device(item, is_current_device))
         layout.addWidget(delete_btn)
 
-        self.listWidget.addItem(item)
+        if row is None:
+            self.listWidget.addItem(item)
+        else:
+            self.listWidget.insertItem(row, item)
         self.listWidget.setItemWidget(item, widget)
+        return item
 
     def confirm_remove_device(self, item, is_current_device):
         """确认删除设备"""
@@ -220,37 +241,47 @@ class Ui_DeviceDialog(object):
             self.remove_device_item(item)
 
     def remove_device_item(self, item):
-        """删除设备项"""
+        """删除设备项：立即从列表移除，在后台通知服务器，失败时恢复"""
         device_info = item.data(QtCore.Qt.UserRole)
-
-        try:
-            response = requests.post(f"{self.api_url}/remove_device", json={
-                "username": self.username,
-                "device_id": device_info.get("device_id")
-            })
-
-            if response.status_code == 200:
-                result = response.json()
-                if result.get("success"):
-                    row = self.listWidget.row(item)
-                    self.listWidget.takeItem(row)
-
-                    # 显示删除的剪贴板记录数量
-                    removed_count = result.get("removed_clip_count", 0)
-                    if removed_count > 0:
-                        QtWidgets.QMessageBox.information(
-                            None,
-                            "删除成功",
-                            f"设备删除成功，同时删除了{removed_count}条相关剪贴板记录"
-                        )
-                    else:
-                        QtWidgets.QMessageBox.information(None, "成功", "设备删除成功")
-                else:
-                    QtWidgets.QMessageBox.warning(None, "错误", result.get("message", "删除设备失败"))
+        row = self.listWidget.row(item)
+        self.listWidget.takeItem(row)
+        device_id = device_info.get("device_id")
+        self.removed_devices[device_id] = (row, device_info)
+
+        thread = api_client.RequestThread("POST", f"{self.api_url}/remove_device", json={
+            "device_id": device_id
+        }, timeout=self.REQUEST_TIMEOUT)
+        thread.response_ready.connect(
+            lambda status, result: self.on_remove_device_response(device_id, status, result))
+        thread.error.connect(
+            lambda message: self.on_remove_device_failed(device_id, f"删除设备时出错: {message}"))
+        thread.start()
+        self.update_status("正在删除设备...")
+
+    def on_remove_device_response(self, device_id, status_code, result):
+        """删除完成：成功时提示删除的剪贴板记录数量，404说明服务器上已不存在，同样视为成功；其他情况恢复"""
+        if status_code == 404:
+            self.removed_devices.pop(device_id, None)
+            self.update_status("设备已删除")
+        elif status_code == 200 and result.get("success"):
+            self.removed_devices.pop(device_id, None)
+            removed_count = result.get("removed_clip_count", 0)
+            if removed_count > 0:
+                message = f"设备删除成功，同时删除了{removed_count}条相关剪贴板记录"
             else:
-                QtWidgets.QMessageBox.warning(None, "错误", "删除设备失败")
-        except Exception as e:
-            QtWidgets.QMessageBox.critical(None, "错误", f"删除设备时出错: {str(e)}")
+                message = "设备删除成功"
+            self.update_status(message)
+        else:
+            self.on_remove_device_failed(device_id, result.get("message", "删除设备失败"))
+
+    def on_remove_device_failed(self, device_id, message):
+        """删除失败：把设备恢复到原来的位置（期间重新加载已显示该设备时不再重复添加）"""
+        removed = self.removed_devices.pop(device_id, None)
+        if removed is not None and self.find_device_item(device_id) is None:
+            row, device_info = removed
+            is_current = device_id == self.current_device_id
+            self.add_device_item(device_info, is_current, row=min(row, self.listWidget.count()))
+        self.update_status(f"删除失败，设备已恢复: {message}")
 
     def retranslateUi(self, DeviceDialog):
         _translate = QtCore.QCoreApplication.translate
@@ -268,6 +299,17 @@ class DeviceDialog(QtWidgets.QDialog):
         self.ui.api_url = ""
         self.ui.username = ""
         self.ui.current_device_id = ""
+        # 删除请求尚未完成的设备，加载时不再显示，失败时据此恢复。格式: {device_id: (原行号, 设备)}
+        self.ui.removed_devices = {}
+
+        # 加载时按device_id增量更新列表
+        self.reconciler = ListReconciler(
+            self.ui.listWidget,
+            key=lambda device: device.get("device_id"),
+            create_item=lambda device, row: self.ui.add_device_item(device, self.is_current_device(device), row),
+            view=lambda device: (device.get("label"), device.get("os"), device.get("ip_address"),
+                                 self.is_current_device(device))
+        )
 
     def set_user_info(self, api_url, username, current_device_id):
         """设置用户信息后加载设备"""
@@ -276,6 +318,11 @@ class DeviceDialog(QtWidgets.QDialog):
         self.ui.current_device_id = current_device_id
         self.load_devices()
 
+    def is_current_device(self, device):
+        """是否为当前正在使用的设备"""
+        return device.get('device_id') == self.ui.current_device_id
+
+    @profiled()
     def load_devices(self):
         """从服务器加载设备列表"""
         if not self.ui.username or not self.ui.api_url:
@@ -283,22 +330,26 @@ class DeviceDialog(QtWidgets.QDialog):
             return
 
         try:
-            response = requests.get(f"{self.ui.api_url}/get_devices?username={self.ui.username}")
-            result = response.json()
-
-            if response.status_code == 200 and result.get("success"):
-                devices = result.get("devices", [])
-
-                # 清空现有列表
-                self.ui.listWidget.clear()
-
-                for device in devices:
-                    is_current = device.get('device_id') == self.ui.current_device_id
-                    self.ui.add_device_item(device, is_current)
-            else:
-                QtWidgets.QMessageBox.warning(self, "错误", result.get("message", "获取设备列表失败"))
+            # 流式接收设备列表，边接收边显示
+            with api_client.get_stream(f"{self.ui.api_url}/get_devices") as response:
+                rows = api_client.iter_records(response)
+                result = next(rows, {})
+
+                if response.status_code == 200 and result.get("success"):
+                    # 与现有行按device_id比对，只改动有变化的行
+                    self.reconciler.begin()
+                    for device in rows:
+                        # 本地已删除、删除请求尚未完成的设备不再显示
+                        if device.get("device_id") not in self.ui.removed_devices:
+                            self.reconciler.feed(device)
+                    self.reconciler.finish()
+                else:
+                    QtWidgets.QMessageBox.warning(self, "错误", result.get("message", "获取设备列表失败"))
 
-        except requests.exceptions.ConnectionError:
+        except api_client.ConnectionError:
             QtWidgets.QMessageBox.critical(self, "连接错误", "无法连接到服务器，请检查网络连接")
         except Exception as e:
-            QtWidgets.QMessageBox.critical(self, "错误", f"加载设备列表失败: {str(e)}")
\ No newline at end of file
+            QtWidgets.QMessageBox.critical(self, "错误", f"加载设备列表失败: {str(e)}")
+        finally:
+            if self.reconciler.active:
+                self.reconciler.abort()
\ No newline at end of file
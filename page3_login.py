@@ -2,8 +2,8 @@
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 from page4_register import Ui_RegisterDialog  # 导入注册页面的UI类
-import requests
-import json
+import api_client
+import device_identity
 from PyQt5.QtWidgets import QMessageBox
 from PyQt5.QtCore import QThread, pyqtSignal
 
@@ -19,8 +19,8 @@ class RegisterThread(QThread):
 
     def run(self):
         try:
-            response = requests.post(f"{self.api_url}/register", json=self.data)
-            self.finished.emit(response.json())
+            response = api_client.post(f"{self.api_url}/register", json=self.data)
+            self.finished.emit(api_client.parse(response))
         except Exception as e:
             self.error.emit(str(e))
 class Ui_LoginDialog(object):
@@ -111,6 +111,10 @@ class LoginDialog(QtWidgets.QDialog):
         self.api_url = "http://localhost:8000"
         self.current_username = ""  # 存储当前登录的用户名
         self.devices = []  # 存储当前用户的设备列表
+        self.device_info = None  # 登录时上报的设备信息
+
+        # 在后台准备设备信息，用户输入账号密码时即可完成
+        device_identity.prefetch()
 
         # 连接按钮信号
         self.ui.pushButton_login.clicked.connect(self.handle_login)
@@ -126,33 +130,10 @@ class LoginDialog(QtWidgets.QDialog):
                 self.ui.lineEdit_username.setText(username)
 
     def get_device_info(self):
-        """获取设备信息并生成唯一标识"""
-        import platform
-        import socket
-        import uuid
-        import hashlib
-
-        # 获取基本设备信息
-        hostname = socket.gethostname()
-        os_info = platform.system()
-        os_version = platform.release()
-        ip_address = socket.gethostbyname(socket.gethostname())
-        mac = ":".join(["{:02x}".format((uuid.getnode() >> elements) & 0xff)
-                       for elements in range(0, 2 * 6, 2)][::-1])
-
-        # 生成设备唯一ID
-        unique_str = f"{hostname}-{mac}-{os_info}-{os_version}"
-        device_id = hashlib.md5(unique_str.encode()).hexdigest()
-
-        return {
-            "device_id": device_id,
-            "device_name": hostname,
-            "os": os_info,
-            "os_version": os_version,
-            "ip_address": ip_address,
-            "mac_address": mac,
-            "label": f"{hostname} ({os_info})"  # 确保包含label字段
-        }
+        """获取设备信息（登录后返回登录时上报的信息，保证设备ID在本次会话中不变）"""
+        if self.device_info is not None:
+            return dict(self.device_info)
+        return device_identity.get_device_info()
 
     def handle_login(self):
         """处理登录逻辑"""
@@ -165,7 +146,7 @@ class LoginDialog(QtWidgets.QDialog):
 
         try:
             # 构造请求数据，包含设备信息
-            device_info = self.get_device_info()
+            device_info = device_identity.get_device_info()
             data = {
                 "username": username,
                 "password": password,
@@ -173,21 +154,24 @@ class LoginDialog(QtWidgets.QDialog):
             }
 
             # 发送登录请求
-            response = requests.post(f"{self.api_url}/login", json=data)
-            result = response.json()
+            response = api_client.post(f"{self.api_url}/login", json=data)
+            result = api_client.parse(response)
 
             if response.status_code == 200 and result.get("success"):
+                # 保存会话令牌，后续请求通过共享会话自动携带
+                api_client.set_token(result.get("token"))
                 self.current_username = username
                 self.devices = result.get("devices", [])
+                self.device_info = device_info
                 QMessageBox.information(self, "成功", "登录成功!")
                 self.accept()
             else:
                 error_msg = result.get("message", "登录失败，请检查账号和密码")
                 QMessageBox.warning(self, "登录失败", error_msg)
 
-        except requests.exceptions.RequestException as e:
+        except api_client.RequestException as e:
             QMessageBox.critical(self, "错误", f"网络错误: {str(e)}")
-        except json.JSONDecodeError:
+        except ValueError:
             QMessageBox.critical(self, "错误", "服务器响应格式错误")
 
     def get_current_user_devices(self):
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+局域网点对点剪贴板传输。
+同一用户的设备各自监听一个TCP端口，并通过 /register_peer 向服务器登记地址；
+发送方通过 /get_peers 取得其他设备的地址后直接把剪贴板内容推送过去，其他设备不必等到下次同步就能显示。
+推送只是加快显示的捷径：内容同时照常上传到服务器，离线或无法直连的设备之后从服务器同步到。
+
+协议：每条消息为一行JSON {"payload": <JSON字符串>, "mac": <HMAC-SHA256十六进制>}，
+密钥为服务器为该用户生成的对等密钥。接收方校验MAC、接收设备ID、时间戳和随机数（防重放），
+回复一行 {"ok": true} 或 {"ok": false, "message": ...}。
+消息只做认证，不加密，请只在可信的局域网内启用。
+监听端口先绑定（bind()，用于登记地址），取得密钥后才开始接受连接（start()）；
+格式错误或无法认证的消息一律回复失败，不会中断接收线程。
+
+用法（回环演示，启动一个模拟服务器和多个客户端）: python peer_transport.py --demo 3
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import secrets
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from clip_ids import is_valid_clip_id
+
+PROTOCOL_VERSION = 1
+# 单条消息大小上限
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+# 允许的时钟偏差（秒），超出的消息视为过期
+MAX_CLOCK_SKEW = 60
+# 防重放时记住的随机数数量
+NONCE_CACHE_SIZE = 4096
+
+
+class PeerAuthError(Exception):
+    """消息认证失败（MAC错误、发给其他设备、过期或重放）"""
+
+
+def make_frame(peer_key: str, payload: Dict[str, Any]) -> bytes:
+    """把消息编码为一行带MAC的帧"""
+    body = json.dumps(payload, ensure_ascii=False)
+    mac = hmac.new(bytes.fromhex(peer_key), body.encode('utf-8'), hashlib.sha256).hexdigest()
+    return json.dumps({"payload": body, "mac": mac}).encode('utf-8') + b'\n'
+
+
+def parse_frame(peer_key: Optional[str], line: bytes) -> Dict[str, Any]:
+    """校验帧的MAC并返回消息内容，任何格式错误都作为 PeerAuthError 抛出"""
+    if not peer_key:
+        raise PeerAuthError("尚未取得对等密钥")
+    try:
+        key = bytes.fromhex(peer_key)
+        frame = json.loads(line)
+        body = frame['payload']
+        mac = frame['mac']
+        if not isinstance(mac, str):
+            raise TypeError
+        body_bytes = body.encode('utf-8')
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise PeerAuthError("消息格式错误")
+    expected = hmac.new(key, body_bytes, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(mac, expected):
+        raise PeerAuthError("消息认证失败")
+    try:
+        message = json.loads(body)
+    except ValueError:
+        raise PeerAuthError("消息格式错误")
+    if not isinstance(message, dict):
+        raise PeerAuthError("消息格式错误")
+    return message
+
+
+class _PeerRequestHandler(socketserver.StreamRequestHandler):
+    """处理一个对等连接上的消息"""
+
+    def handle(self) -> None:
+        node: 'PeerNode' = self.server.node
+        self.connection.settimeout(node.timeout)
+        while True:
+            try:
+                line = self.rfile.readline(MAX_MESSAGE_BYTES + 1)
+            except OSError:
+                return
+            if not line:
+                return
+            try:
+                if len(line) > MAX_MESSAGE_BYTES:
+                    raise PeerAuthError("消息过大")
+                node.handle_message(parse_frame(node.peer_key, line))
+                reply = {"ok": True}
+            except PeerAuthError as e:
+                reply = {"ok": False, "message": str(e)}
+            except (ValueError, TypeError, KeyError, AttributeError):
+                # 通过认证但字段不合法的消息同样拒绝，不中断连接
+                reply = {"ok": False, "message": "消息格式错误"}
+            try:
+                self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+            except OSError:
+                return
+
+
+class _PeerTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class PeerNode:
+    """
+    一台设备的点对点收发端。
+
+    on_clip: 收到剪贴板内容时调用 on_clip(clip, from_device_id)，在接收线程中执行
+    host/port: 监听地址，默认监听所有网卡的随机端口
+    connect_timeout/timeout: 发送时的连接超时和读写超时（秒），局域网内应很快完成
+    """
+
+    def __init__(self, username: str, device_id: str, on_clip: Callable[[Dict[str, Any], str], None],
+                 host: str = '0.0.0.0', port: int = 0, connect_timeout: float = 0.3, timeout: float = 2.0):
+        self.username = username
+        self.device_id = device_id
+        self.on_clip = on_clip
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.peer_key: Optional[str] = None
+        self._nonces: "OrderedDict[str, None]" = OrderedDict()
+        self._nonce_lock = threading.Lock()
+        self._server: Optional[_PeerTCPServer] = None
+        self._serving = False
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="peer-send")
+
+    def bind(self) -> int:
+        """绑定监听端口（尚不接受连接），返回实际端口，用于向服务器登记地址"""
+        if self._server is None:
+            server = _PeerTCPServer((self.host, self.port), _PeerRequestHandler, bind_and_activate=False)
+            try:
+                server.server_bind()
+            except OSError:
+                server.server_close()
+                raise
+            server.node = self
+            self._server = server
+            self.port = server.server_address[1]
+        return self.port
+
+    @property
+    def serving(self) -> bool:
+        return self._serving
+
+    def start(self) -> int:
+        """开始接受连接，返回实际端口。必须先设置 peer_key，否则无法校验任何消息"""
+        if not self.peer_key:
+            raise PeerAuthError("尚未取得对等密钥，不能开始监听")
+        self.bind()
+        if not self._serving:
+            self._server.server_activate()
+            threading.Thread(target=self._server.serve_forever, name="peer-listener", daemon=True).start()
+            self._serving = True
+        return self.port
+
+    def stop(self) -> None:
+        """停止监听"""
+        if self._server is not None:
+            if self._serving:
+                self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            self._serving = False
+        self._executor.shutdown(wait=False)
+
+    def handle_message(self, message: Dict[str, Any]) -> None:
+        """校验消息的接收方、时效和随机数后交给回调"""
+        if message.get('v') != PROTOCOL_VERSION or message.get('type') != 'clip':
+            raise PeerAuthError("不支持的消息类型")
+        if message.get('username') != self.username or message.get('to') != self.device_id:
+            raise PeerAuthError("消息不是发给本设备的")
+        clip = message.get('clip')
+        if not isinstance(clip, dict) or not is_valid_clip_id(clip.get('clip_id')) \
+                or not isinstance(clip.get('content'), str):
+            raise PeerAuthError("消息格式错误")
+        if abs(time.time() - float(message.get('ts', 0))) > MAX_CLOCK_SKEW:
+            raise PeerAuthError("消息已过期")
+        nonce = message.get('nonce')
+        with self._nonce_lock:
+            if not isinstance(nonce, str) or nonce in self._nonces:
+                raise PeerAuthError("重复的消息")
+            self._nonces[nonce] = None
+            while len(self._nonces) > NONCE_CACHE_SIZE:
+                self._nonces.popitem(last=False)
+        self.on_clip(message['clip'], message.get('from', ''))
+
+    def _send_one(self, peer: Dict[str, Any], clip: Dict[str, Any]) -> bool:
+        """把剪贴板内容推送给一个设备，送达并被接受时返回True"""
+        frame = make_frame(self.peer_key, {
+            "v": PROTOCOL_VERSION,
+            "type": "clip",
+            "username": self.username,
+            "from": self.device_id,
+            "to": peer['device_id'],
+            "ts": time.time(),
+            "nonce": secrets.token_hex(16),
+            "clip": clip
+        })
+        try:
+            with socket.create_connection((peer['host'], peer['port']), timeout=self.connect_timeout) as sock:
+                sock.settimeout(self.timeout)
+                sock.sendall(frame)
+                reply = sock.makefile('rb').readline(64 * 1024)
+            return bool(json.loads(reply).get('ok'))
+        except (OSError, ValueError, AttributeError):
+            return False
+
+    def send_clip(self, peers: List[Dict[str, Any]], clip: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+        """并行推送给所有设备，返回 (送达的设备ID列表, 失败的设备ID列表)"""
+        if not peers or not self.peer_key:
+            return [], [p['device_id'] for p in peers]
+        results = list(self._executor.map(lambda p: (p['device_id'], self._send_one(p, clip)), peers))
+        delivered = [device_id for device_id, ok in results if ok]
+        failed = [device_id for device_id, ok in results if not ok]
+        return delivered, failed
+
+
+def _demo(client_count: int) -> None:
+    """回环演示：一个模拟服务器和多个客户端，测量点对点送达延迟和中转退回"""
+    import requests
+    from http.server import ThreadingHTTPServer
+    from mock_server import MockServer
+    from clip_ids import uuid7
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), MockServer)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    username, password = f"peerdemo-{secrets.token_hex(3)}", "peerdemo123"
+    requests.post(f"{base}/register", json={"username": username, "password": password})
+
+    received: Dict[str, threading.Event] = {}
+    clients = []
+    for i in range(client_count):
+        device_id = f"peer-demo-{i}"
+        session = requests.Session()
+        token = session.post(f"{base}/login", json={
+            "username": username, "password": password,
+            "device_info": {"device_id": device_id, "label": f"演示设备{i}"}
+        }).json()['token']
+        session.headers['Authorization'] = f"Bearer {token}"
+        received[device_id] = threading.Event()
+        node = PeerNode(username, device_id, lambda clip, sender, d=device_id: received[d].set(),
+                        host='127.0.0.1')
+        port = node.bind()
+        node.peer_key = session.post(f"{base}/register_peer", json={"port": port}).json()['peer_key']
+        node.start()
+        clients.append((device_id, session, node))
+
+    sender_id, sender_session, sender = clients[0]
+    peers = sender_session.get(f"{base}/get_peers").json()['peers']
+    print(f"客户端 {sender_id} 发现 {len(peers)} 个对等设备: {', '.join(p['device_id'] for p in peers)}")
+
+    clip = {"clip_id": uuid7(), "content": "点对点演示内容", "content_type": "text/plain"}
+    start = time.perf_counter()
+    delivered, failed = sender.send_clip(peers, clip)
+    for device_id in delivered:
+        received[device_id].wait(1)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"点对点送达 {len(delivered)} 个设备，失败 {len(failed)} 个，耗时 {elapsed_ms:.2f}ms")
+    response = sender_session.post(f"{base}/add_clipboard", json=clip)
+    print(f"内容同时上传到服务器: {response.status_code} content={response.json()['clip']['content']!r}")
+
+    # 停掉一个接收端，它之后从服务器同步到内容
+    if len(clients) > 1:
+        clients[-1][2].stop()
+        clip = {"clip_id": uuid7(), "content": "离线设备演示内容", "content_type": "text/plain"}
+        delivered, failed = sender.send_clip(peers, clip)
+        print(f"停掉 {clients[-1][0]} 后: 送达 {len(delivered)} 个，失败 {failed}")
+        sender_session.post(f"{base}/add_clipboard", json=clip)
+        synced = clients[-1][1].get(f"{base}/get_clipboards").json()['clipboards']
+        print(f"离线设备从服务器同步到: {[c['content'] for c in synced if c['clip_id'] == clip['clip_id']]}")
+
+    for _, _, node in clients[:-1]:
+        node.stop()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="BeeSyncClip 局域网点对点传输")
+    parser.add_argument('--demo', type=int, metavar='N', default=3, help="回环演示的客户端数量")
+    args = parser.parse_args()
+    _demo(max(2, args.demo))
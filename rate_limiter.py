@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+令牌桶限流器。
+每个键（如 用户名 或 用户名+设备ID）对应一个令牌桶，桶容量为突发上限，按固定速率补充令牌。
+桶按最近使用顺序保存，数量超过上限或空闲足够久时被淘汰，内存占用有上界。
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, List
+
+
+class TokenBucketLimiter:
+    """
+    令牌桶限流器。
+
+    burst: 桶容量（允许的突发请求数）
+    refill_rate: 每秒补充的令牌数
+    max_buckets: 最多保留的桶数量，超出时淘汰最久未使用的桶
+    idle_ttl: 空闲超过该秒数的桶会被淘汰（空闲足够久的桶必然已满，淘汰后重建等价）
+    """
+
+    def __init__(self, burst: float, refill_rate: float, max_buckets: int = 10000,
+                 idle_ttl: float = 600.0):
+        self.burst = float(burst)
+        self.refill_rate = float(refill_rate)
+        self.max_buckets = max_buckets
+        # 至少要等到桶补满才能淘汰，否则淘汰会让客户端白得令牌
+        self.idle_ttl = max(idle_ttl, self.burst / self.refill_rate)
+        self._buckets: "OrderedDict[Hashable, List[float]]" = OrderedDict()  # 格式: {key: [tokens, last_refill]}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: Hashable, cost: float = 1.0) -> float:
+        """
+        尝试为 key 消耗 cost 个令牌。
+        允许时返回0，否则返回需要等待的秒数（不消耗令牌）。
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [self.burst, now]
+                self._buckets[key] = bucket
+            else:
+                tokens = bucket[0] + (now - bucket[1]) * self.refill_rate
+                bucket[0] = min(self.burst, tokens)
+                bucket[1] = now
+                self._buckets.move_to_end(key)
+            self._evict(now)
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            return (cost - bucket[0]) / self.refill_rate
+
+    def refund(self, key: Hashable, cost: float = 1.0) -> None:
+        """退还之前 acquire 成功消耗的令牌（如后续的另一级限流拒绝了该请求），不超过突发上限"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket[0] = min(self.burst, bucket[0] + cost)
+
+    def _evict(self, now: float) -> None:
+        """淘汰空闲过久或超出数量上限的桶（调用方需持有锁）"""
+        while self._buckets:
+            oldest_key, oldest = next(iter(self._buckets.items()))
+            if len(self._buckets) > self.max_buckets or now - oldest[1] >= self.idle_ttl:
+                del self._buckets[oldest_key]
+            else:
+                break
+
+    @staticmethod
+    def retry_after_header(wait: float) -> str:
+        """将等待秒数转换为 Retry-After 头的值（向上取整的整数秒）"""
+        return str(max(1, math.ceil(wait)))
+
+    def __len__(self) -> int:
+        return len(self._buckets)
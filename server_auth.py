@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+服务端认证相关工具：密码哈希与会话令牌。
+"""
+
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+
+
+class HasherBusyError(Exception):
+    """并发哈希数已达上限，调用方应稍后重试"""
+
+
+class PasswordHasher:
+    """
+    加盐、参数可调的密码哈希（scrypt）。
+    哈希计算在独立的线程池中执行，并通过信号量限制同时进行的哈希数量，
+    避免登录高峰期占满请求线程、拖慢剪贴板请求。
+    hashlib.scrypt 由 OpenSSL 实现，计算期间会释放GIL，因此线程池即可真正并行。
+
+    存储格式: scrypt$n$r$p$salt_hex$hash_hex
+    校验不存在的用户时（stored 为None）改用一个随机的占位哈希计算一次，
+    使“用户不存在”和“密码错误”的耗时相同，无法据此探测用户名是否已注册。
+    """
+
+    ALGORITHM = "scrypt"
+
+    def __init__(self, n: int = 2 ** 14, r: int = 8, p: int = 1, salt_bytes: int = 16,
+                 dklen: int = 32, max_workers: int = 2, max_concurrent: int = 4,
+                 acquire_timeout: float = 5.0):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.salt_bytes = salt_bytes
+        self.dklen = dklen
+        self.max_workers = max_workers
+        self.acquire_timeout = acquire_timeout
+        # 限制排队+执行中的哈希数量，超出时直接拒绝而不是无限排队
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._dummy_hash: Optional[str] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """延迟创建线程池"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix="password-hasher")
+        return self._executor
+
+    def _derive(self, password: str, salt: bytes, n: int, r: int, p: int, dklen: int) -> bytes:
+        """在线程池中计算scrypt，受并发上限约束"""
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise HasherBusyError("密码哈希任务繁忙")
+        try:
+            # scrypt 需要约 128*n*r 字节内存，maxmem 需留出余量
+            future = self._get_executor().submit(
+                hashlib.scrypt, password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                maxmem=256 * n * r, dklen=dklen)
+            return future.result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password: str) -> str:
+        """生成加盐哈希字符串"""
+        salt = os.urandom(self.salt_bytes)
+        derived = self._derive(password, salt, self.n, self.r, self.p, self.dklen)
+        return f"{self.ALGORITHM}${self.n}${self.r}${self.p}${salt.hex()}${derived.hex()}"
+
+    def verify(self, password: str, stored: Optional[str]) -> bool:
+        """校验密码，使用存储时的参数重新计算并做常量时间比较；stored 为None时按占位哈希计算后返回False"""
+        if stored is None:
+            if self._dummy_hash is None:
+                self._dummy_hash = self.hash(secrets.token_hex(16))
+            self.verify(password, self._dummy_hash)
+            return False
+        try:
+            algorithm, n, r, p, salt_hex, hash_hex = stored.split('$')
+        except ValueError:
+            return False
+        if algorithm != self.ALGORITHM:
+            return False
+        derived = self._derive(password, bytes.fromhex(salt_hex), int(n), int(r), int(p), len(hash_hex) // 2)
+        return hmac.compare_digest(derived.hex(), hash_hex)
+
+
+class SessionTable:
+    """
+    内存会话表：登录时签发随机令牌并绑定到 用户名+设备ID。
+    每次请求只需一次字典查找即可完成校验，无需重新计算密码哈希。
+    过期会话在校验时惰性删除，并按固定间隔整体清理一次。
+    token_prefix 会加在令牌前面（分片部署时用于让路由器识别令牌所属分片）。
+    """
+
+    def __init__(self, ttl: float = 7 * 24 * 3600, sweep_interval: float = 60.0, token_prefix: str = ''):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.token_prefix = token_prefix
+        self._sessions: Dict[str, Dict[str, Any]] = {}  # 格式: {token: {'username', 'device_id', 'expires_at'}}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def issue(self, username: str, device_id: str) -> str:
+        """签发新令牌"""
+        token = self.token_prefix + secrets.token_urlsafe(32)
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[token] = {
+                'username': username,
+                'device_id': device_id,
+                'expires_at': now + self.ttl
+            }
+            if now - self._last_sweep >= self.sweep_interval:
+                self._sweep(now)
+        return token
+
+    def validate(self, token: str) -> Optional[Dict[str, Any]]:
+        """校验令牌，有效时返回会话信息，否则返回None"""
+        session = self._sessions.get(token)
+        if session is None:
+            return None
+        if session['expires_at'] <= time.monotonic():
+            with self._lock:
+                self._sessions.pop(token, None)
+            return None
+        return session
+
+    def revoke_device(self, username: str, device_id: str) -> int:
+        """撤销某设备的所有会话（设备被删除时调用），返回撤销数量"""
+        with self._lock:
+            tokens = [t for t, s in self._sessions.items()
+                      if s['username'] == username and s['device_id'] == device_id]
+            for token in tokens:
+                del self._sessions[token]
+        return len(tokens)
+
+    def _sweep(self, now: float) -> None:
+        """清理所有过期会话（调用方需持有锁）"""
+        expired = [t for t, s in self._sessions.items() if s['expires_at'] <= now]
+        for token in expired:
+            del self._sessions[token]
+        self._last_sweep = now
+
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+服务端诊断工具：请求阶段计时、慢请求日志和采样分析器。
+
+- PhaseTimer: 记录一次请求中各阶段（读取请求体、认证、限流、密码哈希、存储、序列化、写出）的耗时，
+  同时在启用链路追踪时记录对应的追踪阶段
+- SlowRequestLog: 处理耗时超过阈值的请求写入慢请求日志（JSON行），并保留最近的若干条供管理接口查看
+- sample_stacks: 在运行中的服务器上定期采集所有线程的调用栈，
+  输出折叠栈格式（每行 "帧1;帧2;... 次数"），可直接用 flamegraph.pl 或 speedscope 生成火焰图
+- TracemallocSnapshots: 按需开启 tracemalloc，输出内存分配最多的代码位置，以及与上次快照相比的增长
+- TrafficCapture: 把请求（方法、路径、请求体、状态码、耗时、数据量）按时间顺序记录为JSON行，
+  默认脱敏（用户名和设备ID替换为假名，密码、剪贴板内容和设备标签替换为占位内容但保留长度），
+  供 traffic_replay.py 在新的服务器上重放
+"""
+
+import hashlib
+import hmac
+import json
+import secrets
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import tracing
+
+
+class PhaseTimer:
+    """一次请求的分阶段计时（同名阶段累加）"""
+
+    __slots__ = ('phases',)
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def add(self, name: str, duration_ms: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + duration_ms
+
+    @contextmanager
+    def phase(self, name: str, **args: Any) -> Iterator[Any]:
+        """计时一个阶段；启用链路追踪时同时记录为追踪阶段，返回的阶段对象可补充参数"""
+        start = time.perf_counter()
+        with tracing.span(name, 'server', **args) as span:
+            try:
+                yield span
+            finally:
+                self.add(name, (time.perf_counter() - start) * 1000)
+
+    def breakdown(self, total_ms: float) -> Dict[str, float]:
+        """各阶段耗时（毫秒），未归入任何阶段的部分记为 other"""
+        result = {name: round(ms, 3) for name, ms in self.phases.items()}
+        result['other'] = round(max(0.0, total_ms - sum(self.phases.values())), 3)
+        return result
+
+
+class SlowRequestLog:
+    """
+    慢请求日志。
+    threshold_ms: 处理耗时达到该值的请求才记录，0 或负数表示不记录
+    path: 日志文件路径（每行一个JSON对象），为空时只输出到标准错误
+    keep: 内存中保留的最近记录数
+    """
+
+    def __init__(self, threshold_ms: float, path: str = '', keep: int = 200):
+        self.threshold_ms = threshold_ms
+        self.path = path
+        self._recent = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def should_log(self, duration_ms: float) -> bool:
+        return 0 < self.threshold_ms <= duration_ms
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        """记录一条慢请求"""
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._recent.append(entry)
+            if self.path:
+                try:
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write(line + '\n')
+                    return
+                except OSError as e:
+                    sys.stderr.write(f"写入慢请求日志失败: {e}\n")
+        sys.stderr.write(f"[慢请求] {line}\n")
+
+    def recent(self) -> List[Dict[str, Any]]:
+        """最近的慢请求（最新在前）"""
+        with self._lock:
+            return list(reversed(self._recent))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename.replace('\\', '/').rsplit('/', 1)[-1]
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval_ms: float = 5.0, include_idle: bool = False) -> str:
+    """
+    在 seconds 秒内每隔 interval_ms 毫秒采集一次所有线程（不含当前线程）的调用栈，
+    返回折叠栈文本，每行为 "线程名;最外层帧;...;最内层帧 采样次数"。
+    include_idle 为False时忽略停在等待连接、等待锁等空闲位置的线程。
+    """
+    me = threading.get_ident()
+    counts: Counter = Counter()
+    deadline = time.perf_counter() + seconds
+    interval = interval_ms / 1000
+    idle_functions = {'select', 'poll', 'wait', 'accept', '_wait_for_tstate_lock', 'readinto', '_worker'}
+    while time.perf_counter() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            if not include_idle and frame.f_code.co_name in idle_functions:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            counts[';'.join(reversed(stack))] += 1
+        time.sleep(interval)
+    return ''.join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+class SamplingProfiler:
+    """同一时间只允许一次采样，避免多个管理请求叠加拖慢服务器"""
+
+    MAX_SECONDS = 60.0
+    MIN_INTERVAL_MS = 1.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def run(self, seconds: float, interval_ms: float, include_idle: bool = False) -> Optional[str]:
+        """执行一次采样，已有采样在进行时返回None"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            seconds = min(max(seconds, 0.1), self.MAX_SECONDS)
+            interval_ms = max(interval_ms, self.MIN_INTERVAL_MS)
+            return sample_stacks(seconds, interval_ms, include_idle)
+        finally:
+            self._lock.release()
+
+
+class TracemallocSnapshots:
+    """
+    tracemalloc 快照与对比。开启后每次分配都有额外开销，只在排查内存问题时按需开启。
+    每次 snapshot()/diff() 都会保存当前快照，diff() 与上一次保存的快照对比。
+    """
+
+    # 不统计 tracemalloc 自身和导入机制的分配
+    _FILTERS = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        tracemalloc.Filter(False, '<unknown>'),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    def start(self, frames: int = 1) -> Dict[str, Any]:
+        """开启跟踪（已开启时不变）并保存基准快照"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(1, frames))
+            self._previous = self._take()
+            return self._status()
+
+    def stop(self) -> Dict[str, Any]:
+        """停止跟踪并丢弃快照"""
+        with self._lock:
+            tracemalloc.stop()
+            self._previous = None
+            return self._status()
+
+    def snapshot(self, top: int = 20, key_type: str = 'lineno') -> Optional[Dict[str, Any]]:
+        """当前内存分配最多的位置，未开启跟踪时返回None"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                return None
+            snapshot = self._take()
+            self._previous = snapshot
+            stats = snapshot.statistics(key_type)
+            return {
+                **self._status(),
+                "top": [{"location": self._location(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+                        for stat in stats[:top]]
+            }
+
+    def diff(self, top: int = 20, key_type: str = 'lineno') -> Optional[Dict[str, Any]]:
+        """与上一次快照相比增长最多的位置，未开启跟踪时返回None"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                return None
+            snapshot = self._take()
+            previous, self._previous = self._previous, snapshot
+            if previous is None:
+                stats = []
+            else:
+                stats = snapshot.compare_to(previous, key_type)
+            return {
+                **self._status(),
+                "top": [{"location": self._location(stat.traceback), "size_diff_bytes": stat.size_diff,
+                         "size_bytes": stat.size, "count_diff": stat.count_diff}
+                        for stat in stats[:top]]
+            }
+
+    def _take(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(self._FILTERS)
+
+    @staticmethod
+    def _location(traceback: tracemalloc.Traceback) -> List[str]:
+        return [f"{frame.filename}:{frame.lineno}" for frame in traceback]
+
+    @staticmethod
+    def _status() -> Dict[str, Any]:
+        tracing_now = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing_now else (0, 0)
+        return {
+            "tracing": tracing_now,
+            "frames": tracemalloc.get_traceback_limit() if tracing_now else 0,
+            "traced_bytes": current,
+            "peak_bytes": peak
+        }
+
+
+# 流量记录的格式版本：2 起 ms 从读到请求行开始计算，不含保持连接时等待请求的空闲时间
+CAPTURE_VERSION = 2
+# 脱敏后统一使用的密码，重放时以此注册和登录
+REPLAY_PASSWORD = "replay-password"
+# 脱敏时替换为占位内容的设备信息字段
+_DEVICE_INFO_REDACTED = ('label', 'device_name', 'hostname', 'ip_address', 'mac_address')
+
+
+class TrafficCapture:
+    """
+    请求流量记录。第一行为文件头 {"capture": 2, "started": ..., "redacted": ...}（版本1的 ms 含保持连接的空闲时间），
+    之后每行一个请求:
+    t（请求完成时的epoch秒，多个分片进程写入同一文件时也可以排序）、m（方法）、p（路径）、s（会话键 "用户|设备"）、st（状态码）、
+    ms（处理耗时）、rq/rs（请求/响应字节数）、b（请求体，可能已脱敏）。
+    """
+
+    def __init__(self, path: str, redact: bool = True):
+        self.path = path
+        self.redact = redact
+        # 假名使用本次运行的随机密钥计算，不写入文件，无法由假名反推原值
+        self._key = secrets.token_bytes(16)
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._write({"capture": CAPTURE_VERSION, "started": time.time(), "redacted": redact})
+
+    def pseudonym(self, value: Optional[str], prefix: str) -> Optional[str]:
+        """同一次运行中相同的值得到相同的假名；不脱敏时原样返回"""
+        if not self.redact or not isinstance(value, str):
+            return value
+        return prefix + hmac.new(self._key, value.encode('utf-8'), hashlib.sha256).hexdigest()[:12]
+
+    def session_key(self, username: Optional[str], device_id: Optional[str]) -> str:
+        return f"{self.pseudonym(username, 'u') or ''}|{self.pseudonym(device_id, 'd') or ''}"
+
+    @staticmethod
+    def _placeholder(value: Any) -> Any:
+        """替换为等长（UTF-8字节数相同）的占位字符串"""
+        return 'x' * len(value.encode('utf-8')) if isinstance(value, str) else value
+
+    def redact_body(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """脱敏请求体：假名化用户名和设备ID，替换密码、内容和设备标签"""
+        if not self.redact:
+            return data
+        body = dict(data)
+        if 'username' in body:
+            body['username'] = self.pseudonym(body['username'], 'u')
+        if 'password' in body:
+            body['password'] = REPLAY_PASSWORD
+        if 'content' in body:
+            body['content'] = self._placeholder(body['content'])
+        if 'new_label' in body:
+            body['new_label'] = self._placeholder(body['new_label'])
+        if 'device_id' in body:
+            body['device_id'] = self.pseudonym(body['device_id'], 'd')
+        if isinstance(body.get('device_info'), dict):
+            info = dict(body['device_info'])
+            if 'device_id' in info:
+                info['device_id'] = self.pseudonym(info['device_id'], 'd')
+            for key in _DEVICE_INFO_REDACTED:
+                if key in info:
+                    info[key] = self._placeholder(info[key])
+            body['device_info'] = info
+        return body
+
+    def record(self, method: str, path: str, session: str, status: int, duration_ms: float,
+               request_bytes: int, response_bytes: int, body: Optional[Dict[str, Any]]) -> None:
+        """记录一个请求"""
+        entry = {
+            "t": round(time.time(), 6),
+            "m": method, "p": path, "s": session, "st": status, "ms": round(duration_ms, 3),
+            "rq": request_bytes, "rs": response_bytes
+        }
+        if body:
+            entry["b"] = self.redact_body(body)
+        self._write(entry)
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
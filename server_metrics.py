@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+服务端请求指标：按接口统计请求数、错误数和处理耗时。
+每个服务进程（分片）持有自己的一份指标。
+"""
+
+import threading
+import time
+from typing import Dict, Any
+
+
+class ServerMetrics:
+    """线程安全的按接口请求计数与耗时统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, float]] = {}  # 格式: {endpoint: {'count', 'errors', 'total_ms', 'max_ms'}}
+        self.started_at = time.time()
+
+    def record(self, endpoint: str, status_code: int, duration_ms: float) -> None:
+        """记录一次请求"""
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = {'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            stats['count'] += 1
+            if status_code >= 400:
+                stats['errors'] += 1
+            stats['total_ms'] += duration_ms
+            if duration_ms > stats['max_ms']:
+                stats['max_ms'] = duration_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出当前指标（可直接JSON序列化）"""
+        with self._lock:
+            endpoints = {
+                endpoint: {
+                    'count': int(stats['count']),
+                    'errors': int(stats['errors']),
+                    'avg_ms': round(stats['total_ms'] / stats['count'], 3) if stats['count'] else 0.0,
+                    'max_ms': round(stats['max_ms'], 3)
+                }
+                for endpoint, stats in self._endpoints.items()
+            }
+        return {
+            'uptime_s': round(time.time() - self.started_at, 1),
+            'requests': sum(e['count'] for e in endpoints.values()),
+            'endpoints': endpoints
+        }
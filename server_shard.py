@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+分片部署模式。
+启动 N 个工作进程，每个进程运行独立的 MockServer（独立存储、独立指标），
+按用户名哈希划分用户。前端路由器根据用户名（登录/注册请求体）或令牌前缀（其他请求）
+把请求转发到对应分片，路由器本身只做转发，不解析业务数据。
+
+用法: python server_shard.py --shards 4 --port 8000 [--routers 2]
+"""
+
+import argparse
+import hashlib
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import wire_format
+
+
+def shard_for(username: str, shard_count: int) -> int:
+    """计算用户名所属分片（稳定哈希，不受进程哈希随机化影响）"""
+    digest = hashlib.blake2b(username.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shard_count
+
+
+def _run_shard(shard_id: int, shard_count: int, port_queue) -> None:
+    """工作进程入口：运行一个只持有本分片用户的 MockServer"""
+    from mock_server import MockServer
+
+    MockServer.SHARD_ID = shard_id
+    MockServer.SEED_TEST_ACCOUNT = shard_for(MockServer.TEST_USERNAME, shard_count) == shard_id
+    # 令牌带上分片号，路由器据此转发
+    MockServer.sessions.token_prefix = f"{shard_id}."
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), MockServer)
+    port_queue.put((shard_id, httpd.server_address[1]))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+class ShardRouter(BaseHTTPRequestHandler):
+    """前端路由器：按用户亲和性把请求转发到分片"""
+
+    # 与 MockServer 一致使用 HTTP/1.1，客户端可以保持连接
+    protocol_version = 'HTTP/1.1'
+    shard_ports: List[int] = []  # 下标为分片号
+    PUBLIC_ENDPOINTS = ('/login', '/register')
+    # 逐跳头部和由本路由器重新生成的头部，不转发
+    SKIP_HEADERS = {'connection', 'keep-alive', 'proxy-connection', 'transfer-encoding', 'te',
+                    'trailer', 'upgrade', 'server', 'date', 'x-forwarded-for'}
+    FORWARD_TIMEOUT = 30
+    # 每个处理线程到各分片的持久连接（HTTP/1.1 keep-alive），格式: {端口: HTTPConnection}
+    _local = threading.local()
+
+    def do_GET(self) -> None:
+        self._route()
+
+    def do_POST(self) -> None:
+        self._route()
+
+    def _json_response(self, response: Dict[str, Any], status_code: int = 200) -> None:
+        """发送JSON响应"""
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error_response(self, message: str, status_code: int) -> None:
+        """发送错误响应（格式与 MockServer 一致）"""
+        self._json_response({"success": False, "message": message, "status": status_code}, status_code)
+
+    def _route(self) -> None:
+        content_length = int(self.headers.get('Content-Length', 0) or 0)
+        body = self.rfile.read(content_length) if content_length else b''
+        path = urlparse(self.path).path
+
+        if path == '/admin/metrics':
+            self._aggregate_metrics()
+            return
+        if path.startswith('/admin/'):
+            # 其他管理接口转发到 shard 参数指定的分片（默认0），采样分析可能持续较长时间
+            shard = parse_qs(urlparse(self.path).query).get('shard', ['0'])[0]
+            if not shard.isdigit() or int(shard) >= len(self.shard_ports):
+                self._error_response("参数shard无效", 400)
+                return
+            self._forward(int(shard), body, self.FORWARD_TIMEOUT + 60)
+            return
+
+        shard_id = self._pick_shard(path, body)
+        if shard_id is None:
+            self._error_response("未登录或会话已过期", 401)
+            return
+        self._forward(shard_id, body)
+
+    def _pick_shard(self, path: str, body: bytes) -> Optional[int]:
+        """选择目标分片：登录/注册按用户名，其他请求按令牌前缀"""
+        shard_count = len(self.shard_ports)
+        if path in self.PUBLIC_ENDPOINTS:
+            try:
+                username = wire_format.decode(body, self.headers.get('Content-Type')).get('username') or ''
+            except (ValueError, AttributeError):
+                username = ''
+            # 缺少用户名时随便选一个分片，由分片返回参数校验错误
+            return shard_for(username, shard_count) if username else 0
+
+        auth_header = self.headers.get('Authorization', '')
+        prefix = auth_header[7:].split('.', 1)[0] if auth_header.startswith('Bearer ') else ''
+        if prefix.isdigit() and int(prefix) < shard_count:
+            return int(prefix)
+        return None
+
+    def _shard_connection(self, port: int, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        """取本线程到分片的持久连接，返回 (连接, 是否为已连接过的复用连接)"""
+        pool = getattr(self._local, 'connections', None)
+        if pool is None:
+            pool = self._local.connections = {}
+        conn = pool.get(port)
+        if conn is None:
+            conn = pool[port] = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, conn.sock is not None
+
+    def _drop_connection(self, port: int) -> None:
+        """关闭并丢弃本线程到分片的连接（出错或响应没有读完时，连接不能再复用）"""
+        conn = getattr(self._local, 'connections', {}).pop(port, None)
+        if conn is not None:
+            conn.close()
+
+    def _shard_request(self, port: int, method: str, path: str, body: Optional[bytes],
+                       headers: Dict[str, str], timeout: float) -> http.client.HTTPResponse:
+        """在持久连接上发送请求；复用的连接已被分片关闭时重新连接再试一次"""
+        conn, reused = self._shard_connection(port, timeout)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            return conn.getresponse()
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            conn.close()
+            if not reused:
+                raise
+            conn.request(method, path, body=body, headers=headers)
+            return conn.getresponse()
+
+    def _forward(self, shard_id: int, body: bytes, timeout: Optional[float] = None) -> None:
+        """
+        把请求原样转发到分片，并把响应流式写回客户端。
+        分片响应带 Content-Length 时原样转发，否则（分块传输）重新按分块编码写出，客户端连接可以继续复用。
+        响应头已经发出后分片出错时无法再发送错误响应，只关闭客户端连接。
+        """
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in self.SKIP_HEADERS}
+        # 分片据此得到客户端地址（点对点传输登记地址时使用）
+        headers['X-Forwarded-For'] = self.client_address[0]
+        port = self.shard_ports[shard_id]
+        headers_sent = False
+        try:
+            resp = self._shard_request(port, self.command, self.path, body or None, headers,
+                                       timeout or self.FORWARD_TIMEOUT)
+            chunked = resp.getheader('Content-Length') is None and resp.status not in (204, 304)
+            self.send_response(resp.status)
+            for key, value in resp.getheaders():
+                if key.lower() not in self.SKIP_HEADERS:
+                    self.send_header(key, value)
+            if chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            headers_sent = True
+            while True:
+                # read1 返回已收到的数据，分片流式输出的记录不会在路由器积压
+                chunk = resp.read1(64 * 1024)
+                if not chunk:
+                    break
+                self.wfile.write(b'%X\r\n%s\r\n' % (len(chunk), chunk) if chunked else chunk)
+            if resp.length:
+                # 分片在 Content-Length 之前关闭了连接（分块传输中断时 read1 会直接抛出）
+                raise http.client.IncompleteRead(b'', resp.length)
+            # 响应已读完；read1 读到长度末尾时不会自动结束响应，需要显式关闭后连接才能发送下一个请求
+            resp.close()
+            if chunked:
+                self.wfile.write(b'0\r\n\r\n')
+        except (OSError, http.client.HTTPException) as e:
+            self._drop_connection(port)
+            if headers_sent:
+                self.close_connection = True
+            else:
+                self._error_response(f"分片 {shard_id} 不可用: {str(e)}", 502)
+
+    def _aggregate_metrics(self) -> None:
+        """汇总所有分片的指标"""
+        shards = []
+        for shard_id, port in enumerate(self.shard_ports):
+            try:
+                resp = self._shard_request(port, 'GET', '/admin/metrics', None,
+                                           {'X-Admin-Token': self.headers.get('X-Admin-Token', '')},
+                                           self.FORWARD_TIMEOUT)
+                # 先读完响应，连接才能继续复用
+                body = resp.read()
+                if resp.status != 200:
+                    # 管理令牌无效时分片返回404，这里保持一致
+                    self._error_response("未知的API端点", resp.status)
+                    return
+                shards.append(json.loads(body))
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                self._drop_connection(port)
+                shards.append({"success": False, "shard_id": shard_id, "message": str(e)})
+
+        self._json_response({
+            "success": True,
+            "shard_count": len(self.shard_ports),
+            "requests": sum(s.get('metrics', {}).get('requests', 0) for s in shards),
+            "shards": shards
+        })
+
+
+class RouterHTTPServer(ThreadingHTTPServer):
+    """路由器HTTP服务，支持多个路由进程通过 SO_REUSEPORT 共用一个端口"""
+
+    reuse_port = False
+
+    def server_bind(self) -> None:
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def _run_router(port: int, shard_ports: List[int], reuse_port: bool) -> None:
+    """路由进程入口"""
+    ShardRouter.shard_ports = shard_ports
+    RouterHTTPServer.reuse_port = reuse_port
+    httpd = RouterHTTPServer(('', port), ShardRouter)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+def start_shards(shard_count: int, timeout: float = 30.0):
+    """启动分片进程，返回 (进程列表, 按分片号排列的端口列表)"""
+    port_queue = multiprocessing.Queue()
+    processes = []
+    for shard_id in range(shard_count):
+        process = multiprocessing.Process(target=_run_shard, args=(shard_id, shard_count, port_queue),
+                                          name=f"shard-{shard_id}", daemon=True)
+        process.start()
+        processes.append(process)
+
+    ports = [0] * shard_count
+    for _ in range(shard_count):
+        shard_id, port = port_queue.get(timeout=timeout)
+        ports[shard_id] = port
+    return processes, ports
+
+
+def run(shard_count: int, port: int = 8000, router_count: int = 1) -> None:
+    """启动分片和路由器"""
+    if router_count > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+        raise SystemExit("当前平台不支持 SO_REUSEPORT，无法启动多个路由进程")
+
+    processes, shard_ports = start_shards(shard_count)
+    print(f'启动分片服务器，端口 {port}，分片数 {shard_count}，路由进程数 {router_count}')
+    for shard_id, shard_port in enumerate(shard_ports):
+        print(f'  - 分片 {shard_id}: 127.0.0.1:{shard_port}')
+
+    routers = [
+        multiprocessing.Process(target=_run_router, args=(port, shard_ports, router_count > 1),
+                                name=f"router-{i}", daemon=True)
+        for i in range(router_count - 1)
+    ]
+    for router in routers:
+        router.start()
+    try:
+        # 主进程也作为一个路由进程
+        _run_router(port, shard_ports, router_count > 1)
+    finally:
+        print("\n服务器正在关闭...")
+        for process in routers + processes:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="BeeSyncClip 分片模拟服务器")
+    parser.add_argument('--shards', type=int, default=os.cpu_count() or 1, help="分片进程数")
+    parser.add_argument('--port', type=int, default=8000, help="对外端口")
+    parser.add_argument('--routers', type=int, default=1, help="路由进程数（>1 时需要 SO_REUSEPORT）")
+    args = parser.parse_args()
+    run(args.shards, args.port, args.routers)
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+服务端存储的紧凑记录类型与有序索引。
+剪贴板记录和设备记录使用 __slots__ 类代替字典：不再为每条记录重复保存键名，
+时间戳保存为整数，device_id/content_type 等高度重复的字符串做驻留。
+只有在序列化输出时才转换为原有的JSON结构。
+
+剪贴板记录按服务端分配的排序键（毫秒时间戳+序号，单调递增）有序保存，
+接口按顺序直接输出，客户端无需再排序；按时间范围查询只需二分查找。
+
+每条记录可以估算自身占用的字节数（nbytes），UserClips 在增删时增量维护总字节数，
+用于按用户统计内存占用；驻留的共享字符串（device_id、content_type）不计入单条记录。
+
+并发读写：UserClips 的修改由调用方持有该用户的写锁串行执行，读取不加锁。
+读取方先取一个快照（snapshot()，只是一次属性读取），之后只通过快照访问记录：
+追加新记录只写入快照长度之后的位置，其他修改（删除、中间插入、清空）复制出新列表再替换，
+因此快照引用的列表在快照长度以内永远不会改变，序列化期间不受并发写入影响。
+设备列表同理，以元组保存，修改时整体替换（设备记录本身也先复制再修改）。
+"""
+
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right
+from typing import Dict, Any, Iterator, List, Optional, Sequence
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 排序键低位用于同一毫秒内的序号
+ORDER_SEQ_BITS = 12
+# UserClips 中每条记录的索引开销估算：两个列表槽位、字典条目（哈希、键、值）和哈希表槽位，
+# 按列表和字典的预留空间折算。字典的键就是记录保存的打包ID，不另占空间
+_INDEX_ENTRY_BYTES = 2 * 8 + 24 + 8
+
+
+def parse_time(value: Any) -> int:
+    """把 "%Y-%m-%d %H:%M:%S" 格式的本地时间（或数字）转换为epoch秒"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    return int(time.mktime(time.strptime(value, TIME_FORMAT)))
+
+
+def format_time(timestamp: int) -> str:
+    """把epoch秒格式化为接口使用的本地时间字符串"""
+    return time.strftime(TIME_FORMAT, time.localtime(timestamp))
+
+
+def make_order_key(timestamp_ms: int, seq: int = 0) -> int:
+    """由毫秒时间戳和序号组成排序键"""
+    return (timestamp_ms << ORDER_SEQ_BITS) | seq
+
+
+def order_key_ms(order_key: int) -> int:
+    """从排序键取回毫秒时间戳"""
+    return order_key >> ORDER_SEQ_BITS
+
+
+class OrderKeyGenerator:
+    """单调递增的排序键生成器，时钟回拨或同一毫秒内多次调用时按序号递增"""
+
+    def __init__(self):
+        self._last = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> int:
+        key = make_order_key(int(time.time() * 1000))
+        with self._lock:
+            if key <= self._last:
+                key = self._last + 1
+            self._last = key
+        return key
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    """驻留字符串，相同取值的记录共享同一个对象"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _pack_id(value: str) -> Any:
+    """UUID格式的ID保存为16字节，其他格式原样保存"""
+    try:
+        return uuid.UUID(value).bytes
+    except (ValueError, TypeError, AttributeError):
+        return value
+
+
+def _unpack_id(value: Any) -> str:
+    """还原为接口使用的字符串ID"""
+    return str(uuid.UUID(bytes=value)) if isinstance(value, bytes) else value
+
+
+def _optional_size(value: Any) -> int:
+    """可选字段的大小，None 为共享对象，不计入"""
+    return 0 if value is None else sys.getsizeof(value)
+
+
+class ClipRecord:
+    """
+    剪贴板记录。
+    创建时间由排序键推出（不单独保存），last_modified 为epoch秒，未修改过时为None。
+    """
+
+    __slots__ = ('_clip_id', 'content', 'content_type', 'order_key', 'last_modified', 'device_id')
+
+    def __init__(self, clip_id: str, content: str, content_type: str, order_key: int,
+                 device_id: str, last_modified: Optional[int] = None):
+        self.clip_id = clip_id
+        self.content = content
+        self.content_type = _intern(content_type)
+        self.order_key = order_key
+        self.last_modified = None if last_modified == self.created_at else last_modified
+        self.device_id = _intern(device_id)
+
+    @property
+    def clip_id(self) -> str:
+        return _unpack_id(self._clip_id)
+
+    @clip_id.setter
+    def clip_id(self, value: str) -> None:
+        self._clip_id = _pack_id(value)
+
+    @property
+    def created_at(self) -> int:
+        """创建时间（epoch秒）"""
+        return order_key_ms(self.order_key) // 1000
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], seq: int = 0) -> 'ClipRecord':
+        """从接口格式的字典创建记录，排序键由创建时间和序号生成"""
+        return cls(
+            clip_id=data['clip_id'],
+            content=data['content'],
+            content_type=data.get('content_type', 'text/plain'),
+            order_key=make_order_key(parse_time(data['created_at']) * 1000, seq),
+            device_id=data['device_id'],
+            last_modified=parse_time(data.get('last_modified', data['created_at']))
+        )
+
+    def nbytes(self) -> int:
+        """估算记录占用的字节数（含内容、ID和排序键，不含驻留的共享字符串）"""
+        return (sys.getsizeof(self) + sys.getsizeof(self._clip_id) + _optional_size(self.content)
+                + sys.getsizeof(self.order_key) + _optional_size(self.last_modified))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为接口格式的字典"""
+        created_at = format_time(self.created_at)
+        return {
+            "clip_id": self.clip_id,
+            "content": self.content,
+            "content_type": self.content_type,
+            "created_at": created_at,
+            "last_modified": created_at if self.last_modified is None else format_time(self.last_modified),
+            "device_id": self.device_id,
+            "order_key": self.order_key
+        }
+
+
+class ClipsSnapshot:
+    """
+    UserClips 某一时刻的只读视图：记录列表、排序键列表和当时的记录数。
+    列表在 count 以内的部分不会再被修改，读取时不需要加锁。
+    """
+
+    __slots__ = ('_records', '_keys', '_count')
+
+    def __init__(self, records: Sequence[ClipRecord], keys: Sequence[int], count: int):
+        self._records = records
+        self._keys = keys
+        self._count = count
+
+    def range_bounds(self, since: Optional[int] = None, until: Optional[int] = None) -> range:
+        """返回排序键在 (since, until] 范围内的记录下标"""
+        lo = bisect_right(self._keys, since, 0, self._count) if since is not None else 0
+        hi = bisect_right(self._keys, until, 0, self._count) if until is not None else self._count
+        return range(lo, max(lo, hi))
+
+    def key_at(self, index: int) -> int:
+        """下标处记录的排序键"""
+        return self._keys[index]
+
+    def iter_range(self, since: Optional[int] = None, until: Optional[int] = None,
+                   newest_first: bool = False) -> Iterator[ClipRecord]:
+        """按排序键顺序遍历范围内的记录"""
+        records = self._records
+        indexes = self.range_bounds(since, until)
+        for i in (reversed(indexes) if newest_first else indexes):
+            yield records[i]
+
+    def __iter__(self) -> Iterator[ClipRecord]:
+        records = self._records
+        return (records[i] for i in range(self._count))
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class UserClips:
+    """
+    单个用户的剪贴板记录，按排序键升序保存，并按clip_id建立索引。
+    索引以记录中打包后的ID（UUID为16字节）为键，与记录共享同一个对象；
+    查找时同样先打包，因此UUID的大小写、花括号等不同写法都能命中同一条记录。
+    新记录的排序键单调递增，添加只需追加；范围查询通过二分查找定位。
+    nbytes 为所有记录（含索引）估算占用的字节数，在增删时增量维护。
+
+    修改方法需由调用方串行执行（持有该用户的写锁）；读取通过 snapshot() 进行，不需要加锁。
+    """
+
+    def __init__(self, records: Optional[List[ClipRecord]] = None):
+        self._records: List[ClipRecord] = []
+        self._keys: List[int] = []  # 与 _records 对应的排序键，用于二分查找
+        self._index: Dict[Any, ClipRecord] = {}
+        self._snapshot = ClipsSnapshot(self._records, self._keys, 0)
+        self.nbytes = 0
+        for record in records or []:
+            self.add(record)
+
+    def _publish(self, records: List[ClipRecord], keys: List[int]) -> None:
+        """发布新的快照（新列表或追加后的原列表）"""
+        self._records = records
+        self._keys = keys
+        self._snapshot = ClipsSnapshot(records, keys, len(records))
+
+    @staticmethod
+    def _entry_bytes(record: ClipRecord) -> int:
+        """一条记录及其索引项的字节数（索引键与记录共享，已计入记录）"""
+        return record.nbytes() + _INDEX_ENTRY_BYTES
+
+    def snapshot(self) -> ClipsSnapshot:
+        """当前记录的只读快照"""
+        return self._snapshot
+
+    def add(self, record: ClipRecord) -> None:
+        """添加记录（排序键大于现有记录时直接追加，否则复制出插入后的新列表）"""
+        self._index[record._clip_id] = record
+        if not self._keys or record.order_key >= self._keys[-1]:
+            # 追加的位置在所有现有快照的长度之外，不影响正在读取的快照
+            self._records.append(record)
+            self._keys.append(record.order_key)
+            self._publish(self._records, self._keys)
+        else:
+            pos = bisect_right(self._keys, record.order_key)
+            self._publish(self._records[:pos] + [record] + self._records[pos:],
+                          self._keys[:pos] + [record.order_key] + self._keys[pos:])
+        self.nbytes += self._entry_bytes(record)
+
+    def get(self, clip_id: str) -> Optional[ClipRecord]:
+        """按clip_id查找记录"""
+        return self._index.get(_pack_id(clip_id))
+
+    def remove(self, clip_id: str) -> Optional[ClipRecord]:
+        """按clip_id删除记录，返回被删除的记录（复制出删除后的新列表）"""
+        record = self._index.pop(_pack_id(clip_id), None)
+        if record is None:
+            return None
+        pos = bisect_left(self._keys, record.order_key)
+        # 排序键可能重复（导入的历史数据），找到对应的那一条
+        while self._records[pos] is not record:
+            pos += 1
+        self._publish(self._records[:pos] + self._records[pos + 1:], self._keys[:pos] + self._keys[pos + 1:])
+        self.nbytes -= self._entry_bytes(record)
+        return record
+
+    def remove_device(self, device_id: str) -> int:
+        """删除某设备的所有记录，返回删除数量"""
+        kept = []
+        removed = 0
+        for record in self._records:
+            if record.device_id != device_id:
+                kept.append(record)
+            else:
+                removed += 1
+                self.nbytes -= self._entry_bytes(record)
+        if removed:
+            self._index = {r._clip_id: r for r in kept}
+            self._publish(kept, [r.order_key for r in kept])
+        return removed
+
+    def clear(self) -> int:
+        """清空所有记录，返回删除数量"""
+        count = len(self._records)
+        self._index = {}
+        self._publish([], [])
+        self.nbytes = 0
+        return count
+
+    def range_bounds(self, since: Optional[int] = None, until: Optional[int] = None) -> range:
+        """返回排序键在 (since, until] 范围内的记录下标（同时需要遍历记录时应先取快照）"""
+        return self._snapshot.range_bounds(since, until)
+
+    def iter_range(self, since: Optional[int] = None, until: Optional[int] = None,
+                   newest_first: bool = False) -> Iterator[ClipRecord]:
+        """按排序键顺序遍历范围内的记录（遍历的是调用时的快照）"""
+        return self._snapshot.iter_range(since, until, newest_first)
+
+    def __iter__(self) -> Iterator[ClipRecord]:
+        return iter(self._snapshot)
+
+    def __len__(self) -> int:
+        return len(self._snapshot)
+
+
+class DeviceRecord:
+    """设备记录。常用字段保存为属性，登录时上报的其他字段放在 extra 中"""
+
+    __slots__ = ('device_id', 'label', 'os', 'ip_address', 'first_login', 'last_login', 'extra')
+
+    def __init__(self, device_id: str, label: str, first_login: int, last_login: int,
+                 os: Optional[str] = None, ip_address: Optional[str] = None,
+                 extra: Optional[Dict[str, Any]] = None):
+        self.device_id = _intern(device_id)
+        self.label = label
+        self.os = _intern(os)
+        self.ip_address = ip_address
+        self.first_login = first_login
+        self.last_login = last_login
+        self.extra = extra or None  # 没有额外字段时不占用字典
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'DeviceRecord':
+        """从接口格式的字典创建记录"""
+        device = cls(
+            device_id=data['device_id'],
+            label=data.get('label', ''),
+            first_login=parse_time(data['first_login']),
+            last_login=parse_time(data.get('last_login', data['first_login']))
+        )
+        device.update_info(data)
+        return device
+
+    def update_info(self, info: Dict[str, Any]) -> None:
+        """合并客户端上报的设备信息（device_id和登录时间除外）"""
+        for key, value in info.items():
+            if key in ('device_id', 'first_login', 'last_login'):
+                continue
+            if key == 'label':
+                self.label = value
+            elif key == 'os':
+                self.os = _intern(value)
+            elif key == 'ip_address':
+                self.ip_address = value
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[sys.intern(key)] = value
+
+    def copy(self) -> 'DeviceRecord':
+        """复制记录（设备列表可能正在被读取，修改前先复制）"""
+        return DeviceRecord(self.device_id, self.label, self.first_login, self.last_login,
+                            os=self.os, ip_address=self.ip_address, extra=dict(self.extra) if self.extra else None)
+
+    def nbytes(self) -> int:
+        """估算记录占用的字节数（不含驻留的共享字符串）"""
+        size = (sys.getsizeof(self) + _optional_size(self.label) + _optional_size(self.ip_address)
+                + sys.getsizeof(self.first_login) + sys.getsizeof(self.last_login))
+        if self.extra:
+            size += sys.getsizeof(self.extra) + sum(sys.getsizeof(v) for v in self.extra.values())
+        return size
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为接口格式的字典"""
+        result = {
+            "device_id": self.device_id,
+            "label": self.label,
+            "os": self.os,
+            "ip_address": self.ip_address,
+            "first_login": format_time(self.first_login),
+            "last_login": format_time(self.last_login)
+        }
+        if self.os is None:
+            del result["os"]
+        if self.ip_address is None:
+            del result["ip_address"]
+        if self.extra:
+            result.update(self.extra)
+        return result
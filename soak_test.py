@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+长时间浸泡测试：检查内存和延迟是否随运行时间缓慢增长。
+在本进程内启动 MockServer，用 offscreen 的剪贴板页面和设备页面模拟一个登录的客户端，
+按设定的频率持续产生复制、同步、删除记录和其他设备上线/被删除的流量；
+定期采样进程内存（RSS）、Python对象数量、服务端各表的大小、列表行数、服务端处理延迟分位数（不含登录和注册，
+从读到请求行开始计时，不含保持连接的空闲时间）和客户端测得的各操作耗时，
+结束时按预热之后的采样估计增长趋势，内存、对象数、服务端P95延迟或客户端同步P95耗时的增长斜率（每小时）超过阈值时以非零状态退出。
+
+删除会让历史记录数保持在 --history 附近，正常情况下各项指标应趋于平稳；
+默认频率远高于真实使用，运行一小时即相当于数天的正常流量。
+
+用法: python soak_test.py [--duration 3600] [--rate 20] [--sample-interval 30] [--warmup 300]
+                          [--history 200] [--max-rss-slope 20] [--max-objects-slope 50000]
+                          [--max-latency-slope 20] [--output soak.jsonl]
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import statistics
+import string
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from PyQt5 import QtCore
+
+from server_metrics import ServerMetrics
+
+
+def _rss_mb() -> float:
+    """当前进程的常驻内存（MB）。非 Linux 平台取峰值内存"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class WindowMetrics(ServerMetrics):
+    """在累计指标之外保留本采样周期内每个请求的耗时，用于计算分位数"""
+
+    def __init__(self):
+        super().__init__()
+        self._window: Dict[str, List[float]] = defaultdict(list)
+
+    def record(self, endpoint: str, status_code: int, duration_ms: float) -> None:
+        super().record(endpoint, status_code, duration_ms)
+        with self._lock:
+            self._window[endpoint].append(duration_ms)
+
+    def take_window(self) -> Dict[str, List[float]]:
+        """取出并清空本周期的耗时"""
+        with self._lock:
+            window, self._window = self._window, defaultdict(list)
+        return window
+
+
+class SoakClient:
+    """模拟的客户端：一个主设备（使用真实的剪贴板和设备页面）和不断上线、被删除的其他设备"""
+
+    # 各操作的权重
+    WEIGHTS = {'copy': 6, 'sync': 2, 'delete': 4, 'devices': 1, 'churn': 1}
+
+    def __init__(self, base_url: str, history: int):
+        import api_client
+        from page1_clipboard import ClipboardDialog
+        from page2_device import DeviceDialog
+
+        self.api_client = api_client
+        self.base_url = base_url
+        self.history = history
+        self.username = f"soak-{uuid.uuid4().hex[:8]}"
+        self.password = "soak-password"
+        self.device_id = f"soak-main-{uuid.uuid4().hex[:8]}"
+        self.ops = defaultdict(int)
+        self.client_ms: Dict[str, List[float]] = defaultdict(list)
+        self.churn_devices: List[str] = []
+
+        api_client.post(f"{base_url}/register", json={"username": self.username, "password": self.password})
+        result = api_client.parse(self._login(self.device_id))
+        api_client.set_token(result.get("token"))
+
+        self.clipboard_dialog = ClipboardDialog()
+        self.device_dialog = DeviceDialog()
+        self.clipboard_dialog.set_user_info(base_url, self.username, self.device_id, "浸泡测试")
+        self.device_dialog.set_user_info(base_url, self.username, self.device_id)
+
+    def _login(self, device_id: str):
+        return self.api_client.post(f"{self.base_url}/login", json={
+            "username": self.username, "password": self.password,
+            "device_info": {"device_id": device_id, "label": device_id, "os": "soak"}
+        })
+
+    def _timed(self, name: str, func, *args) -> None:
+        start = time.perf_counter()
+        func(*args)
+        self.client_ms[name].append((time.perf_counter() - start) * 1000)
+
+    def step(self) -> None:
+        """执行一个随机操作；历史记录超过目标数量时提高删除的比例"""
+        weights = dict(self.WEIGHTS)
+        if self.clipboard_dialog.ui.listWidget.count() > self.history:
+            weights['delete'] *= 4
+        else:
+            weights['delete'] //= 2
+        op = random.choices(list(weights), list(weights.values()))[0]
+        self.ops[op] += 1
+        getattr(self, f"_op_{op}")()
+
+    def _op_copy(self) -> None:
+        """复制新内容（长度从几个字符到几KB不等）"""
+        length = int(random.paretovariate(1.2) * 20)
+        content = ''.join(random.choices(string.ascii_letters + string.digits + ' ', k=min(length, 8000)))
+        self._timed('copy', self.clipboard_dialog.on_clipboard_content_ready, f"{time.time():.6f} {content}")
+
+    def _op_sync(self) -> None:
+        self._timed('sync', self.clipboard_dialog.load_clipboard_records)
+
+    def _op_delete(self) -> None:
+        """删除一条已上传完成的记录"""
+        dialog = self.clipboard_dialog
+        rows = dialog.ui.listWidget.count()
+        for _ in range(5):
+            if not rows:
+                return
+            item = dialog.ui.listWidget.item(random.randrange(rows))
+            record = item.data(QtCore.Qt.UserRole)
+            if record and record.get("clip_id") not in dialog._pending_uploads:
+                self._timed('delete', dialog.remove_record_item, item)
+                return
+
+    def _op_devices(self) -> None:
+        self._timed('devices', self.device_dialog.load_devices)
+
+    def _op_churn(self) -> None:
+        """其他设备上线并上传一条记录；设备较多时在设备页面删除最早上线的一个"""
+        if len(self.churn_devices) >= 3:
+            device_id = self.churn_devices.pop(0)
+            self.device_dialog.load_devices()
+            lw = self.device_dialog.ui.listWidget
+            for row in range(lw.count()):
+                device = lw.item(row).data(QtCore.Qt.UserRole)
+                if device and device.get("device_id") == device_id:
+                    self._timed('remove_device', self.device_dialog.ui.remove_device_item, lw.item(row))
+                    break
+            return
+        device_id = f"soak-churn-{uuid.uuid4().hex[:8]}"
+        start = time.perf_counter()
+        token = self.api_client.parse(self._login(device_id)).get("token")
+        self.client_ms['churn_login'].append((time.perf_counter() - start) * 1000)
+        if token:
+            self.churn_devices.append(device_id)
+            self.api_client.post(f"{self.base_url}/add_clipboard", json={
+                "clip_id": str(uuid.uuid4()), "content": f"来自 {device_id}", "device_id": device_id
+            }, headers={"Authorization": f"Bearer {token}"})
+
+    def rows(self) -> Dict[str, int]:
+        return {
+            "clipboard_rows": self.clipboard_dialog.ui.listWidget.count(),
+            "device_rows": self.device_dialog.ui.listWidget.count()
+        }
+
+
+def take_sample(elapsed_s: float, client: SoakClient, metrics: WindowMetrics, ui_errors: int) -> Dict[str, Any]:
+    """采集一次内存、对象数、表大小、行数和本周期的延迟分位数"""
+    from mock_server import MockServer
+
+    gc.collect()
+    window = metrics.take_window()
+    # 登录和注册的耗时主要是有意放慢的密码哈希，不计入整体延迟
+    all_ms = [ms for endpoint, values in window.items() if endpoint not in ('/login', '/register') for ms in values]
+    latency = {
+        endpoint: {"count": len(values), "p50_ms": round(_percentile(values, 0.5), 3),
+                   "p95_ms": round(_percentile(values, 0.95), 3), "p99_ms": round(_percentile(values, 0.99), 3)}
+        for endpoint, values in sorted(window.items())
+    }
+    client_ms, client.client_ms = client.client_ms, defaultdict(list)
+    return {
+        "elapsed_s": round(elapsed_s, 1),
+        "ops": sum(client.ops.values()),
+        "rss_mb": round(_rss_mb(), 2),
+        "objects": len(gc.get_objects()),
+        "threads": threading.active_count(),
+        "store": {
+            "users": len(MockServer.users),
+            "sessions": len(MockServer.sessions),
+            "devices": sum(len(devices) for devices in list(MockServer.devices.values())),
+            "clips": sum(len(clips) for clips in list(MockServer.clipboards.values())),
+            "rate_limit_buckets": len(MockServer.device_limiter) + len(MockServer.user_limiter)
+        },
+        "rows": client.rows(),
+        "p95_ms": round(_percentile(all_ms, 0.95), 3),
+        "latency": latency,
+        "client_p95_ms": {name: round(_percentile(values, 0.95), 3) for name, values in sorted(client_ms.items())},
+        "ui_errors": ui_errors
+    }
+
+
+def slope_per_hour(samples: List[Dict[str, Any]], key) -> float:
+    """
+    指标随时间的增长量（每小时）。
+    取所有采样两两之间斜率的中位数（Theil-Sen 估计），个别采样周期的延迟尖峰不会影响结果。
+    """
+    points = [(s['elapsed_s'] / 3600, key(s)) for s in samples]
+    slopes = [(y2 - y1) / (x2 - x1) for i, (x1, y1) in enumerate(points) for x2, y2 in points[i + 1:] if x2 > x1]
+    return statistics.median(slopes) if slopes else 0.0
+
+
+def run(args) -> int:
+    """运行浸泡测试并打印结果，返回进程退出码"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from http.server import ThreadingHTTPServer
+    from PyQt5 import QtWidgets
+    from mock_server import MockServer
+    from rate_limiter import TokenBucketLimiter
+
+    app = QtWidgets.QApplication(sys.argv[:1])
+
+    # 模拟流量远比真实使用频繁，放宽限流（保留桶数上限，桶表的增长仍会被统计）；慢请求不输出
+    metrics = MockServer.metrics = WindowMetrics()
+    MockServer.device_limiter = TokenBucketLimiter(10 ** 6, 10 ** 6, max_buckets=MockServer.RATE_LIMIT_MAX_BUCKETS)
+    MockServer.user_limiter = TokenBucketLimiter(10 ** 6, 10 ** 6, max_buckets=MockServer.RATE_LIMIT_MAX_BUCKETS)
+    MockServer.slow_requests.threshold_ms = 0
+    MockServer.log_message = lambda self, format, *args: None
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), MockServer)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    # 无人值守运行，页面中的提示框改为计数，不弹出模态窗口
+    ui_errors = []
+
+    def record_message(*message_args, **kwargs):
+        ui_errors.append(' '.join(str(a) for a in message_args[1:3]))
+        return QtWidgets.QMessageBox.Yes
+
+    for name in ('information', 'warning', 'critical', 'question'):
+        setattr(QtWidgets.QMessageBox, name, staticmethod(record_message))
+
+    client = SoakClient(f"http://127.0.0.1:{httpd.server_address[1]}", args.history)
+    samples = []
+    started = time.perf_counter()
+
+    def sample():
+        s = take_sample(time.perf_counter() - started, client, metrics, len(ui_errors))
+        samples.append(s)
+        print(f"[{s['elapsed_s']:>7.0f}s] 操作 {s['ops']} | RSS {s['rss_mb']}MB | 对象 {s['objects']} | "
+              f"会话 {s['store']['sessions']} | 记录 {s['store']['clips']} | 列表行 {s['rows']['clipboard_rows']} | "
+              f"P95 {s['p95_ms']}ms | 同步P95 {s['client_p95_ms'].get('sync', 0.0)}ms | 界面错误 {s['ui_errors']}")
+        if args.output:
+            with open(args.output, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(s, ensure_ascii=False) + '\n')
+
+    op_timer = QtCore.QTimer()
+    op_timer.timeout.connect(client.step)
+    op_timer.start(max(1, int(1000 / args.rate)))
+    sample_timer = QtCore.QTimer()
+    sample_timer.timeout.connect(sample)
+    sample_timer.start(int(args.sample_interval * 1000))
+    sample()
+    QtCore.QTimer.singleShot(int(args.duration * 1000), app.quit)
+    app.exec_()
+    op_timer.stop()
+    httpd.shutdown()
+    httpd.server_close()
+
+    steady = [s for s in samples if s['elapsed_s'] >= args.warmup]
+    print(f"\n共执行 {sum(client.ops.values())} 次操作: "
+          + ", ".join(f"{op} {count}" for op, count in sorted(client.ops.items())))
+    if ui_errors:
+        print(f"界面错误 {len(ui_errors)} 次，最近一次: {ui_errors[-1]}")
+    if len(steady) < 3:
+        print(f"预热后的采样只有 {len(steady)} 个，无法判断增长趋势（延长 --duration 或缩短 --sample-interval）")
+        return 1
+
+    checks = [
+        ("RSS (MB/小时)", lambda s: s['rss_mb'], args.max_rss_slope),
+        ("对象数 (个/小时)", lambda s: s['objects'], args.max_objects_slope),
+        ("P95延迟 (ms/小时)", lambda s: s['p95_ms'], args.max_latency_slope),
+        ("客户端同步P95 (ms/小时)", lambda s: s['client_p95_ms'].get('sync', 0.0), args.max_latency_slope),
+        ("会话数 (个/小时)", lambda s: s['store']['sessions'], None),
+        ("设备数 (个/小时)", lambda s: s['store']['devices'], None),
+        ("剪贴板列表行数 (行/小时)", lambda s: s['rows']['clipboard_rows'], None),
+        ("线程数 (个/小时)", lambda s: s['threads'], None),
+    ]
+    failed = []
+    print(f"预热后 {len(steady)} 个采样的增长斜率:")
+    for name, key, limit in checks:
+        slope = slope_per_hour(steady, key)
+        verdict = '' if limit is None else (' 超出阈值' if slope > limit else f' (阈值 {limit})')
+        print(f"  {name}: {slope:+.2f}{verdict}")
+        if limit is not None and slope > limit:
+            failed.append(name)
+
+    if failed:
+        print(f"增长超出阈值: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="BeeSyncClip 浸泡测试")
+    parser.add_argument('--duration', type=float, default=3600, help="运行时长（秒）")
+    parser.add_argument('--rate', type=float, default=20, help="每秒的模拟操作数")
+    parser.add_argument('--sample-interval', type=float, default=30, help="采样间隔（秒）")
+    parser.add_argument('--warmup', type=float, default=None, help="计算斜率时跳过的预热时长（秒），默认为总时长的10%%")
+    parser.add_argument('--history', type=int, default=200, help="保持的剪贴板历史记录数")
+    parser.add_argument('--max-rss-slope', type=float, default=20, help="RSS 增长阈值（MB/小时）")
+    parser.add_argument('--max-objects-slope', type=float, default=50000, help="对象数增长阈值（个/小时）")
+    parser.add_argument('--max-latency-slope', type=float, default=20, help="服务端P95延迟和客户端同步P95耗时的增长阈值（ms/小时）")
+    parser.add_argument('--output', default=None, help="采样结果追加写入的文件（每行一个JSON对象）")
+    args = parser.parse_args()
+    if args.warmup is None:
+        args.warmup = args.duration * 0.1
+    sys.exit(run(args))
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+请求链路追踪。
+设置环境变量 BEESYNC_TRACE_FILE 后启用：客户端为每个请求生成（或沿用当前的）追踪ID，
+通过 W3C traceparent 请求头传给服务器，服务器在同一追踪ID下记录处理、存储、序列化、写出等阶段，
+客户端记录请求、解析、列表更新和绘制等阶段。
+
+所有阶段以 Chrome Trace Event 格式（JSON数组，每个阶段一个 "X" 事件）追加写入同一个文件，
+客户端和服务器在同一台机器上运行时可以写入同一个文件，
+用 chrome://tracing 或 https://ui.perfetto.dev 打开即可按时间线查看；
+事件的 args 中带有 trace_id / span_id / parent_id，可按追踪ID筛选一次请求的全部阶段。
+未设置环境变量时 span() 返回空操作对象，没有额外开销。
+"""
+
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# 追踪文件路径，为空时不启用
+TRACE_FILE = os.environ.get('BEESYNC_TRACE_FILE', '')
+ENABLED = bool(TRACE_FILE)
+
+# 传递追踪上下文的请求头（W3C Trace Context）
+HEADER = 'traceparent'
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_file = None
+_named_threads = set()
+
+
+def _now_us() -> float:
+    """当前时间（微秒，墙上时钟，便于对齐不同进程的事件）"""
+    return time.time_ns() / 1000
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def current_context() -> Optional[Tuple[str, str]]:
+    """当前线程的追踪上下文 (trace_id, span_id)，不在任何阶段内时返回None"""
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def format_traceparent(context: Tuple[str, str]) -> str:
+    """按 W3C traceparent 格式编码: 00-<trace_id>-<span_id>-01"""
+    return f"00-{context[0]}-{context[1]}-01"
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str]]:
+    """解析 traceparent 请求头，格式不正确时返回None"""
+    parts = (header or '').strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1].lower(), parts[2].lower()
+
+
+def _write(event: Dict[str, Any]) -> None:
+    """追加一个事件。文件不存在时先写入数组开头（Chrome 允许省略结尾的 ]）"""
+    global _file
+    with _write_lock:
+        if _file is None:
+            try:
+                fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+                os.write(fd, b'[\n')
+                os.close(fd)
+            except FileExistsError:
+                pass
+            _file = open(TRACE_FILE, 'a', encoding='utf-8')
+            _file.write(json.dumps({"name": "process_name", "ph": "M", "pid": os.getpid(), "tid": 0,
+                                    "args": {"name": os.path.basename(sys.argv[0]) or "python"}}) + ',\n')
+        thread = threading.current_thread()
+        if thread.ident not in _named_threads:
+            _named_threads.add(thread.ident)
+            _file.write(json.dumps({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread.ident,
+                                    "args": {"name": thread.name}}) + ',\n')
+        _file.write(json.dumps(event, ensure_ascii=False, default=str) + ',\n')
+        _file.flush()
+
+
+class Span:
+    """
+    一个计时阶段，作为上下文管理器使用；嵌套的阶段自动继承追踪ID并以外层阶段为父阶段。
+    args 中的字段会写入事件，阶段结束前可以通过 set() 补充。
+    """
+
+    __slots__ = ('name', 'cat', 'trace_id', 'span_id', 'parent_id', 'args', '_start_us', '_t0')
+
+    def __init__(self, name: str, cat: str, parent: Optional[Tuple[str, str]], args: Dict[str, Any]):
+        self.name = name
+        self.cat = cat
+        self.trace_id = parent[0] if parent else secrets.token_hex(16)
+        self.parent_id = parent[1] if parent else None
+        self.span_id = secrets.token_hex(8)
+        self.args = args
+        self._start_us = 0.0
+        self._t0 = 0.0
+
+    @property
+    def context(self) -> Tuple[str, str]:
+        return self.trace_id, self.span_id
+
+    def traceparent(self) -> str:
+        """本阶段作为父阶段时传给下游的请求头值"""
+        return format_traceparent(self.context)
+
+    def set(self, **args: Any) -> None:
+        self.args.update(args)
+
+    def __enter__(self) -> 'Span':
+        _stack().append(self.context)
+        self._start_us = _now_us()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration_us = (time.perf_counter() - self._t0) * 1e6
+        stack = _stack()
+        if stack and stack[-1] == self.context:
+            stack.pop()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        _write({
+            "name": self.name, "cat": self.cat, "ph": "X",
+            "ts": round(self._start_us, 3), "dur": round(duration_us, 3),
+            "pid": os.getpid(), "tid": threading.get_ident(),
+            "args": {"trace_id": self.trace_id, "span_id": self.span_id,
+                     "parent_id": self.parent_id, **self.args}
+        })
+
+
+class _NullSpan:
+    """未启用追踪时使用的空操作阶段"""
+
+    trace_id = span_id = parent_id = None
+    context = None
+
+    def traceparent(self) -> None:
+        return None
+
+    def set(self, **args: Any) -> None:
+        pass
+
+    def __enter__(self) -> '_NullSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, cat: str = 'client', parent: Optional[Tuple[str, str]] = None, **args: Any):
+    """
+    开始一个阶段。parent 为空时以当前线程所在的阶段为父阶段，
+    都没有时开始新的追踪。未启用追踪时返回空操作对象。
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return Span(name, cat, parent or current_context(), args)
+
+
+def server_span(header: Optional[str], name: str, **args: Any):
+    """服务端入口阶段：沿用请求头中的追踪上下文，没有时开始新的追踪"""
+    if not ENABLED:
+        return _NULL_SPAN
+    return Span(name, 'server', parse_traceparent(header), args)
+
+
+def load_events(path: str):
+    """读取追踪文件中的阶段事件（补全可能缺少的数组结尾）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = f.read().rstrip().rstrip(',')
+    if not data.endswith(']'):
+        data += ']'
+    return [e for e in json.loads(data) if e.get('ph') == 'X']
+
+
+def summarize(path: str, limit: int = 20) -> None:
+    """按追踪ID汇总各阶段耗时，输出最慢的若干次请求"""
+    traces: Dict[str, list] = {}
+    for event in load_events(path):
+        traces.setdefault(event['args'].get('trace_id'), []).append(event)
+    ranked = sorted(traces.items(), key=lambda item: -max(e['dur'] for e in item[1]))
+    for trace_id, events in ranked[:limit]:
+        events.sort(key=lambda e: e['ts'])
+        by_id = {e['args']['span_id']: e for e in events}
+        print(f"追踪 {trace_id} 总耗时 {max(e['dur'] for e in events) / 1000:.2f}ms")
+        for event in events:
+            depth = 0
+            parent = event['args'].get('parent_id')
+            while parent in by_id:
+                depth += 1
+                parent = by_id[parent]['args'].get('parent_id')
+            extra = {k: v for k, v in event['args'].items() if k not in ('trace_id', 'span_id', 'parent_id')}
+            print(f"  {'  ' * depth}{event['cat']}/{event['name']}: {event['dur'] / 1000:.3f}ms {extra or ''}")
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="汇总 BeeSyncClip 追踪文件")
+    parser.add_argument('path', nargs='?', default=TRACE_FILE or 'trace.json', help="追踪文件路径")
+    parser.add_argument('--limit', type=int, default=20, help="输出最慢的追踪数量")
+    args = parser.parse_args()
+    summarize(args.path, args.limit)
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+流量重放：把 MockServer 记录的请求（BEESYNC_CAPTURE_FILE，见 server_diagnostics.TrafficCapture）
+按原来的时间间隔重新发送到一个新的服务器，对比各接口的延迟和错误。
+
+默认在本进程内启动一个新的 MockServer，可以同时得到服务端处理耗时，与记录时的服务端耗时直接对比；
+指定 --url 时发送到已运行的服务器，只能报告客户端测得的延迟。
+同一会话（用户+设备）的请求按原顺序依次发送，不同会话并行发送。
+记录中出现的用户会先注册（记录中包含该用户的注册请求时除外），
+会话的第一个请求不是登录时先登录一次，这些准备请求不计入统计。
+
+用法: python traffic_replay.py capture.jsonl [--speed 1] [--url http://127.0.0.1:8000]
+                                             [--no-rate-limit] [--max-regression 20]
+--speed 为时间加速倍数（0 表示不等待，尽快发送）；
+指定 --max-regression 时，任一接口重放的服务端P95延迟比记录时高出该百分比以上即以非零状态退出。
+"""
+
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from server_diagnostics import CAPTURE_VERSION, REPLAY_PASSWORD
+
+PUBLIC_ENDPOINTS = ('/login', '/register')
+
+
+def load_capture(path: str) -> List[Dict[str, Any]]:
+    """读取记录文件，按请求开始时间排序（跳过文件头和无法解析的行）"""
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if 'capture' in entry:
+                if entry['capture'] < CAPTURE_VERSION:
+                    print(f"注意: 记录文件版本为 {entry['capture']}，其中的处理耗时包含保持连接时的空闲时间，"
+                          f"与重放结果的延迟对比不可靠，请用当前版本的服务器重新记录")
+                continue
+            if 'p' not in entry:
+                continue
+            entry['start'] = entry['t'] - entry.get('ms', 0) / 1000
+            entries.append(entry)
+    entries.sort(key=lambda e: e['start'])
+    return entries
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class _ServerRecorder:
+    """
+    代替 TrafficCapture 挂在进程内的 MockServer 上，收集重放时的服务端处理耗时（不写文件）。
+    准备请求（请求体带 replay_setup）不计入。
+    """
+
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def session_key(self, username: Optional[str], device_id: Optional[str]) -> str:
+        return ''
+
+    def record(self, method: str, path: str, session: str, status: int, duration_ms: float,
+               request_bytes: int, response_bytes: int, body: Optional[Dict[str, Any]]) -> None:
+        if body and body.get('replay_setup'):
+            return
+        with self._lock:
+            self.durations[urlparse(path).path].append(duration_ms)
+
+
+def start_local_server(no_rate_limit: bool) -> Tuple[Any, str, _ServerRecorder]:
+    """在本进程内启动一个新的 MockServer，返回 (服务器, 地址, 服务端耗时收集器)"""
+    from http.server import ThreadingHTTPServer
+    from mock_server import MockServer
+    from rate_limiter import TokenBucketLimiter
+
+    recorder = _ServerRecorder()
+    MockServer.capture = recorder
+    MockServer.slow_requests.threshold_ms = 0
+    if no_rate_limit:
+        unlimited = TokenBucketLimiter(10 ** 9, 10 ** 9)
+        MockServer.device_limiter = unlimited
+        MockServer.user_limiter = unlimited
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), MockServer)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, f"http://127.0.0.1:{httpd.server_address[1]}", recorder
+
+
+class Replayer:
+    """按会话分组、按时间间隔重放记录的请求"""
+
+    def __init__(self, base_url: str, entries: List[Dict[str, Any]], speed: float = 1.0, timeout: float = 30):
+        self.base_url = base_url
+        self.entries = entries
+        self.speed = speed
+        self.timeout = timeout
+        self.tokens: Dict[str, str] = {}
+        self.passwords: Dict[str, str] = {}
+        # 每个记录的请求对应的 (重放状态码, 客户端延迟毫秒)
+        self.results: List[Optional[Tuple[int, float]]] = [None] * len(entries)
+
+    @staticmethod
+    def _split_session(session: str) -> Tuple[str, str]:
+        username, _, device_id = (session or '|').partition('|')
+        return username, device_id
+
+    def prepare(self) -> None:
+        """注册记录中出现的用户（记录中第一个请求就是注册的用户除外）"""
+        import requests
+
+        first_seen: Dict[str, str] = {}
+        for entry in self.entries:
+            body = entry.get('b') or {}
+            username = body.get('username') if entry['p'] in PUBLIC_ENDPOINTS else None
+            username = username or self._split_session(entry.get('s'))[0]
+            if not username:
+                continue
+            first_seen.setdefault(username, entry['p'])
+            if entry['p'] in PUBLIC_ENDPOINTS and body.get('password'):
+                self.passwords.setdefault(username, body['password'])
+
+        for username, first_path in first_seen.items():
+            if first_path == '/register':
+                continue
+            requests.post(f"{self.base_url}/register", json={
+                "username": username, "password": self.passwords.get(username, REPLAY_PASSWORD),
+                "replay_setup": True
+            }, timeout=self.timeout)
+
+    def _login(self, http, session: str) -> None:
+        """会话没有登录记录时先登录一次"""
+        username, device_id = self._split_session(session)
+        response = http.post(f"{self.base_url}/login", json={
+            "username": username, "password": self.passwords.get(username, REPLAY_PASSWORD),
+            "device_info": {"device_id": device_id or "replay-device"}, "replay_setup": True
+        }, timeout=self.timeout)
+        token = response.json().get('token') if response.status_code == 200 else None
+        if token:
+            self.tokens[session] = token
+
+    def _worker(self, session: str, jobs: "queue.Queue") -> None:
+        import requests
+
+        http = requests.Session()
+        while True:
+            index = jobs.get()
+            if index is None:
+                return
+            entry = self.entries[index]
+            path = urlparse(entry['p']).path
+            if path not in PUBLIC_ENDPOINTS and session not in self.tokens:
+                self._login(http, session)
+            headers = {'Authorization': f"Bearer {self.tokens[session]}"} if session in self.tokens else {}
+            start = time.perf_counter()
+            try:
+                response = http.request(entry['m'], self.base_url + entry['p'], json=entry.get('b'),
+                                        headers=headers, timeout=self.timeout)
+                response.content  # 读完流式响应
+                status = response.status_code
+            except requests.RequestException:
+                response = None
+                status = 0
+            self.results[index] = (status, (time.perf_counter() - start) * 1000)
+            if path == '/login' and response is not None and status == 200:
+                token = response.json().get('token')
+                if token:
+                    self.tokens[session] = token
+
+    def run(self) -> float:
+        """按记录的时间间隔分发请求，返回重放耗时（秒）"""
+        queues: Dict[str, queue.Queue] = {}
+        threads = []
+        t0 = self.entries[0]['start'] if self.entries else 0
+        started = time.perf_counter()
+        for index, entry in enumerate(self.entries):
+            if self.speed > 0:
+                delay = (entry['start'] - t0) / self.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            session = entry.get('s') or ''
+            jobs = queues.get(session)
+            if jobs is None:
+                jobs = queues[session] = queue.Queue()
+                thread = threading.Thread(target=self._worker, args=(session, jobs), daemon=True)
+                thread.start()
+                threads.append(thread)
+            jobs.put(index)
+        for jobs in queues.values():
+            jobs.put(None)
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+
+def report(entries: List[Dict[str, Any]], results: List[Optional[Tuple[int, float]]],
+           server_ms: Optional[Dict[str, List[float]]]) -> Dict[str, Dict[str, Any]]:
+    """按接口汇总并输出延迟和错误对比，返回汇总结果"""
+    by_endpoint: Dict[str, Dict[str, Any]] = defaultdict(lambda: {
+        'count': 0, 'captured_ms': [], 'client_ms': [], 'captured_errors': 0, 'replay_errors': 0, 'mismatches': 0})
+    for entry, result in zip(entries, results):
+        stats = by_endpoint[urlparse(entry['p']).path]
+        stats['count'] += 1
+        stats['captured_ms'].append(entry.get('ms', 0.0))
+        stats['captured_errors'] += entry.get('st', 0) >= 400
+        status, client_ms = result if result is not None else (0, 0.0)
+        stats['client_ms'].append(client_ms)
+        stats['replay_errors'] += status == 0 or status >= 400
+        stats['mismatches'] += status != entry.get('st')
+
+    print(f"{'接口':<22}{'请求数':>6}{'记录P50':>9}{'记录P95':>9}{'重放P50':>9}{'重放P95':>9}"
+          f"{'P95变化':>9}{'客户端P95':>10}{'记录错误':>8}{'重放错误':>8}{'状态不同':>8}")
+    summary = {}
+    for endpoint, stats in sorted(by_endpoint.items()):
+        replay_ms = (server_ms or {}).get(endpoint, [])
+        captured_p95 = _percentile(stats['captured_ms'], 0.95)
+        replay_p95 = _percentile(replay_ms, 0.95)
+        change = (replay_p95 - captured_p95) / captured_p95 * 100 if captured_p95 and replay_ms else None
+        summary[endpoint] = {
+            'count': stats['count'],
+            'captured_p50_ms': _percentile(stats['captured_ms'], 0.5),
+            'captured_p95_ms': captured_p95,
+            'replay_p50_ms': _percentile(replay_ms, 0.5) if replay_ms else None,
+            'replay_p95_ms': replay_p95 if replay_ms else None,
+            'p95_change_pct': change,
+            'client_p95_ms': _percentile(stats['client_ms'], 0.95),
+            'captured_errors': stats['captured_errors'],
+            'replay_errors': stats['replay_errors'],
+            'status_mismatches': stats['mismatches']
+        }
+        s = summary[endpoint]
+        replay_p50 = f"{s['replay_p50_ms']:.2f}" if replay_ms else '-'
+        replay_p95 = f"{s['replay_p95_ms']:.2f}" if replay_ms else '-'
+        change_text = f"{change:+.0f}%" if change is not None else '-'
+        print(f"{endpoint:<24}{s['count']:>8}{s['captured_p50_ms']:>11.2f}{s['captured_p95_ms']:>11.2f}"
+              f"{replay_p50:>11}{replay_p95:>11}{change_text:>10}{s['client_p95_ms']:>13.2f}"
+              f"{s['captured_errors']:>12}{s['replay_errors']:>12}{s['status_mismatches']:>12}")
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="BeeSyncClip 流量重放")
+    parser.add_argument('capture', help="流量记录文件（BEESYNC_CAPTURE_FILE）")
+    parser.add_argument('--speed', type=float, default=1.0, help="时间加速倍数，0 表示尽快发送")
+    parser.add_argument('--url', default=None, help="发送到已运行的服务器（默认在本进程内启动新的服务器）")
+    parser.add_argument('--no-rate-limit', action='store_true', help="关闭本进程内服务器的限流")
+    parser.add_argument('--max-regression', type=float, default=None,
+                        help="允许的服务端P95延迟增幅（百分比），超出时以非零状态退出")
+    args = parser.parse_args()
+
+    entries = load_capture(args.capture)
+    if not entries:
+        print("记录文件中没有请求")
+        return 1
+    duration = entries[-1]['t'] - entries[0]['start']
+    print(f"读取 {len(entries)} 个请求，记录时长 {duration:.1f}s，"
+          f"{len({e.get('s') for e in entries})} 个会话，速度 {args.speed or '不限'}x")
+
+    httpd = recorder = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        httpd, base_url, recorder = start_local_server(args.no_rate_limit)
+
+    replayer = Replayer(base_url, entries, args.speed)
+    replayer.prepare()
+    elapsed = replayer.run()
+    print(f"重放完成，耗时 {elapsed:.1f}s")
+    summary = report(entries, replayer.results, recorder.durations if recorder else None)
+    if httpd is not None:
+        httpd.shutdown()
+        httpd.server_close()
+
+    if args.max_regression is not None:
+        regressed = [endpoint for endpoint, s in summary.items()
+                     if s['p95_change_pct'] is not None and s['p95_change_pct'] > args.max_regression]
+        if regressed:
+            print(f"P95延迟增幅超过 {args.max_regression}% 的接口: {', '.join(regressed)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+界面卡顿检测与热点函数性能分析（均为可选，默认关闭）。
+
+卡顿检测：设置环境变量 BEESYNC_UI_WATCHDOG=<阈值毫秒>（设为1时使用默认阈值）后，
+主线程上的心跳定时器定期更新时间戳，后台线程检查心跳是否超时；
+主线程超过阈值没有响应时输出当时主线程的调用栈，恢复后输出卡顿时长。
+心跳的延迟（实际间隔减去预期间隔）也会被统计，退出时输出延迟分位数和卡顿次数。
+
+性能分析：设置环境变量 BEESYNC_PROFILE=<目录> 后，用 @profiled 标记的函数每次调用都会计时，
+并用 cProfile 采集调用详情，退出时输出各函数的调用次数和耗时，
+cProfile 结果保存为 <目录>/<函数名>.prof（可用 snakeviz 或 pstats 查看）。
+"""
+
+import atexit
+import cProfile
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from PyQt5 import QtCore
+
+# 卡顿阈值（毫秒），0 表示不启用；设为1或无法解析的值时使用默认阈值
+DEFAULT_STALL_THRESHOLD_MS = 250
+_watchdog_env = os.environ.get('BEESYNC_UI_WATCHDOG', '').strip()
+if not _watchdog_env or _watchdog_env == '0':
+    STALL_THRESHOLD_MS = 0
+elif _watchdog_env == '1':
+    STALL_THRESHOLD_MS = DEFAULT_STALL_THRESHOLD_MS
+else:
+    try:
+        STALL_THRESHOLD_MS = max(0, int(_watchdog_env))
+    except ValueError:
+        STALL_THRESHOLD_MS = DEFAULT_STALL_THRESHOLD_MS
+# 性能分析结果目录，为空时不启用
+PROFILE_DIR = os.environ.get('BEESYNC_PROFILE', '')
+
+
+def _percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class UIWatchdog(QtCore.QObject):
+    """
+    主线程响应性监测。
+
+    threshold_ms: 心跳超过该时间未更新即视为卡顿
+    heartbeat_ms: 主线程心跳间隔
+    log: 输出函数，默认为 print
+    """
+
+    def __init__(self, threshold_ms: int = 250, heartbeat_ms: int = 50,
+                 log: Callable[[str], None] = print, parent: Optional[QtCore.QObject] = None):
+        super().__init__(parent)
+        self.threshold_ms = threshold_ms
+        self.heartbeat_ms = heartbeat_ms
+        self.log = log
+        self.stalls = 0
+        self.max_stall_ms = 0.0
+        self.total_stall_ms = 0.0
+        self.lags_ms = deque(maxlen=10000)  # 最近的心跳延迟
+
+        self._main_ident = threading.main_thread().ident
+        self._last_beat = time.perf_counter()
+        self._stall_reported = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._timer = QtCore.QTimer(self)
+        self._timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self._timer.timeout.connect(self._beat)
+
+    def start(self) -> None:
+        """开始监测（需在主线程调用）"""
+        if self._thread is not None:
+            return
+        self._last_beat = time.perf_counter()
+        self._timer.start(self.heartbeat_ms)
+        self._thread = threading.Thread(target=self._watch, name="ui-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._timer.stop()
+        self._stop.set()
+
+    def _beat(self) -> None:
+        """主线程心跳：记录延迟，卡顿结束时输出时长"""
+        now = time.perf_counter()
+        elapsed_ms = (now - self._last_beat) * 1000
+        self._last_beat = now
+        self.lags_ms.append(max(0.0, elapsed_ms - self.heartbeat_ms))
+        if elapsed_ms >= self.threshold_ms:
+            self.stalls += 1
+            self.total_stall_ms += elapsed_ms
+            self.max_stall_ms = max(self.max_stall_ms, elapsed_ms)
+            self.log(f"[卡顿] 主线程无响应 {elapsed_ms:.0f}ms")
+        self._stall_reported = False
+
+    def _watch(self) -> None:
+        """后台线程：心跳超时时输出主线程的调用栈（每次卡顿只输出一次）"""
+        interval = self.threshold_ms / 1000 / 2
+        while not self._stop.wait(interval):
+            stalled_ms = (time.perf_counter() - self._last_beat) * 1000
+            if stalled_ms < self.threshold_ms or self._stall_reported:
+                continue
+            self._stall_reported = True
+            frame = sys._current_frames().get(self._main_ident)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else '（无法获取调用栈）\n'
+            self.log(f"[卡顿] 主线程已 {stalled_ms:.0f}ms 无响应，当前调用栈:\n{stack}")
+
+    def stats(self) -> Dict[str, Any]:
+        """心跳延迟分位数和卡顿统计（毫秒）"""
+        lags = sorted(self.lags_ms)
+        return {
+            'beats': len(lags),
+            'lag_p50_ms': round(_percentile(lags, 0.50), 1),
+            'lag_p99_ms': round(_percentile(lags, 0.99), 1),
+            'lag_max_ms': round(lags[-1], 1) if lags else 0.0,
+            'stalls': self.stalls,
+            'stall_max_ms': round(self.max_stall_ms, 1),
+            'stall_total_ms': round(self.total_stall_ms, 1)
+        }
+
+    def report(self) -> None:
+        stats = self.stats()
+        self.log("[卡顿] 统计: " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+
+
+class _ProfileStats:
+    """一个函数的调用计时和 cProfile 结果"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.profile = cProfile.Profile()
+
+
+_profile_stats: Dict[str, _ProfileStats] = {}
+# cProfile 不能嵌套启用（如同步时处理事件又触发了其他被标记的函数），嵌套调用只计时
+_profiling_active = threading.local()
+
+
+def profiled(name: Optional[str] = None):
+    """
+    标记需要性能分析的函数。未设置 BEESYNC_PROFILE 时直接返回原函数，没有额外开销。
+    包装后仍按原函数的参数个数截断多余的位置参数，PyQt 信号（如 clicked(bool)）可以照常连接。
+    """
+    def decorator(func):
+        if not PROFILE_DIR:
+            return func
+        label = name or func.__qualname__
+        params = inspect.signature(func).parameters.values()
+        max_args = None if any(p.kind == p.VAR_POSITIONAL for p in params) else sum(
+            1 for p in params if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if max_args is not None:
+                args = args[:max_args]
+            stats = _profile_stats.get(label)
+            if stats is None:
+                stats = _profile_stats.setdefault(label, _ProfileStats(label))
+            outermost = threading.current_thread() is threading.main_thread() and \
+                not getattr(_profiling_active, 'value', False)
+            start = time.perf_counter()
+            try:
+                if outermost:
+                    _profiling_active.value = True
+                    stats.profile.enable()
+                    try:
+                        return func(*args, **kwargs)
+                    finally:
+                        stats.profile.disable()
+                        _profiling_active.value = False
+                return func(*args, **kwargs)
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                stats.calls += 1
+                stats.total_ms += elapsed_ms
+                stats.max_ms = max(stats.max_ms, elapsed_ms)
+
+        return wrapper
+    return decorator
+
+
+def profile_report() -> None:
+    """输出各函数的调用次数和耗时，并保存 cProfile 结果"""
+    if not _profile_stats:
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    print(f"[性能分析] {'函数':<44} {'调用次数':>6} {'平均ms':>7} {'最大ms':>7}")
+    for stats in sorted(_profile_stats.values(), key=lambda s: -s.total_ms):
+        avg_ms = stats.total_ms / stats.calls if stats.calls else 0.0
+        print(f"[性能分析] {stats.name:<46} {stats.calls:>8} {avg_ms:>9.2f} {stats.max_ms:>9.2f}")
+        path = os.path.join(PROFILE_DIR, f"{stats.name}.prof")
+        try:
+            stats.profile.dump_stats(path)
+        except (OSError, TypeError) as e:
+            print(f"[性能分析] 保存 {path} 失败: {e}")
+
+
+_watchdog: Optional[UIWatchdog] = None
+_installed = False
+
+
+def install() -> Optional[UIWatchdog]:
+    """按环境变量启用卡顿检测和性能分析报告（应用启动时在主线程调用，重复调用无效）"""
+    global _watchdog, _installed
+    if _installed:
+        return _watchdog
+    _installed = True
+    if STALL_THRESHOLD_MS:
+        _watchdog = UIWatchdog(threshold_ms=STALL_THRESHOLD_MS,
+                               heartbeat_ms=max(10, min(50, STALL_THRESHOLD_MS // 2)))
+        _watchdog.start()
+        atexit.register(_watchdog.report)
+    if PROFILE_DIR:
+        atexit.register(profile_report)
+    return _watchdog
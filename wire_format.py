@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+接口的数据编码与内容协商。
+默认使用JSON；客户端在 Accept / Content-Type 中声明 MessagePack 或 CBOR 时改用二进制编码，
+字符串以长度前缀加原始UTF-8字节保存，大段剪贴板内容无需转义，编解码也更快。
+MessagePack（msgpack）和 CBOR（cbor2）都是可选依赖，未安装时只支持JSON。
+
+列表接口的流式输出有两种形式：
+- 单个对象：与非流式响应结构相同（{...头部字段, 列表名: [记录...]}）
+- 序列：头部对象之后每条记录一个独立对象，客户端可以边接收边解析
+  （JSON为 application/x-ndjson，MessagePack为 application/x-msgpack-seq，CBOR为 application/cbor-seq）
+"""
+
+import json
+import struct
+from typing import Any, Dict, Generator, Iterable, Iterator, List, Optional
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+CBOR = 'application/cbor'
+NDJSON = 'application/x-ndjson'
+MSGPACK_SEQ = 'application/x-msgpack-seq'
+CBOR_SEQ = 'application/cbor-seq'
+
+# 别名 -> 规范名称
+_ALIASES = {
+    'application/x-msgpack': MSGPACK,
+    'application/vnd.msgpack': MSGPACK,
+}
+# 序列类型 -> 对应的单对象编码
+SEQUENCE_TYPES = {NDJSON: JSON, MSGPACK_SEQ: MSGPACK, CBOR_SEQ: CBOR}
+
+
+def _normalize(media_type: str) -> str:
+    media_type = media_type.split(';', 1)[0].strip().lower()
+    return _ALIASES.get(media_type, media_type)
+
+
+def is_supported(content_type: Optional[str]) -> bool:
+    """请求体的编码是否受支持（未声明时按JSON处理）"""
+    media_type = _normalize(content_type or JSON)
+    media_type = SEQUENCE_TYPES.get(media_type, media_type)
+    if media_type == MSGPACK:
+        return msgpack is not None
+    if media_type == CBOR:
+        return cbor2 is not None
+    return media_type in (JSON, 'text/plain', '')
+
+
+def _parse_accept(accept: str) -> List[str]:
+    """按q值从高到低排列 Accept 中的类型（q相同时保持原顺序）"""
+    entries = []
+    for i, part in enumerate(accept.split(',')):
+        if not part.strip():
+            continue
+        q = 1.0
+        for param in part.split(';')[1:]:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            entries.append((-q, i, _normalize(part)))
+    return [media_type for _, _, media_type in sorted(entries)]
+
+
+def negotiate(accept: Optional[str], streaming: bool = False) -> str:
+    """
+    根据 Accept 选择响应编码，没有可用的二进制编码时返回JSON。
+    streaming 为True时也可以返回序列类型。
+    """
+    for media_type in _parse_accept(accept or ''):
+        if media_type in SEQUENCE_TYPES:
+            if streaming and is_supported(media_type):
+                return media_type
+            continue
+        if media_type in (MSGPACK, CBOR) and is_supported(media_type):
+            return media_type
+        if media_type in (JSON, '*/*', 'application/*'):
+            return JSON
+    return JSON
+
+
+def encode(obj: Any, content_type: str = JSON) -> bytes:
+    """按指定编码序列化"""
+    content_type = SEQUENCE_TYPES.get(content_type, content_type)
+    if content_type == MSGPACK:
+        return msgpack.packb(obj, use_bin_type=True)
+    if content_type == CBOR:
+        return cbor2.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+
+def decode(data: bytes, content_type: Optional[str] = None) -> Any:
+    """按 Content-Type 反序列化，格式错误时抛出 ValueError"""
+    content_type = _normalize(content_type or JSON)
+    content_type = SEQUENCE_TYPES.get(content_type, content_type)
+    try:
+        if content_type == MSGPACK:
+            return msgpack.unpackb(data, raw=False)
+        if content_type == CBOR:
+            return cbor2.loads(data)
+        return json.loads(data)
+    except ValueError:
+        raise
+    except Exception as e:
+        # msgpack/cbor2 的解码异常类型不统一，统一转换为 ValueError
+        raise ValueError(str(e))
+
+
+def _cbor_head(major: int, length: int) -> bytes:
+    """CBOR数据项的头部（主类型+长度）"""
+    if length < 24:
+        return bytes([major << 5 | length])
+    if length < 0x100:
+        return bytes([major << 5 | 24, length])
+    if length < 0x10000:
+        return bytes([major << 5 | 25]) + struct.pack('>H', length)
+    if length < 0x100000000:
+        return bytes([major << 5 | 26]) + struct.pack('>I', length)
+    return bytes([major << 5 | 27]) + struct.pack('>Q', length)
+
+
+def list_prefix(header: Dict[str, Any], list_key: str, count: int, content_type: str) -> bytes:
+    """
+    单对象形式的列表响应中，记录之前的部分（头部字段和列表开头）。
+    MessagePack 的数组需要预先写出长度，写出的记录数必须与 count 一致。
+    """
+    if content_type == MSGPACK:
+        packer = msgpack.Packer(use_bin_type=True)
+        data = packer.pack_map_header(len(header) + 1)
+        for key, value in header.items():
+            data += packer.pack(key) + packer.pack(value)
+        return data + packer.pack(list_key) + packer.pack_array_header(count)
+    if content_type == CBOR:
+        data = _cbor_head(5, len(header) + 1)
+        for key, value in header.items():
+            data += cbor2.dumps(key) + cbor2.dumps(value)
+        # 不定长数组，以 0xff 结束
+        return data + cbor2.dumps(list_key) + b'\x9f'
+    # 去掉头部对象的右括号，接着写入列表
+    return f'{json.dumps(header)[:-1]}, "{list_key}": ['.encode('utf-8')
+
+
+def list_separator(content_type: str) -> bytes:
+    """单对象形式中记录之间的分隔"""
+    return b', ' if content_type == JSON else b''
+
+
+def list_suffix(content_type: str) -> bytes:
+    """单对象形式中最后一条记录之后的部分"""
+    if content_type == MSGPACK:
+        return b''
+    if content_type == CBOR:
+        return b'\xff'
+    return b']}'
+
+
+def sequence_item(obj: Any, content_type: str) -> bytes:
+    """序列形式中的一个对象"""
+    if content_type == NDJSON:
+        return json.dumps(obj).encode('utf-8') + b'\n'
+    return encode(obj, content_type)
+
+
+def iter_sequence(chunks: Iterable[bytes], content_type: str) -> Iterator[Any]:
+    """
+    从分块数据中逐个解析序列形式的对象（单对象形式的响应按只有一个对象的序列处理）。
+    缓冲区只在每块末尾丢弃一次已解析的部分，总耗时与响应大小成线性关系：
+    NDJSON 只在新收到的数据中查找换行；CBOR 对象不完整时，等缓冲区增长一倍后才重新尝试解码。
+    """
+    content_type = _normalize(content_type)
+    if content_type in (MSGPACK_SEQ, MSGPACK):
+        unpacker = msgpack.Unpacker(raw=False)
+        for chunk in chunks:
+            unpacker.feed(chunk)
+            yield from unpacker
+        return
+    if content_type in (CBOR_SEQ, CBOR):
+        buffer = bytearray()
+        retry_at = 0  # 缓冲区达到这个长度前不重新尝试解码不完整的对象
+        for chunk in chunks:
+            buffer += chunk
+            if len(buffer) < retry_at:
+                continue
+            consumed = yield from _decode_cbor_items(buffer)
+            del buffer[:consumed]
+            retry_at = 2 * len(buffer)
+        if buffer:
+            yield from _decode_cbor_items(buffer)
+        return
+    buffer = bytearray()
+    for chunk in chunks:
+        scan_from = len(buffer)  # 之前的数据中已确认没有换行
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b'\n', scan_from)
+            if end < 0:
+                break
+            line = buffer[start:end]
+            if line.strip():
+                yield json.loads(line)
+            start = scan_from = end + 1
+        if start:
+            del buffer[:start]
+    if buffer.strip():
+        yield json.loads(buffer)
+
+
+def _decode_cbor_items(buffer: bytearray) -> Generator[Any, None, int]:
+    """依次解码缓冲区中完整的CBOR对象，返回已解码部分的字节数"""
+    reader = _BufferReader(buffer)
+    while reader.position < len(buffer):
+        start = reader.position
+        try:
+            obj = cbor2.CBORDecoder(reader).decode()
+        except (EOFError, cbor2.CBORDecodeEOF):
+            # 对象还没有接收完整（cbor2 5.x 的 CBORDecodeEOF 是 EOFError 的子类，6.x 起不再是）
+            return start
+        yield obj
+    return reader.position
+
+
+class _BufferReader:
+    """
+    供 cbor2 解码器读取的只读缓冲区，记录已读取的位置。
+    声明为不可定位（seekable 为False），cbor2 只读取解码所需的字节，不会预读越过当前对象。
+    """
+
+    def __init__(self, buffer: bytearray):
+        self.buffer = buffer
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self.buffer) if size < 0 else self.position + size
+        data = bytes(self.buffer[self.position:end])
+        self.position += len(data)
+        return data